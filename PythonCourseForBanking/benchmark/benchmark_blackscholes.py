@@ -0,0 +1,47 @@
+import time
+
+import numpy as np
+
+from PythonCourseForBanking.pricing.blackscholes import BlackScholesPricer, BlackScholesBatchPricer
+
+
+def make_option_book(nb_options, seed=0):
+    random_state = np.random.RandomState(seed)
+    return {'underlying_price': random_state.uniform(50, 150, nb_options),
+            'strike_price': random_state.uniform(50, 150, nb_options),
+            'rate': random_state.uniform(0, 0.05, nb_options),
+            'time_to_maturity': random_state.uniform(0.1, 5, nb_options),
+            'volatility': random_state.uniform(0.1, 0.6, nb_options),
+            'call_put': random_state.choice(['call', 'put'], nb_options)}
+
+
+def time_scalar_loop(book):
+    start = time.perf_counter()
+    for i in range(len(book['call_put'])):
+        BlackScholesPricer(underlying_price=book['underlying_price'][i],
+                           strike_price=book['strike_price'][i],
+                           rate=book['rate'][i],
+                           time_to_maturity=book['time_to_maturity'][i],
+                           volatility=book['volatility'][i],
+                           call_put=book['call_put'][i])
+    return time.perf_counter() - start
+
+
+def time_batch(book):
+    start = time.perf_counter()
+    BlackScholesBatchPricer(**book)
+    return time.perf_counter() - start
+
+
+def run(nb_options_loop=10000, nb_options_batch=1000000):
+    # the per-object loop is timed on a smaller book and scaled, it would take minutes on 10^6 options
+    loop_per_option = time_scalar_loop(make_option_book(nb_options_loop)) / nb_options_loop
+    batch_per_option = time_batch(make_option_book(nb_options_batch)) / nb_options_batch
+    print('scalar loop : %.3f us per option' % (loop_per_option * 1e6))
+    print('batch       : %.3f us per option (%d options)' % (batch_per_option * 1e6, nb_options_batch))
+    print('speedup     : x%.0f' % (loop_per_option / batch_per_option))
+    return {'loop_per_option': loop_per_option, 'batch_per_option': batch_per_option}
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,41 @@
+import time
+
+import numpy as np
+
+from PythonCourseForBanking.pricing.bonds import BondPricer, BondBatchPricer
+
+
+def make_bond_book(nb_bonds, seed=0):
+    random_state = np.random.RandomState(seed)
+    return {'par_value': random_state.choice([100., 1000.], nb_bonds),
+            'annual_discount_rate': random_state.uniform(0, 0.06, nb_bonds),
+            'annual_coupon_rate': random_state.uniform(0, 0.06, nb_bonds),
+            'maturity': random_state.randint(1, 31, nb_bonds).astype(float),
+            'coupon_periodicity': random_state.choice(['no_coupon', 'monthly', 'quarterly', 'semi_annual', 'annual'],
+                                                      nb_bonds)}
+
+
+def time_scalar_loop(book):
+    start = time.perf_counter()
+    for i in range(len(book['par_value'])):
+        BondPricer(**{column: values[i] for column, values in book.items()})
+    return time.perf_counter() - start
+
+
+def time_batch(book):
+    start = time.perf_counter()
+    BondBatchPricer(**book)
+    return time.perf_counter() - start
+
+
+def run(nb_bonds_loop=2000, nb_bonds_batch=100000):
+    loop_per_bond = time_scalar_loop(make_bond_book(nb_bonds_loop)) / nb_bonds_loop
+    batch_per_bond = time_batch(make_bond_book(nb_bonds_batch)) / nb_bonds_batch
+    print('scalar loop : %.2f us per bond' % (loop_per_bond * 1e6))
+    print('batch       : %.2f us per bond (%d bonds)' % (batch_per_bond * 1e6, nb_bonds_batch))
+    print('speedup     : x%.0f' % (loop_per_bond / batch_per_bond))
+    return {'loop_per_bond': loop_per_bond, 'batch_per_bond': batch_per_bond}
+
+
+if __name__ == '__main__':
+    run()
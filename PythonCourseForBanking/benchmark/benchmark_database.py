@@ -0,0 +1,70 @@
+import datetime
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from PythonCourseForBanking.database.database import DatabaseManagement, Deal
+
+
+def make_deals(nb_deals, seed=0):
+    random_state = np.random.RandomState(seed)
+    return pd.DataFrame({'date': pd.Timestamp(datetime.date.today()) -
+                         pd.to_timedelta(random_state.randint(0, 365, nb_deals), unit='D'),
+                         'type': random_state.choice(['Action', 'Bond', 'Option'], nb_deals),
+                         'quantity': random_state.randint(1, 10000, nb_deals).astype(float),
+                         'isin': ['XS%010d' % i for i in range(nb_deals)],
+                         'price': random_state.uniform(1, 1000, nb_deals)})
+
+
+def make_sqlite_database(directory):
+    path = os.path.join(directory, 'deals.db')
+    return DatabaseManagement(server=None, database=path, echo=False, connection_string='sqlite:///' + path)
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    function(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def orm_insert(db_mgmt, deals):
+    db_mgmt.session.add_all([Deal(**deal) for deal in deals.to_dict(orient='records')])
+    db_mgmt.session.commit()
+
+
+def orm_delete(db_mgmt):
+    [db_mgmt.session.delete(x) for x in db_mgmt.session.query(Deal).all()]
+    db_mgmt.session.commit()
+
+
+def run(nb_deals_orm=20000, nb_deals_bulk=200000):
+    with tempfile.TemporaryDirectory() as directory:
+        db_mgmt = make_sqlite_database(directory)
+        deals = make_deals(nb_deals_orm)
+        timings = {'orm_insert': timed(orm_insert, db_mgmt, deals) / nb_deals_orm,
+                   'orm_delete': timed(orm_delete, db_mgmt) / nb_deals_orm}
+
+        deals = make_deals(nb_deals_bulk)
+        timings['bulk_insert'] = timed(db_mgmt.bulk_insert_deals, deals) / nb_deals_bulk
+        # the upsert is keyed on the id, the stored deals are read back in insertion order to get theirs
+        deals['id'] = np.concatenate([columns['id'] for columns in db_mgmt.stream_deals(output='columns')])
+        updated_deals = deals.iloc[::2].assign(price=deals['price'].iloc[::2] * 1.01)
+        new_deals = make_deals(nb_deals_bulk // 2, seed=1)
+        timings['bulk_upsert'] = timed(db_mgmt.bulk_upsert_deals, pd.concat([updated_deals, new_deals])) / nb_deals_bulk
+        timings['truncate'] = timed(db_mgmt.truncate_deals) / (nb_deals_bulk * 3 // 2)
+        metrics = db_mgmt.metrics()
+        db_mgmt.engine.dispose()
+
+    for name, per_deal in timings.items():
+        print('%-12s: %.2f us per deal' % (name, per_deal * 1e6))
+    print('startup     : %.1f ms, %d connections opened, peak %d checked out' % (
+        metrics['startup_time'] * 1e3, metrics['connections'], metrics['peak_checked_out']))
+    timings['startup'] = metrics['startup_time']
+    return timings
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,53 @@
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from PythonCourseForBanking.benchmark.benchmark_database import make_deals, make_sqlite_database
+from PythonCourseForBanking.database.database import Deal
+
+
+def make_fixture(db_mgmt, nb_deals, chunk_size=500000):
+    for start in range(0, nb_deals, chunk_size):
+        deals = make_deals(min(chunk_size, nb_deals - start), seed=start)
+        deals['isin'] = ['XS%010d' % i for i in range(start, start + len(deals))]
+        db_mgmt.bulk_insert_deals(deals)
+
+
+def measure(read):
+    # rows read per second, then the peak of the Python allocations in a second traced pass (tracing is slow)
+    start = time.perf_counter()
+    nb_rows = read()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    read()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return nb_rows / elapsed, peak
+
+
+def read_orm(db_mgmt):
+    with db_mgmt.session_scope() as session:
+        return len(session.query(Deal).all())
+
+
+def read_stream(db_mgmt, output):
+    return sum(len(chunk['id']) if output == 'columns' else len(chunk)
+               for chunk in db_mgmt.stream_deals(chunk_size=50000, output=output))
+
+
+def run(nb_deals=2000000):
+    with tempfile.TemporaryDirectory() as directory:
+        db_mgmt = make_sqlite_database(directory)
+        make_fixture(db_mgmt, nb_deals)
+        results = {'orm_all': measure(lambda: read_orm(db_mgmt)),
+                   'stream_records': measure(lambda: read_stream(db_mgmt, 'records')),
+                   'stream_columns': measure(lambda: read_stream(db_mgmt, 'columns'))}
+        db_mgmt.engine.dispose()
+    for name, (rows_per_second, peak) in results.items():
+        print('%-15s: %9.0f rows/s, peak memory %7.1f MB' % (name, rows_per_second, peak / 1e6))
+    return results
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 2000000)
@@ -0,0 +1,41 @@
+import time
+
+import numpy as np
+
+from PythonCourseForBanking.pricing.blackscholes import BlackScholesBatchPricer
+from PythonCourseForBanking.pricing.implied_volatility import ImpliedVolatilitySolver
+
+
+def make_option_chain(nb_strikes=200, nb_maturities=10, underlying_price=100., seed=0):
+    # one chain: every strike for every listed maturity, quoted at a smile around 25% of volatility
+    random_state = np.random.RandomState(seed)
+    strike_price, time_to_maturity = np.meshgrid(np.linspace(50, 150, nb_strikes),
+                                                 np.linspace(0.1, 3, nb_maturities))
+    strike_price, time_to_maturity = strike_price.ravel(), time_to_maturity.ravel()
+    volatility = 0.25 + 0.2 * np.log(strike_price / underlying_price) ** 2 + random_state.uniform(0, 0.01,
+                                                                                                 strike_price.size)
+    call_put = np.where(strike_price >= underlying_price, 'call', 'put')
+    option_price = BlackScholesBatchPricer(underlying_price=underlying_price, strike_price=strike_price, rate=0.02,
+                                           time_to_maturity=time_to_maturity, volatility=volatility,
+                                           call_put=call_put).option_price
+    return {'option_price': option_price, 'underlying_price': underlying_price, 'strike_price': strike_price,
+            'rate': 0.02, 'time_to_maturity': time_to_maturity, 'call_put': call_put}, volatility
+
+
+def run(nb_chains=50):
+    chain, volatility = make_option_chain()
+    start = time.perf_counter()
+    for _ in range(nb_chains):
+        solver = ImpliedVolatilitySolver(**chain)
+    elapsed = time.perf_counter() - start
+    print('chain of %d options : %.1f chains/s, %.0f options/s' % (len(solver), nb_chains / elapsed,
+                                                                   nb_chains * len(solver) / elapsed))
+    # options worth next to nothing have no meaningful implied volatility, they are left out of the accuracy check
+    priced = chain['option_price'] > 1e-6
+    print('max error            : %.2e, max iterations %d' % (np.abs(solver.volatility - volatility)[priced].max(),
+                                                              solver.iterations.max()))
+    return {'chain_per_second': nb_chains / elapsed}
+
+
+if __name__ == '__main__':
+    run()
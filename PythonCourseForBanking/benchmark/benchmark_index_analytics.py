@@ -0,0 +1,84 @@
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from PythonCourseForBanking.yahoofinance.index_analytics import IndexUniverse
+
+SECTORS = ['energy', 'materials', 'industrials', 'consumer_discretionary', 'consumer_staples', 'health_care',
+           'financials', 'information_technology', 'communication_services', 'utilities', 'real_estate']
+
+
+def make_universe(nb_tickers, nb_indexes=10, index_size=500, seed=0):
+    # nb_indexes indexes of index_size constituents drawn from nb_tickers tickers, so the larger names are listed
+    # in several of them, and the quotes as strings as Yahoo gives them
+    rng = np.random.default_rng(seed)
+    tickers = np.array(['T%05d' % i for i in range(nb_tickers)])
+    sectors = rng.integers(0, len(SECTORS), nb_tickers)
+    compositions = dict()
+    for i in range(nb_indexes):
+        members = np.sort(rng.choice(nb_tickers, min(index_size, nb_tickers), replace=False))
+        compositions['IDX%02d' % i] = {sector: tickers[members[sectors[members] == s]].tolist()
+                                       for s, sector in enumerate(SECTORS) if (sectors[members] == s).any()}
+    quotes = {'ticker': tickers, 'price': np.round(rng.lognormal(4, 1, nb_tickers), 2).astype(str),
+              'adv': rng.integers(10000, 10000000, nb_tickers).astype(str),
+              'shares': rng.lognormal(19, 1.5, nb_tickers)}
+    return compositions, quotes
+
+
+def make_records(compositions, quotes):
+    # the row by row layout of IndexParser.result_df: one dict per constituent, price and adv left as strings
+    by_ticker = {ticker: i for i, ticker in enumerate(quotes['ticker'])}
+    return [{'index': index, 'ticker': ticker, 'sector': sector, 'price': quotes['price'][by_ticker[ticker]],
+             'adv': quotes['adv'][by_ticker[ticker]], 'shares': quotes['shares'][by_ticker[ticker]]}
+            for index, sector_tickers in compositions.items()
+            for sector, tickers in sector_tickers.items() for ticker in tickers]
+
+
+def aggregate_records(records):
+    df = pd.DataFrame(records)
+    df['price'] = df['price'].astype(float)
+    df['adv'] = df['adv'].astype(float)
+    df['cap'] = df['price'] * df['shares']
+    df['liquidity'] = df['price'] * df['adv']
+    df['weight'] = df['cap'] / df.groupby('index')['cap'].transform('sum')
+    return df.groupby(['index', 'sector']).agg(nb_constituents=('ticker', 'size'), weight=('weight', 'sum'),
+                                               cap=('cap', 'sum'), liquidity=('liquidity', 'sum'),
+                                               adv=('adv', 'sum'))
+
+
+def build_universe(compositions, quotes):
+    return IndexUniverse(compositions).update_quotes(quotes['ticker'], price=quotes['price'], adv=quotes['adv'],
+                                                    shares=quotes['shares'])
+
+
+def timed(function, repeat=5):
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run(sizes=(1000, 5000, 20000)):
+    for nb_tickers in sizes:
+        compositions, quotes = make_universe(nb_tickers, index_size=nb_tickers // 4)
+        records = make_records(compositions, quotes)
+        time_records, expected = timed(lambda: aggregate_records(records))
+        time_build, universe = timed(lambda: build_universe(compositions, quotes))
+        time_aggregate, aggregated = timed(lambda: universe.aggregate(weighting='cap'))
+        lookups = universe.tickers[::7]
+        df = universe.to_dataframe()
+        time_lookup_df, _ = timed(lambda: [df.index[df['ticker'] == ticker] for ticker in lookups[:200]], repeat=1)
+        time_lookup, _ = timed(lambda: [universe.rows(ticker) for ticker in lookups[:200]])
+        error = np.abs(aggregated['weight'] - expected['weight'].values).max()
+        print('%6d tickers, %6d memberships: pandas groupby %7.2f ms, build %7.2f ms, aggregate %6.2f ms, '
+              '200 lookups %7.2f ms with a mask / %5.3f ms indexed (weights differ by %.1e)'
+              % (nb_tickers, len(universe), time_records * 1e3, time_build * 1e3, time_aggregate * 1e3,
+                 time_lookup_df * 1e3, time_lookup * 1e3, error))
+
+
+if __name__ == '__main__':
+    run([int(size) for size in sys.argv[1:]] or (1000, 5000, 20000))
@@ -0,0 +1,78 @@
+import json
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PythonCourseForBanking.yahoofinance.get_index_composition import download_quotes
+
+
+class FakeQuoteHandler(BaseHTTPRequestHandler):
+    # answers /<ticker> with a quote after a fixed latency, every tenth ticker fails on its first request
+    latency = 0.05
+    requested = set()
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        ticker = self.path.strip('/')
+        if int(ticker[1:]) % 10 == 0 and ticker not in self.requested:
+            self.requested.add(ticker)
+            self.send_response(503)
+            self.end_headers()
+            return
+        body = json.dumps({'price': '100.0', 'adv': '1000000'}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeQuoteServer(ThreadingHTTPServer):
+    request_queue_size = 128  # the default backlog of 5 would drop connections and time the retransmits instead
+
+
+def start_fake_quote_server():
+    server = FakeQuoteServer(('127.0.0.1', 0), FakeQuoteHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def make_quote_fetcher(server):
+    url = 'http://127.0.0.1:%d/' % server.server_address[1]
+
+    def fetch_quote(ticker):
+        with urllib.request.urlopen(url + ticker) as response:
+            quote = json.loads(response.read().decode())
+        return quote['price'], quote['adv']
+    return fetch_quote
+
+
+def time_download(sector_tickers, quote_fetcher, max_workers):
+    FakeQuoteHandler.requested = set()
+    start = time.perf_counter()
+    results = list()
+    failures = download_quotes(sector_tickers, results.append, quote_fetcher=quote_fetcher, max_workers=max_workers,
+                               backoff=0.01)
+    return time.perf_counter() - start, len(results), len(failures)
+
+
+def run(nb_tickers=200, nb_sectors=10):
+    server = start_fake_quote_server()
+    quote_fetcher = make_quote_fetcher(server)
+    sector_tickers = {'sector_%d' % sector: ['T%d' % i for i in range(sector, nb_tickers, nb_sectors)]
+                      for sector in range(nb_sectors)}
+    timings = dict()
+    for max_workers in (1, 8, 32):
+        elapsed, nb_results, nb_failures = time_download(sector_tickers, quote_fetcher, max_workers)
+        timings[max_workers] = elapsed
+        print('%2d workers : %.2fs for %d tickers (%d failed)' % (max_workers, elapsed, nb_results, nb_failures))
+    server.shutdown()
+    return timings
+
+
+if __name__ == '__main__':
+    run()
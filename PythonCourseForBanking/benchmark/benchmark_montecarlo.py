@@ -0,0 +1,23 @@
+import os
+import time
+
+from PythonCourseForBanking.pricing.montecarlo import PAYOFFS, MonteCarloPricer
+
+
+def run(nb_paths=200000, nb_steps=252):
+    paths_per_second = dict()
+    for payoff in PAYOFFS:
+        for max_workers in sorted({1, os.cpu_count() or 1}):
+            start = time.perf_counter()
+            mcp = MonteCarloPricer(underlying_price=100, strike_price=100, rate=0.02, time_to_maturity=1,
+                                   volatility=0.25, payoff=payoff, barrier=130, nb_paths=nb_paths,
+                                   nb_steps=nb_steps, max_workers=max_workers)
+            elapsed = time.perf_counter() - start
+            paths_per_second[(payoff, max_workers)] = nb_paths / elapsed
+            print('%-9s %2d workers : %9.0f paths/s (%d steps), price %.4f +/- %.4f' % (
+                payoff, max_workers, nb_paths / elapsed, nb_steps, mcp.option_price, mcp.standard_error))
+    return paths_per_second
+
+
+if __name__ == '__main__':
+    run()
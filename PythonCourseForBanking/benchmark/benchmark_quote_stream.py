@@ -0,0 +1,75 @@
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from PythonCourseForBanking.yahoofinance.quote_stream import SECONDS_PER_DAY, FileReplaySource, QuoteBook, \
+    QuoteStream, ReplayServer, SocketTickSource, format_tick
+
+
+def make_ticks(nb_ticks, nb_tickers=40, nb_days=5, seed=0):
+    # random walks on nb_tickers tickers, ticks evenly spread over 8 hours of each of nb_days sessions
+    rng = np.random.default_rng(seed)
+    tickers = rng.integers(0, nb_tickers, nb_ticks)
+    day = np.arange(nb_ticks) * nb_days // nb_ticks
+    timestamps = 1.5e9 + day * SECONDS_PER_DAY + 9 * 3600 + (np.arange(nb_ticks) % (nb_ticks // nb_days)) * \
+        (8 * 3600. / (nb_ticks // nb_days))
+    log_prices = np.log(rng.uniform(20, 200, nb_tickers))
+    prices = np.empty(nb_ticks)
+    for i in range(nb_tickers):
+        rows = tickers == i
+        prices[rows] = np.exp(log_prices[i] + np.cumsum(0.0005 * rng.standard_normal(rows.sum())))
+    return {'ticker': np.array(['T%03d' % i for i in range(nb_tickers)])[tickers], 'timestamp': timestamps,
+            'price': prices, 'volume': rng.integers(1, 1000, nb_ticks).astype(float)}
+
+
+def write_ticks(path, ticks):
+    with open(path, 'w') as f:
+        f.write('timestamp,ticker,price,volume\n')
+        for tick in zip(ticks['ticker'], ticks['timestamp'], ticks['price'], ticks['volume']):
+            f.write(format_tick(tick[0], tick[1], tick[2], tick[3]))
+
+
+def time_ingest(ticks, window):
+    # ticks per second pushed as columns, the cost of a tick must not depend on the window
+    book = QuoteBook(window=window)
+    start = time.perf_counter()
+    book.ingest_many(ticks['ticker'], ticks['timestamp'], ticks['price'], ticks['volume'])
+    return len(ticks['price']) / (time.perf_counter() - start), book
+
+
+def time_snapshot(book, repeat=100):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        book.snapshot()
+    return (time.perf_counter() - start) / repeat
+
+
+def time_stream(source):
+    book = QuoteBook()
+    start = time.perf_counter()
+    stream = QuoteStream(source, book).start()
+    stream.thread.join()
+    return stream.nb_ticks / (time.perf_counter() - start)
+
+
+def run(nb_ticks=500000):
+    ticks = make_ticks(nb_ticks)
+    for window in (10, 100, 10000):
+        ticks_per_second, book = time_ingest(ticks, window)
+        print('ingest, window %5d : %9.0f ticks/s' % (window, ticks_per_second))
+    print('snapshot of %d tickers: %7.1f us' % (len(book), time_snapshot(book) * 1e6))
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'ticks.csv')
+        write_ticks(path, ticks)
+        print('file replay          : %9.0f ticks/s' % time_stream(FileReplaySource(path)))
+        server = ReplayServer(path).start()
+        print('socket replay        : %9.0f ticks/s' % time_stream(SocketTickSource(*server.server_address)))
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 500000)
@@ -0,0 +1,34 @@
+import json
+import time
+
+from PythonCourseForBanking.benchmark.benchmark_blackscholes import make_option_book
+from PythonCourseForBanking.website.website import app
+
+
+def time_single_shot_route(client, book):
+    start = time.perf_counter()
+    for i in range(len(book['call_put'])):
+        client.get('/price_with_blackscholes', query_string={column: values[i] for column, values in book.items()})
+    return time.perf_counter() - start
+
+
+def time_batch_route(client, book):
+    body = json.dumps({column: values.tolist() for column, values in book.items()})
+    start = time.perf_counter()
+    response = client.post('/price_with_blackscholes/batch', data=body, content_type='application/json')
+    response.get_data()  # consume the streamed body
+    return time.perf_counter() - start
+
+
+def run(nb_options_single=1000, nb_options_batch=100000):
+    client = app.test_client()
+    single_per_option = time_single_shot_route(client, make_option_book(nb_options_single)) / nb_options_single
+    batch_per_option = time_batch_route(client, make_option_book(nb_options_batch)) / nb_options_batch
+    print('GET  /price_with_blackscholes       : %.1f options/s' % (1 / single_per_option))
+    print('POST /price_with_blackscholes/batch : %.1f options/s' % (1 / batch_per_option))
+    print('speedup                             : x%.0f' % (single_per_option / batch_per_option))
+    return {'single_per_option': single_per_option, 'batch_per_option': batch_per_option}
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,37 @@
+import os
+import time
+
+import numpy as np
+
+from PythonCourseForBanking.benchmark.benchmark_blackscholes import make_option_book
+from PythonCourseForBanking.benchmark.benchmark_bonds import make_bond_book
+from PythonCourseForBanking.portfolio.scenarios import ScenarioEngine
+
+
+def run(nb_options=20000, nb_bonds=2000, nb_shocks=8):
+    options = make_option_book(nb_options)
+    options['quantity'] = np.ones(nb_options)
+    bonds = make_bond_book(nb_bonds)
+    bonds['quantity'] = np.ones(nb_bonds)
+    spot_shocks = np.linspace(-0.2, 0.2, nb_shocks)
+    vol_shocks = np.linspace(-0.1, 0.1, nb_shocks)
+    rate_shocks = np.linspace(-0.02, 0.02, nb_shocks)
+    nb_scenarios = nb_shocks ** 3
+
+    # scenarios per second for 1, 2, 4... workers up to the number of cores
+    timings = dict()
+    nb_workers = 1
+    while nb_workers <= (os.cpu_count() or 1):
+        engine = ScenarioEngine(options=options, bonds=bonds, max_workers=nb_workers)
+        start = time.perf_counter()
+        engine.run(spot_shocks, vol_shocks, rate_shocks)
+        timings[nb_workers] = time.perf_counter() - start
+        print('%2d workers : %.2fs, %.0f scenarios/s on %d positions (x%.1f)' % (
+            nb_workers, timings[nb_workers], nb_scenarios / timings[nb_workers], nb_options + nb_bonds,
+            timings[1] / timings[nb_workers]))
+        nb_workers *= 2
+    return timings
+
+
+if __name__ == '__main__':
+    run()
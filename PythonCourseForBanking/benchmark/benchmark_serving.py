@@ -0,0 +1,123 @@
+import argparse
+import http.client
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def start_server(workers, threads, micro_batching, window_ms):
+    # the production entry point in a subprocess, on a free port read back from its first line
+    env = dict(os.environ, PRICING_MICRO_BATCHING='1' if micro_batching else '0',
+               PRICING_BATCH_WINDOW_MS=str(window_ms), PYTHONPATH=ROOT)
+    process = subprocess.Popen([sys.executable, '-m', 'PythonCourseForBanking.website.wsgi', '--port', '0',
+                                '--workers', str(workers), '--threads', str(threads)],
+                               stdout=subprocess.PIPE, env=env, cwd=ROOT, text=True)
+    port = int(re.search(r':(\d+) ', process.stdout.readline()).group(1))
+    return process, port
+
+
+def stop_server(process):
+    process.terminate()
+    process.wait(10)
+
+
+def make_paths(nb_requests, seed=0):
+    # distinct parameters for every request, so none is answered by the pricing cache; half options, half bonds
+    rng = np.random.default_rng(seed)
+    paths = list()
+    for i in range(nb_requests):
+        if i % 2:
+            paths.append('/price_with_blackscholes?underlying_price=%r&strike_price=%r&rate=%r&time_to_maturity=%r'
+                         '&volatility=%r&call_put=%s'
+                         % (rng.uniform(50, 150), rng.uniform(50, 150), rng.uniform(0, 0.05), rng.uniform(0.1, 3),
+                            rng.uniform(0.1, 0.5), rng.choice(['call', 'put'])))
+        else:
+            paths.append('/price_bonds?par_value=1000&annual_discount_rate=%r&annual_coupon_rate=%r&maturity=%d'
+                         '&coupon_periodicity=%s'
+                         % (rng.uniform(0, 0.08), rng.uniform(0, 0.08), rng.integers(1, 30),
+                            rng.choice(['annual', 'semi_annual', 'quarterly'])))
+    return paths
+
+
+def run_clients(port, paths, concurrency):
+    # concurrency clients on keep-alive connections share the requests, the latency of each one is kept
+    latencies = np.zeros(len(paths))
+    errors = list()
+    next_request = iter(range(len(paths)))
+    lock = threading.Lock()
+
+    def client():
+        connection = http.client.HTTPConnection('127.0.0.1', port)
+        while True:
+            with lock:
+                i = next(next_request, None)
+            if i is None:
+                break
+            start = time.perf_counter()
+            connection.request('GET', paths[i])
+            response = connection.getresponse()
+            response.read()
+            latencies[i] = time.perf_counter() - start
+            if response.status != 200:
+                errors.append(response.status)
+        connection.close()
+
+    clients = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    return time.perf_counter() - start, latencies, errors
+
+
+def get_json(port, path):
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    connection.request('GET', path)
+    return json.loads(connection.getresponse().read().decode())
+
+
+def measure(micro_batching, nb_requests, concurrency, workers, window_ms):
+    process, port = start_server(workers, max(concurrency, 16), micro_batching, window_ms)
+    try:
+        run_clients(port, make_paths(200, seed=1), concurrency)  # warm up
+        elapsed, latencies, errors = run_clients(port, make_paths(nb_requests), concurrency)
+        stats = get_json(port, '/batching_stats')
+    finally:
+        stop_server(process)
+    return {'throughput': nb_requests / elapsed, 'p50': np.percentile(latencies, 50),
+            'p99': np.percentile(latencies, 99), 'errors': len(errors), 'batching': stats}
+
+
+def run(nb_requests=4000, concurrencies=(1, 8, 32), workers=2, window_ms=2.):
+    results = dict()
+    for concurrency in concurrencies:
+        for micro_batching in (False, True):
+            result = measure(micro_batching, nb_requests, concurrency, workers, window_ms)
+            results[(concurrency, micro_batching)] = result
+            batch_sizes = ', '.join('%s %.1f' % (name, stats['mean_batch_size'])
+                                    for name, stats in sorted(result['batching'].items()))
+            print('%3d clients, micro-batching %-3s: %7.0f requests/s, p50 %6.2f ms, p99 %6.2f ms, %d errors%s'
+                  % (concurrency, 'on' if micro_batching else 'off', result['throughput'], result['p50'] * 1e3,
+                     result['p99'] * 1e3, result['errors'],
+                     ' (mean batch sizes of the last worker: %s)' % batch_sizes if batch_sizes else ''))
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test of the production server, with and without '
+                                                 'micro-batching')
+    parser.add_argument('--requests', type=int, default=4000)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--window-ms', type=float, default=2.)
+    args = parser.parse_args()
+    run(args.requests, args.concurrency, args.workers, args.window_ms)
@@ -0,0 +1,445 @@
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from PythonCourseForBanking.benchmark import benchmark_blackscholes, benchmark_bonds, benchmark_routes
+from PythonCourseForBanking.benchmark.benchmark_blackscholes import make_option_book
+from PythonCourseForBanking.benchmark.benchmark_bonds import make_bond_book
+from PythonCourseForBanking.benchmark.benchmark_database import make_deals, make_sqlite_database, timed
+from PythonCourseForBanking.benchmark.benchmark_index_analytics import aggregate_records, build_universe, \
+    make_records, make_universe
+from PythonCourseForBanking.benchmark.benchmark_quote_stream import make_ticks
+from PythonCourseForBanking.pricing.blackscholes import BlackScholesBatchPricer, BlackScholesPricer
+from PythonCourseForBanking.pricing.blueprints import price_bond, price_bonds_coalesced, price_option, \
+    price_options_coalesced, serialize
+from PythonCourseForBanking.pricing.bonds import COUPON_PERIODICITIES, BondBatchPricer, BondPricer
+from PythonCourseForBanking.pricing.curves import INTERPOLATIONS, YieldCurve
+from PythonCourseForBanking.pricing.implied_volatility import ImpliedVolatilitySolver
+from PythonCourseForBanking.pricing.montecarlo import MonteCarloPricer
+from PythonCourseForBanking.pricing.normal import erfc_norm_cdf, norm_cdf
+from PythonCourseForBanking.website.website import app
+from PythonCourseForBanking.yahoofinance.quote_stream import SECONDS_PER_DAY, TRADING_SECONDS_PER_YEAR, QuoteBook
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# a cold start of the web service, Flask included, must stay under this; the modules below are only loaded by
+# the requests that need them
+IMPORT_TIME_TARGET = 0.5
+LAZY_MODULES = ('scipy', 'pandas', 'yahoo_finance', 'pyarrow')
+
+# sizes of the timed cases, 'quick' is meant for a check before each commit, 'full' for a release
+SIZES = {'quick': {'options_loop': 2000, 'options_batch': 200000, 'bonds_loop': 500, 'bonds_batch': 20000,
+                   'deals': 20000, 'route_single': 200, 'route_batch': 20000},
+         'full': {'options_loop': 10000, 'options_batch': 1000000, 'bonds_loop': 2000, 'bonds_batch': 100000,
+                  'deals': 200000, 'route_single': 1000, 'route_batch': 100000}}
+
+
+# timed cases: every one returns seconds per priced option, bond, deal or request, so lower is always better
+
+def time_options(sizes):
+    loop_book, batch_book = make_option_book(sizes['options_loop']), make_option_book(sizes['options_batch'])
+    return {'option_scalar': benchmark_blackscholes.time_scalar_loop(loop_book) / sizes['options_loop'],
+            'option_batch': benchmark_blackscholes.time_batch(batch_book) / sizes['options_batch']}
+
+
+def time_bonds(sizes):
+    timings = {'bond_scalar': benchmark_bonds.time_scalar_loop(make_bond_book(sizes['bonds_loop'])) /
+               sizes['bonds_loop']}
+    # the batch cost grows with the number of coupons, so each periodicity and maturity range is timed on its own
+    for coupon_periodicity in COUPON_PERIODICITIES:
+        for low, high in ((1, 5), (5, 31)):
+            book = make_bond_book(sizes['bonds_batch'])
+            book['coupon_periodicity'] = np.full(sizes['bonds_batch'], coupon_periodicity)
+            book['maturity'] = np.random.RandomState(0).randint(low, high, sizes['bonds_batch']).astype(float)
+            name = 'bond_batch_%s_%d_%dy' % (coupon_periodicity, low, high - 1)
+            timings[name] = benchmark_bonds.time_batch(book) / sizes['bonds_batch']
+    return timings
+
+
+def time_database(sizes):
+    nb_deals = sizes['deals']
+    with tempfile.TemporaryDirectory() as directory:
+        db_mgmt = make_sqlite_database(directory)
+        deals = make_deals(nb_deals)
+        timings = {'db_bulk_insert': timed(db_mgmt.bulk_insert_deals, deals) / nb_deals}
+        start = time.perf_counter()
+        ids = [columns['id'] for columns in db_mgmt.stream_deals(output='columns')]
+        timings['db_stream'] = (time.perf_counter() - start) / nb_deals
+        updated_deals = deals.assign(id=np.concatenate(ids), price=deals['price'] * 1.01)
+        timings['db_bulk_upsert'] = timed(db_mgmt.bulk_upsert_deals, updated_deals) / nb_deals
+        timings['db_truncate'] = timed(db_mgmt.truncate_deals) / nb_deals
+        db_mgmt.engine.dispose()
+    return timings
+
+
+def time_routes(sizes):
+    client = app.test_client()
+    bond_book = make_bond_book(sizes['route_single'], seed=1)
+    start = time.perf_counter()
+    for i in range(sizes['route_single']):
+        client.get('/price_bonds', query_string={column: values[i] for column, values in bond_book.items()})
+    timings = {'route_price_bonds': (time.perf_counter() - start) / sizes['route_single']}
+    bond_book = make_bond_book(sizes['route_batch'], seed=1)
+    body = json.dumps({column: values.tolist() for column, values in bond_book.items()})
+    start = time.perf_counter()
+    client.post('/price_bonds/batch', data=body, content_type='application/json').get_data()
+    timings['route_price_bonds_batch'] = (time.perf_counter() - start) / sizes['route_batch']
+    # seed 1 books, so neither route is answered from the pricing cache filled by a previous repeat
+    timings['route_blackscholes'] = benchmark_routes.time_single_shot_route(
+        client, make_option_book(sizes['route_single'], seed=1)) / sizes['route_single']
+    timings['route_blackscholes_batch'] = benchmark_routes.time_batch_route(
+        client, make_option_book(sizes['route_batch'], seed=1)) / sizes['route_batch']
+    return timings
+
+
+TIMED_CASES = [time_options, time_bonds, time_database, time_routes]
+
+
+# numerical cross-checks: every one returns (name, error, tolerance)
+
+def check_option_batch_vs_scalar():
+    book = make_option_book(500, seed=2)
+    batch = BlackScholesBatchPricer(**book).to_dict()
+    error = 0.
+    for i in range(500):
+        scalar = BlackScholesPricer(**{column: values[i] for column, values in book.items()})
+        error = max(error, max(abs(getattr(scalar, column) - batch[column][i]) for column in batch))
+    return 'option batch vs scalar', error, 1e-9
+
+
+def check_option_closed_form():
+    # textbook formula written with math.erf, independent from the ndtr based pricers
+    book = make_option_book(500, seed=3)
+    pricer = BlackScholesBatchPricer(**book)
+    error = 0.
+    for i in range(500):
+        s, k, r, t, v = [book[column][i] for column in ('underlying_price', 'strike_price', 'rate',
+                                                        'time_to_maturity', 'volatility')]
+        d1 = (math.log(s / k) + (r + v * v / 2) * t) / (v * math.sqrt(t))
+        d2 = d1 - v * math.sqrt(t)
+        cdf = lambda x: 0.5 * (1 + math.erf(x / math.sqrt(2)))
+        if book['call_put'][i] == 'call':
+            expected = s * cdf(d1) - k * math.exp(-r * t) * cdf(d2)
+        else:
+            expected = k * math.exp(-r * t) * cdf(-d2) - s * cdf(-d1)
+        error = max(error, abs(expected - pricer.option_price[i]))
+    return 'option vs closed form', error, 1e-8
+
+
+def check_put_call_parity():
+    book = make_option_book(10000, seed=4)
+    call = BlackScholesBatchPricer(**dict(book, call_put='call')).option_price
+    put = BlackScholesBatchPricer(**dict(book, call_put='put')).option_price
+    forward = book['underlying_price'] - book['strike_price'] * np.exp(-book['rate'] * book['time_to_maturity'])
+    return 'put-call parity', float(np.abs(call - put - forward).max()), 1e-9
+
+
+def check_bond_batch_vs_scalar():
+    book = make_bond_book(500, seed=2)
+    batch = BondBatchPricer(**book).to_dict()
+    error = 0.
+    for i in range(500):
+        scalar = BondPricer(**{column: values[i] for column, values in book.items()})
+        error = max(error, max(abs(getattr(scalar, column) - batch[column][i]) for column in batch))
+    return 'bond batch vs scalar', error, 1e-8
+
+
+def check_bond_at_par():
+    # an annual bond discounted at its own coupon rate is worth its par value, up to the cents its present values
+    # are rounded to (the engine pays the annual coupon and discounts at the annual rate every period, so only
+    # annual bonds price at par)
+    book = make_bond_book(10000, seed=5)
+    book['annual_discount_rate'] = book['annual_coupon_rate']
+    book['coupon_periodicity'] = np.full(10000, 'annual')
+    pricer = BondBatchPricer(**book)
+    return 'bond at par', float((np.abs(pricer.price - book['par_value']) / book['maturity']).max()), 0.005 + 1e-9
+
+
+def check_flat_curve():
+    # annual and zero-coupon bonds off a flat curve are the same bonds discounted at the flat rate; the others pay
+    # coupon / periodicity every 1 / periodicity years off a curve
+    book = make_bond_book(10000, seed=7)
+    book['annual_discount_rate'] = np.full(10000, 0.04)
+    book['coupon_periodicity'] = np.random.RandomState(7).choice(['annual', 'no_coupon'], 10000)
+    flat = BondBatchPricer(**book)
+    curve = BondBatchPricer(curve=YieldCurve.flat(0.04), **book)
+    error = float(np.abs(curve.price - flat.price).max())
+    for coupon_periodicity, frequency in (('semi_annual', 2), ('quarterly', 4), ('monthly', 12)):
+        times = np.arange(1, 1 + 10 * frequency) / frequency
+        expected = (1000 * 0.05 / frequency * 1.04 ** -times).round(2).sum() + 1000 * 1.04 ** -10
+        bond = BondPricer(1000., None, 0.05, 10, coupon_periodicity, curve=YieldCurve.flat(0.04))
+        error = max(error, abs(bond.price - float(expected)))
+    return 'flat curve', error, 1e-8
+
+
+def check_curve_bootstrap():
+    # every quote reprices off the curve bootstrapped from it, whatever the interpolation
+    deposits = [(0.25, 0.010), (0.5, 0.012)]
+    swaps = [(1, 0.014), (2, 0.016, 2), (5, 0.020), (10, 0.024), (30, 0.027)]
+    bonds = [(7, 0.03, 101.5, 2)]
+    error = 0.
+    for interpolation in INTERPOLATIONS:
+        curve = YieldCurve.bootstrap(deposits=deposits, swaps=swaps, bonds=bonds, interpolation=interpolation)
+        discount_factors = curve.discount_factors([quote[0] for quote in deposits])
+        error = max(error, np.abs(discount_factors - 1 / (1 + np.array([quote[1] * quote[0] for quote in deposits])))
+                    .max())
+        for maturity, rate, frequency in [quote if len(quote) > 2 else quote + (1,) for quote in swaps]:
+            times = maturity - np.arange(maturity * frequency)[::-1] / float(frequency)
+            swap_discount_factors = curve.discount_factors(times)
+            error = max(error, abs(rate / frequency * swap_discount_factors.sum() + swap_discount_factors[-1] - 1))
+    return 'curve bootstrap', float(error), 1e-10
+
+
+def check_quote_analytics():
+    # the statistics maintained tick by tick against the same ones recomputed from the whole history
+    ticks = make_ticks(20000, nb_tickers=5, nb_days=4, seed=8)
+    book = QuoteBook(window=64, adv_days=2)
+    book.ingest_many(ticks['ticker'], ticks['timestamp'], ticks['price'], ticks['volume'])
+    snapshot = book.snapshot()
+    error = 0.
+    for i, ticker in enumerate(snapshot['ticker']):
+        rows = ticks['ticker'] == ticker
+        prices, timestamps, volumes = ticks['price'][rows], ticks['timestamp'][rows], ticks['volume'][rows]
+        days = (timestamps // SECONDS_PER_DAY).astype(int)
+        session = days == days[-1]
+        daily_volumes = np.array([volumes[days == day].sum() for day in np.unique(days)[:-1]])
+        variance = np.nan
+        for log_return, interval in zip(np.diff(np.log(prices)), np.diff(timestamps)):
+            sample = log_return * log_return / max(interval, book.min_interval)
+            variance = sample if np.isnan(variance) else book.ewma_lambda * variance + (1 - book.ewma_lambda) * sample
+        expected = {'rolling_mean': prices[-64:].mean(),
+                    'vwap': (prices[session] * volumes[session]).sum() / volumes[session].sum(),
+                    'adv': daily_volumes[-2:].mean(),
+                    'ewma_volatility': np.sqrt(variance * TRADING_SECONDS_PER_YEAR)}
+        for column, value in expected.items():
+            error = max(error, abs(snapshot[column][i] / value - 1))
+    return 'quote analytics', float(error), 1e-9
+
+
+def check_index_aggregation():
+    # the bincount aggregation of the index universe against a pandas groupby of the same constituents
+    compositions, quotes = make_universe(3000, index_size=800, seed=9)
+    expected = aggregate_records(make_records(compositions, quotes))
+    aggregated = build_universe(compositions, quotes).aggregate(weighting='cap')
+    error = 0. if list(zip(aggregated['index'], aggregated['sector'])) == list(expected.index) else np.inf
+    for column in ('nb_constituents', 'weight', 'cap', 'liquidity', 'adv'):
+        error = max(error, float(np.abs(aggregated[column] / expected[column].values - 1).max()))
+    return 'index aggregation', error, 1e-12
+
+
+def check_implied_volatility_round_trip():
+    book = make_option_book(10000, seed=6)
+    option_price = BlackScholesBatchPricer(**book).option_price
+    solver = ImpliedVolatilitySolver(option_price=option_price, **{column: book[column] for column in book
+                                                                   if column != 'volatility'})
+    # deep out of the money options have no vega left, their volatility cannot be read back from the price
+    vega = BlackScholesBatchPricer(**book).vega
+    readable = vega > 1e-4
+    return 'implied volatility round trip', float(np.abs(solver.volatility - book['volatility'])[readable].max()), \
+        1e-6
+
+
+def check_montecarlo_european():
+    mcp = MonteCarloPricer(underlying_price=100, strike_price=105, rate=0.02, time_to_maturity=1, volatility=0.25,
+                           payoff='european', nb_paths=50000, nb_steps=12, control_variate=False)
+    exact = BlackScholesPricer(underlying_price=100, strike_price=105, rate=0.02, time_to_maturity=1,
+                               volatility=0.25, call_put='call').option_price
+    # in standard errors
+    return 'monte carlo vs black-scholes', abs(mcp.option_price - exact) / mcp.standard_error, 4.
+
+
+def check_routes():
+    client = app.test_client()
+    error = 0.
+    options, bonds = make_option_book(20, seed=7), make_bond_book(20, seed=7)
+    for i in range(20):
+        option = {column: values[i] for column, values in options.items()}
+        response = client.get('/price_with_blackscholes', query_string=option).get_json()
+        expected = price_option(**option)
+        error = max(error, max(abs(response[column] - expected[column]) for column in expected))
+        bond = {column: values[i] for column, values in bonds.items()}
+        response = client.get('/price_bonds', query_string=bond).get_json()
+        expected = price_bond(**bond)
+        error = max(error, max(abs(response[column] - expected[column]) for column in ('price', 'sensitivity',
+                                                                                        'convexity')))
+    for route, book, pricer, decimals in (('/price_with_blackscholes/batch', options, BlackScholesBatchPricer, 5),
+                                          ('/price_bonds/batch', bonds, BondBatchPricer, 4)):
+        body = json.dumps({column: values.tolist() for column, values in book.items()})
+        response = client.post(route, data=body, content_type='application/json').get_json()
+        for column, values in pricer(**book).to_dict().items():
+            error = max(error, float(np.abs(np.array(response[column], dtype=float) - np.round(values, decimals))
+                                     .max()))
+    return 'routes vs pricers', error, 1e-9
+
+
+def check_micro_batching():
+    # a coalesced request must get the very body it would have got alone, so the count of differing bodies
+    options, bonds = make_option_book(500, seed=10), make_bond_book(500, seed=10)
+    options = [{column: values[i].item() for column, values in options.items()} for i in range(500)]
+    bonds = [{column: values[i].item() for column, values in bonds.items()} for i in range(500)]
+    nb_different = sum(body != serialize(price_option(**option))
+                       for option, body in zip(options, price_options_coalesced(options)))
+    nb_different += sum(body != serialize(price_bond(**bond))
+                        for bond, body in zip(bonds, price_bonds_coalesced(bonds)))
+    return 'micro-batching vs single', float(nb_different), 0.
+
+
+def check_normal_fallback():
+    x = np.linspace(-38, 38, 100001)
+    return 'erfc fallback vs norm_cdf', float(np.abs(erfc_norm_cdf(x) - norm_cdf(x)).max()), 1e-15
+
+
+def measure_import(module, lazy_modules=LAZY_MODULES):
+    # in a fresh interpreter, so nothing is already imported
+    code = ('import sys, time; start = time.perf_counter(); import %s; elapsed = time.perf_counter() - start; '
+            'print(elapsed, *[name for name in %r if name in sys.modules])' % (module, lazy_modules))
+    output = subprocess.check_output([sys.executable, '-c', code], cwd=ROOT, universal_newlines=True).split()
+    return float(output[0]), output[1:]
+
+
+def check_import_time():
+    return 'website import time', min(measure_import('PythonCourseForBanking.website.website')[0]
+                                      for _ in range(3)), IMPORT_TIME_TARGET
+
+
+def check_lazy_imports():
+    loaded = set()
+    for module in ('PythonCourseForBanking.website.website', 'PythonCourseForBanking.blackscholes.blackscholes',
+                   'PythonCourseForBanking.pricing'):
+        loaded.update(measure_import(module)[1])
+    if loaded:
+        print('     loaded at import: %s' % ', '.join(sorted(loaded)))
+    return 'heavy modules loaded at import', float(len(loaded)), 0.
+
+
+def check_pricers_without_flask():
+    # the pricers are imported by the scenario and Monte Carlo pool workers, which serve no request
+    loaded = set()
+    for module in ('PythonCourseForBanking.pricing.blackscholes', 'PythonCourseForBanking.pricing.bonds',
+                   'PythonCourseForBanking.pricing.montecarlo', 'PythonCourseForBanking.portfolio.scenarios'):
+        loaded.update(measure_import(module, ('flask', 'werkzeug', 'PythonCourseForBanking.website'))[1])
+    if loaded:
+        print('     loaded by the pricers: %s' % ', '.join(sorted(loaded)))
+    return 'flask loaded by the pricers', float(len(loaded)), 0.
+
+
+def check_database_round_trip():
+    with tempfile.TemporaryDirectory() as directory:
+        db_mgmt = make_sqlite_database(directory)
+        deals = make_deals(5000, seed=8)
+        db_mgmt.bulk_insert_deals(deals)
+        stored = pd.concat(db_mgmt.stream_deals(chunk_size=1000, output='dataframe'))
+        # upserted on the id: the first deal twice (the last one wins) and the second once, all on one isin, plus two
+        # deals without an id
+        updates = stored.iloc[[0, 1, 0]].assign(isin='FR0000000001', quantity=[5., 6., 7.])
+        counts = db_mgmt.bulk_upsert_deals(pd.concat([updates, make_deals(2, seed=9)]))
+        upserted = pd.concat(db_mgmt.stream_deals(chunk_size=1000, output='dataframe'))
+        db_mgmt.engine.dispose()
+    error = abs(len(stored) - len(deals)) + abs(stored['price'].sum() - deals['price'].sum()) + \
+        abs(stored['quantity'].sum() - deals['quantity'].sum()) + abs(len(upserted) - len(deals) - 2) + \
+        (counts != (2, 2)) + abs(upserted['quantity'].iloc[:3].values - [7., 6., stored['quantity'].iloc[2]]).sum()
+    return 'database round trip', float(error), 1e-6
+
+
+CROSS_CHECKS = [check_option_batch_vs_scalar, check_option_closed_form, check_put_call_parity,
+                check_bond_batch_vs_scalar, check_bond_at_par, check_flat_curve, check_curve_bootstrap,
+                check_quote_analytics, check_index_aggregation, check_implied_volatility_round_trip,
+                check_montecarlo_european, check_routes, check_micro_batching, check_database_round_trip,
+                check_normal_fallback, check_import_time, check_lazy_imports, check_pricers_without_flask]
+
+
+def run_timings(size='quick', repeat=3):
+    # best of repeat runs, the minimum is the least noisy estimate of what the code itself costs
+    timings = dict()
+    for case in TIMED_CASES:
+        for _ in range(repeat):
+            for name, value in case(SIZES[size]).items():
+                timings[name] = min(value, timings.get(name, value))
+    return timings
+
+
+def run_cross_checks():
+    failures = list()
+    for check in CROSS_CHECKS:
+        name, error, tolerance = check()
+        passed = error <= tolerance
+        print('%-4s %-32s error %.3e (tolerance %.1e)' % ('ok' if passed else 'FAIL', name, error, tolerance))
+        if not passed:
+            failures.append(name)
+    return failures
+
+
+def compare(timings, baseline, threshold):
+    regressions = list()
+    for name, value in sorted(timings.items()):
+        reference = baseline.get(name)
+        if reference is None:
+            print('new  %-32s %10.3f us' % (name, value * 1e6))
+            continue
+        change = value / reference - 1
+        regressed = change > threshold
+        print('%-4s %-32s %10.3f us  baseline %10.3f us  %+6.1f%%' % (
+            'SLOW' if regressed else 'ok', name, value * 1e6, reference * 1e6, change * 100))
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(path, timings, size):
+    with open(path, 'w') as f:
+        json.dump({'size': size, 'python': platform.python_version(), 'machine': platform.node(),
+                   'timings': timings}, f, indent=2, sort_keys=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Times the pricers, the database and the routes against a JSON '
+                                                 'baseline and cross-checks their results.')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--size', choices=sorted(SIZES), default='quick')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='relative slowdown above which a timing is a regression')
+    parser.add_argument('--update', action='store_true', help='write the timings as the new baseline')
+    parser.add_argument('--skip-timings', action='store_true')
+    args = parser.parse_args(argv)
+
+    failures = run_cross_checks()
+    regressions = list()
+    if not args.skip_timings:
+        timings = run_timings(args.size, args.repeat)
+        baseline = load_baseline(args.baseline)
+        if baseline is not None and baseline['size'] != args.size:
+            print('baseline %s was taken at size %s, not compared' % (args.baseline, baseline['size']))
+            baseline = None
+        regressions = compare(timings, baseline['timings'] if baseline is not None else dict(), args.threshold)
+        if args.update or baseline is None:
+            save_baseline(args.baseline, timings, args.size)
+            print('baseline written to %s' % args.baseline)
+
+    if failures:
+        print('%d cross-checks failed: %s' % (len(failures), ', '.join(failures)))
+    if regressions:
+        print('%d timings regressed by more than %.0f%%: %s' % (len(regressions), args.threshold * 100,
+                                                                ', '.join(regressions)))
+    return 1 if failures or regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,51 +1,265 @@
 import datetime
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
 
+import numpy as np
+import pandas as pd
 from sqlalchemy import Column, Integer, Float, VARCHAR, DateTime
-from sqlalchemy import create_engine, MetaData
+from sqlalchemy import and_, bindparam, create_engine, event, or_, select, MetaData
+from sqlalchemy.engine.url import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
 Base = declarative_base()
 
+DEAL_COLUMNS = ['id', 'date', 'type', 'quantity', 'isin', 'price']
+DEAL_STR_FORMAT = 'id =%s, date=%s, type=%s, quantity=%s, isin=%s, price=%s'
+
+
+class DealRecord(namedtuple('DealRecord', DEAL_COLUMNS)):
+    # read-only deal as streamed by DatabaseManagement.stream_deals, a plain tuple instead of an ORM object
+    __slots__ = ()
+
+    def __str__(self):
+        return DEAL_STR_FORMAT % self
+
 
 class DatabaseManagement:
-    def __init__(self, server, database):
+    # echo=False is the quiet mode, for bulk loads where logging every statement costs more than running it.
+    # connection_string takes any SQLAlchemy URL (e.g. sqlite:///deals.db), the MSSQL server/database pair is the
+    # default. The schema is not reflected unless reflect=True, the declared Deal model is used instead.
+    def __init__(self, server, database, echo=True, connection_string=None, pool_size=5, max_overflow=10,
+                 pool_pre_ping=True, pool_recycle=-1, reflect=False):
+        start = time.perf_counter()
         self.server = server
         self.database = database
+        self.reflect = reflect
 
-        self.connection_string = 'mssql+pyodbc://' + server + '/' + database + '?driver=SQL+Server+Native+Client+11.0'
-        self.engine = create_engine(self.connection_string, echo=True)
+        self.connection_string = connection_string or \
+            'mssql+pyodbc://' + server + '/' + database + '?driver=SQL+Server+Native+Client+11.0'
+        engine_options = {'echo': echo, 'pool_pre_ping': pool_pre_ping, 'pool_recycle': pool_recycle}
+        if make_url(self.connection_string).get_backend_name() != 'sqlite':
+            # sqlite picks its own pool class, which does not take a size
+            engine_options.update(pool_size=pool_size, max_overflow=max_overflow)
+        self.engine = create_engine(self.connection_string, **engine_options)
+        self.pool_counters = {'connections': 0, 'checkouts': 0, 'checkins': 0, 'checked_out': 0,
+                              'peak_checked_out': 0}
+        self._pool_lock = threading.Lock()
+        event.listen(self.engine, 'connect', self._on_connect)
+        event.listen(self.engine, 'checkout', self._on_checkout)
+        event.listen(self.engine, 'checkin', self._on_checkin)
 
         self.Session = sessionmaker(bind=self.engine)
-        self.session = self.Session()
+        self._session = None
 
         self.metadata = MetaData()
-        self.metadata.reflect(bind=self.engine)
-
         self.deals_table = self.create_table_deals()
+        self.startup_time = time.perf_counter() - start
+
+    @property
+    def session(self):
+        # long-lived session of the scripts, opened on first use; services should use session_scope() instead
+        if self._session is None:
+            self._session = self.Session()
+        return self._session
+
+    @contextmanager
+    def session_scope(self):
+        # one session per unit of work: committed on success, rolled back on error, always closed. Each call gets
+        # its own session, so it can be used from several Flask worker threads at once.
+        session = self.Session()
+        try:
+            yield session
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
 
     def create_table_deals(self):
-        if 'Deals' not in self.metadata.tables:
-            Base.metadata.create_all(self.engine)
+        # only the Deals table is checked and created, the rest of the database is never looked at
+        Base.metadata.create_all(self.engine, tables=[Deal.__table__])
+        # create_all only indexes the tables it creates: a Deals table created before the date, type and isin
+        # indexes were declared gets them here, the ones already there are skipped
+        for index in Deal.__table__.indexes:
+            index.create(self.engine, checkfirst=True)
+        if not self.reflect:
+            return Deal.__table__
 
+        self.metadata.reflect(bind=self.engine, only=['Deals'])
         deals_table = self.metadata.tables['Deals']
         return deals_table
 
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._pool_lock:
+            self.pool_counters['connections'] += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._pool_lock:
+            self.pool_counters['checkouts'] += 1
+            self.pool_counters['checked_out'] += 1
+            self.pool_counters['peak_checked_out'] = max(self.pool_counters['peak_checked_out'],
+                                                         self.pool_counters['checked_out'])
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._pool_lock:
+            self.pool_counters['checkins'] += 1
+            self.pool_counters['checked_out'] -= 1
+
+    def metrics(self):
+        with self._pool_lock:
+            metrics = dict(self.pool_counters)
+        metrics['startup_time'] = self.startup_time
+        metrics['pool'] = self.engine.pool.status()
+        return metrics
+
+    @staticmethod
+    def _deal_rows(deals):
+        # a DataFrame or an iterable of dicts, only the columns of the Deals table are kept
+        table_columns = set(Deal.__table__.columns.keys())
+        if hasattr(deals, 'columns'):
+            columns = [column for column in deals.columns if column in table_columns]
+            # converted column by column, datetime64 straight to datetime.datetime without boxing pandas Timestamps
+            values = [deals[column].values.astype('datetime64[us]').tolist() if deals[column].dtype.kind == 'M'
+                      else deals[column].tolist() for column in columns]
+            for row in zip(*values):
+                yield dict(zip(columns, row))
+        else:
+            for deal in deals:
+                yield {column: value for column, value in deal.items() if column in table_columns}
+
+    @staticmethod
+    def _chunks(rows, chunk_size):
+        chunk = list()
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = list()
+        if chunk:
+            yield chunk
+
+    def bulk_insert_deals(self, deals, chunk_size=10000):
+        # Core executemany inserts, one transaction for the whole load
+        nb_rows = 0
+        with self.engine.begin() as connection:
+            for chunk in self._chunks(self._deal_rows(deals), chunk_size):
+                connection.execute(Deal.__table__.insert(), chunk)
+                nb_rows += len(chunk)
+        return nb_rows
+
+    def delete_deals(self, **filters):
+        # one set-based DELETE, restricted to the deals matching the filters (e.g. type='Bond') if any
+        table = Deal.__table__
+        statement = table.delete()
+        if filters:
+            statement = statement.where(and_(*[table.c[column] == value for column, value in filters.items()]))
+        with self.engine.begin() as connection:
+            return connection.execute(statement).rowcount
+
+    def truncate_deals(self):
+        return self.delete_deals()
+
+    def bulk_upsert_deals(self, deals, key_columns=('id',), chunk_size=500):
+        # deals whose key already exists are updated, the others inserted; the existing keys of each chunk are
+        # looked up with one query so the work stays set-based. The key must identify one deal, the id by default:
+        # every stored deal sharing a key is overwritten (an isin alone is not a key). A deal without a key (no id
+        # yet) is inserted, and of the deals of a chunk sharing a key only the last one is kept.
+        table = Deal.__table__
+        key_columns = list(key_columns)
+        nb_inserted, nb_updated = 0, 0
+        with self.engine.begin() as connection:
+            for chunk in self._chunks(self._deal_rows(deals), chunk_size):
+                keyed, new_rows = dict(), list()
+                for row in chunk:
+                    key = tuple(row.get(column) for column in key_columns)
+                    if any(value is None or value != value for value in key):
+                        new_rows.append({column: value for column, value in row.items() if column not in key_columns})
+                    else:
+                        keyed[key] = row
+                existing = set()
+                if keyed:
+                    if len(key_columns) == 1:
+                        condition = table.c[key_columns[0]].in_([key[0] for key in keyed])
+                    else:
+                        condition = or_(*[and_(*[table.c[column] == value
+                                                 for column, value in zip(key_columns, key)]) for key in keyed])
+                    existing = set(tuple(row) for row in connection.execute(
+                        select(*[table.c[column] for column in key_columns]).where(condition)))
+
+                updates = [row for key, row in keyed.items() if key in existing]
+                inserts = [row for key, row in keyed.items() if key not in existing]
+                if updates:
+                    value_columns = [column for column in updates[0] if column not in key_columns]
+                    statement = table.update().where(
+                        and_(*[table.c[column] == bindparam('key_' + column) for column in key_columns])).values(
+                        {column: bindparam('new_' + column) for column in value_columns})
+                    connection.execute(statement, [dict([('key_' + column, row[column]) for column in key_columns] +
+                                                        [('new_' + column, row[column]) for column in value_columns])
+                                                   for row in updates])
+                # executed apart, an executemany takes the columns of its first row
+                for rows in (new_rows, inserts):
+                    if rows:
+                        connection.execute(table.insert(), rows)
+                nb_inserted += len(new_rows) + len(inserts)
+                nb_updated += len(updates)
+        return nb_inserted, nb_updated
+
+    def stream_deals(self, type=None, isin=None, start_date=None, end_date=None, chunk_size=10000,
+                     output='records'):
+        # yields the deals chunk by chunk through a server-side cursor, so memory does not grow with the table.
+        # The filters are applied by the database (date, isin and type are indexed). Each chunk is a list of
+        # DealRecord (output='records'), a dict of numpy columns (output='columns') or a DataFrame (output='dataframe').
+        table = Deal.__table__
+        conditions = list()
+        if type is not None:
+            conditions.append(table.c.type == type)
+        if isin is not None:
+            conditions.append(table.c.isin.in_(isin) if isinstance(isin, (list, tuple, set)) else table.c.isin == isin)
+        if start_date is not None:
+            conditions.append(table.c.date >= start_date)
+        if end_date is not None:
+            conditions.append(table.c.date <= end_date)
+        statement = select(*[table.c[column] for column in DEAL_COLUMNS]).order_by(table.c.id)
+        if conditions:
+            statement = statement.where(and_(*conditions))
+
+        with self.engine.connect() as connection:
+            result = connection.execution_options(stream_results=True, yield_per=chunk_size).execute(statement)
+            for rows in result.partitions(chunk_size):
+                if output == 'records':
+                    yield [DealRecord(*row) for row in rows]
+                else:
+                    columns = self._to_columns(rows)
+                    yield columns if output == 'columns' else pd.DataFrame(columns, columns=DEAL_COLUMNS)
+
+    @staticmethod
+    def _to_columns(rows):
+        values = list(zip(*rows))
+        return {'id': np.array(values[0], dtype=np.int64),
+                'date': pd.DatetimeIndex(values[1]).values.astype('datetime64[us]'),
+                'type': np.array(values[2], dtype=object),
+                'quantity': np.array(values[3], dtype=float),
+                'isin': np.array(values[4], dtype=object),
+                'price': np.array(values[5], dtype=float)}
+
 
 # since Deal inherits Base, sqlalchemy is used as an ORM and the class is linked to a table in ms sql
 class Deal(Base):
     __tablename__ = 'Deals'
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    date = Column(DateTime)
-    type = Column(VARCHAR(20))
+    date = Column(DateTime, index=True)
+    type = Column(VARCHAR(20), index=True)
     quantity = Column(Float)
-    isin = Column(VARCHAR(12))
+    isin = Column(VARCHAR(12), index=True)
     price = Column(Float)
 
     def __str__(self):
-        return 'id =' + str(self.id) + ', date=' + str(self.date) + ', type=' + str(self.type) + ', quantity=' + \
-               str(self.quantity) + ', isin=' + str(self.isin) + ', price=' + str(self.price)
+        return DEAL_STR_FORMAT % (self.id, self.date, self.type, self.quantity, self.isin, self.price)
 
 
 if __name__ == '__main__':
@@ -59,6 +273,9 @@ if __name__ == '__main__':
     db_mgmt.session.commit()
     # clear table method 2 (interesting because use bulk)
     db_mgmt.session.query(Deal).delete()
+    db_mgmt.session.commit()  # truncate_deals runs on its own connection, it would wait for the locks of the session
+    # clear table method 3 (one set-based DELETE statement, no ORM object loaded)
+    db_mgmt.truncate_deals()
 
     # INSERT
     # single insertion
@@ -70,6 +287,14 @@ if __name__ == '__main__':
     my_deal_3 = Deal(date=datetime.datetime.today(), type='Bond', quantity=2000, isin='US037833103 ', price=917.41)
     db_mgmt.session.add_all([my_deal_2, my_deal_3])
     db_mgmt.session.commit()
+    # bulk insertion (executemany by chunks, for a whole blotter) and upsert on the id: the first deal is updated,
+    # the one without an id is inserted
+    db_mgmt.bulk_insert_deals([{'date': datetime.datetime.today(), 'type': 'Action', 'quantity': 300,
+                                'isin': 'US037833104 ', 'price': 12.5}])
+    db_mgmt.bulk_upsert_deals([{'id': my_deal_1.id, 'date': datetime.datetime.today(), 'type': 'Action',
+                                'quantity': 6000, 'isin': 'US037833101 ', 'price': 183.1},
+                               {'date': datetime.datetime.today(), 'type': 'Action', 'quantity': 600,
+                                'isin': 'US037833105 ', 'price': 12.7}])
 
     # GET
     all_deals = db_mgmt.session.query(Deal).all()
@@ -77,6 +302,10 @@ if __name__ == '__main__':
     for deal in all_deals:
         print(deal)
 
+    # the whole table without loading it at once: chunks of lightweight records, filtered by the database
+    for deals in db_mgmt.stream_deals(type='Action', chunk_size=1000):
+        [print(deal) for deal in deals]
+
     all_bonds = db_mgmt.session.query(Deal).filter_by(type='Bond').all()
     first_action = db_mgmt.session.query(Deal).filter_by(type='Action').first()
 
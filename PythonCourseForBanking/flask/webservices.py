@@ -1,6 +1,8 @@
 from flask import Flask, jsonify, render_template
 
-app = Flask(__name__)
+from PythonCourseForBanking.website.metrics import instrument_app
+
+app = instrument_app(Flask(__name__), 'webservices')
 
 
 @app.route('/')
@@ -0,0 +1,211 @@
+import queue
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from PythonCourseForBanking.pricing.blackscholes import BlackScholesBatchPricer
+from PythonCourseForBanking.pricing.bonds import BondBatchPricer
+
+RESULT_COLUMNS = ['quantity', 'market_value', 'pnl', 'delta', 'gamma', 'vega', 'theta', 'rho', 'sensitivity',
+                  'convexity']
+BOND_COLUMNS = ['par_value', 'annual_discount_rate', 'annual_coupon_rate', 'maturity', 'coupon_periodicity']
+OPTION_COLUMNS = ['underlying_price', 'strike_price', 'rate', 'time_to_maturity', 'volatility', 'call_put']
+
+
+class MarketData:
+    # the deals only hold an isin, the terms and market inputs needed to price them are looked up here by isin:
+    # equities has a price column, bonds the BondPricer arguments and options the BlackScholesPricer ones
+    def __init__(self, equities=None, bonds=None, options=None):
+        self.equities = equities if equities is not None else pd.DataFrame(columns=['price'])
+        self.bonds = bonds if bonds is not None else pd.DataFrame(columns=BOND_COLUMNS)
+        self.options = options if options is not None else pd.DataFrame(columns=OPTION_COLUMNS)
+
+
+def price_deals(deals, market_data):
+    # values a DataFrame of deals (as streamed by DatabaseManagement.stream_deals), one batched call per type
+    result = pd.DataFrame(np.nan, index=deals.index, columns=RESULT_COLUMNS)
+    result['quantity'] = deals['quantity'].values
+    unit_value = pd.Series(np.nan, index=deals.index)
+
+    actions = deals['type'] == 'Action'
+    if actions.any():
+        unit_value[actions] = market_data.equities['price'].reindex(deals.loc[actions, 'isin']).values
+        result.loc[actions, 'delta'] = 1.
+        result.loc[actions, ['gamma', 'vega', 'theta', 'rho', 'sensitivity', 'convexity']] = 0.
+
+    bonds = deals['type'] == 'Bond'
+    if bonds.any():
+        terms = market_data.bonds.reindex(deals.loc[bonds, 'isin'])
+        pricer = BondBatchPricer(**{column: terms[column].values for column in BOND_COLUMNS})
+        unit_value[bonds] = pricer.price
+        result.loc[bonds, 'sensitivity'] = pricer.sensitivity * pricer.price
+        result.loc[bonds, 'convexity'] = pricer.convexity * pricer.price
+        result.loc[bonds, ['delta', 'gamma', 'vega', 'theta', 'rho']] = 0.
+
+    options = deals['type'] == 'Option'
+    if options.any():
+        terms = market_data.options.reindex(deals.loc[options, 'isin'])
+        pricer = BlackScholesBatchPricer(**{column: terms[column].values for column in OPTION_COLUMNS[:-1]},
+                                         call_put=terms['call_put'].fillna('').values)
+        unit_value[options] = pricer.option_price
+        for greek in ['delta', 'gamma', 'vega', 'theta', 'rho']:
+            result.loc[options, greek] = getattr(pricer, greek)
+        result.loc[options, ['sensitivity', 'convexity']] = 0.
+
+    # everything is per unit so far, positions scale with the quantity
+    quantity = deals['quantity'].values
+    result['market_value'] = quantity * unit_value.values
+    result['pnl'] = result['market_value'] - quantity * deals['price'].values
+    for column in RESULT_COLUMNS[3:]:
+        result[column] = result[column].values * quantity
+    result['isin'] = deals['isin'].values
+    result['type'] = deals['type'].values
+    result['unpriced'] = np.isnan(unit_value.values)
+    return result
+
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+
+class RevaluationPipeline:
+    # three stages linked by bounded queues: reading deals from the database, pricing them by type and aggregating
+    # per isin/type. Reading and pricing run in their own threads so the database I/O overlaps the numpy work, and
+    # the queues stop the reader from getting more than queue_size chunks ahead. When run() ends, on success or on
+    # the error of any stage, the threads are stopped and joined and the database cursor is closed.
+    def __init__(self, db_mgmt, market_data, chunk_size=50000, queue_size=4, **filters):
+        self.db_mgmt = db_mgmt
+        self.market_data = market_data
+        self.chunk_size = chunk_size
+        self.queue_size = queue_size
+        self.filters = filters
+        self.timings = {stage: {'busy': 0., 'wait': 0.} for stage in ('read', 'price', 'aggregate')}
+        self.nb_deals = 0
+        self.nb_unpriced = 0
+        self.result_df = None
+        self.stopped = threading.Event()
+
+    def _read(self, output_queue):
+        chunks = None
+        try:
+            chunks = self.db_mgmt.stream_deals(chunk_size=self.chunk_size, output='dataframe', **self.filters)
+            while not self.stopped.is_set():
+                start = time.perf_counter()
+                chunk = next(chunks, None)
+                self.timings['read']['busy'] += time.perf_counter() - start
+                if chunk is None:
+                    break
+                self._put(output_queue, chunk, 'read')
+            self._put(output_queue, None, 'read')
+        except Exception as e:
+            self._put(output_queue, _Failure(e), 'read')
+        finally:
+            # closing the generator closes its cursor and gives its connection back to the pool, also when the
+            # pipeline is stopped before the last chunk
+            if chunks is not None:
+                chunks.close()
+
+    def _price(self, input_queue, output_queue):
+        try:
+            while True:
+                chunk = self._get(input_queue, 'price')
+                if chunk is None or isinstance(chunk, _Failure):
+                    self._put(output_queue, chunk, 'price')
+                    return
+                start = time.perf_counter()
+                priced = price_deals(chunk, self.market_data)
+                self.timings['price']['busy'] += time.perf_counter() - start
+                self._put(output_queue, priced, 'price')
+        except Exception as e:
+            self._put(output_queue, _Failure(e), 'price')
+
+    def _put(self, output_queue, item, stage):
+        # gives up once the pipeline is stopped, a stage never stays blocked on a queue nobody reads anymore
+        start = time.perf_counter()
+        while not self.stopped.is_set():
+            try:
+                output_queue.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+        self.timings[stage]['wait'] += time.perf_counter() - start
+
+    def _get(self, input_queue, stage):
+        # None, the end of the stream, once the pipeline is stopped
+        start = time.perf_counter()
+        item = None
+        while not self.stopped.is_set():
+            try:
+                item = input_queue.get(timeout=0.1)
+                break
+            except queue.Empty:
+                pass
+        self.timings[stage]['wait'] += time.perf_counter() - start
+        return item
+
+    def run(self):
+        deals_queue = queue.Queue(maxsize=self.queue_size)
+        priced_queue = queue.Queue(maxsize=self.queue_size)
+        self.stopped = threading.Event()
+        threads = [threading.Thread(target=self._read, args=(deals_queue,), daemon=True),
+                   threading.Thread(target=self._price, args=(deals_queue, priced_queue), daemon=True)]
+        [thread.start() for thread in threads]
+
+        partials = list()
+        try:
+            while True:
+                priced = self._get(priced_queue, 'aggregate')
+                if isinstance(priced, _Failure):
+                    raise priced.error
+                if priced is None:
+                    break
+                start = time.perf_counter()
+                self.nb_deals += len(priced)
+                self.nb_unpriced += int(priced['unpriced'].sum())
+                partials.append(priced.groupby(['isin', 'type'])[RESULT_COLUMNS].sum(min_count=1))
+                self.timings['aggregate']['busy'] += time.perf_counter() - start
+        finally:
+            # whether the run ended or a stage failed, no thread is left behind holding a database connection
+            self.stopped.set()
+            [thread.join() for thread in threads]
+
+        start = time.perf_counter()
+        if partials:
+            self.result_df = pd.concat(partials).groupby(level=['isin', 'type']).sum(min_count=1)
+        else:
+            self.result_df = pd.DataFrame(columns=RESULT_COLUMNS)
+        self.timings['aggregate']['busy'] += time.perf_counter() - start
+        return self.result_df
+
+    def print_timings(self):
+        for stage, timing in self.timings.items():
+            print('%-10s: busy %.3fs, waiting %.3fs' % (stage, timing['busy'], timing['wait']))
+        print('%d deals revalued, %d without market data' % (self.nb_deals, self.nb_unpriced))
+
+
+if __name__ == '__main__':
+    import tempfile
+
+    from PythonCourseForBanking.benchmark.benchmark_database import make_deals, make_sqlite_database
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_mgmt = make_sqlite_database(directory)
+        deals = make_deals(200000)
+        db_mgmt.bulk_insert_deals(deals)
+        random_state = np.random.RandomState(0)
+        isins = deals['isin'].values
+        market_data = MarketData(
+            equities=pd.DataFrame({'price': random_state.uniform(1, 1000, len(isins))}, index=isins),
+            bonds=pd.DataFrame({'par_value': 1000., 'annual_discount_rate': 0.03, 'annual_coupon_rate': 0.04,
+                                'maturity': random_state.randint(1, 30, len(isins)).astype(float),
+                                'coupon_periodicity': 'annual'}, index=isins),
+            options=pd.DataFrame({'underlying_price': random_state.uniform(50, 150, len(isins)),
+                                  'strike_price': 100., 'rate': 0.02, 'time_to_maturity': 1., 'volatility': 0.25,
+                                  'call_put': 'call'}, index=isins))
+        pipeline = RevaluationPipeline(db_mgmt, market_data)
+        print(pipeline.run().groupby(level='type').sum())
+        pipeline.print_timings()
+        db_mgmt.engine.dispose()
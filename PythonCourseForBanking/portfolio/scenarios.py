@@ -0,0 +1,137 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from PythonCourseForBanking.portfolio.revaluation import BOND_COLUMNS, OPTION_COLUMNS
+from PythonCourseForBanking.pricing.blackscholes import BlackScholesBatchPricer
+from PythonCourseForBanking.pricing.bonds import BondBatchPricer
+
+# set in each worker process by _attach_book: the book arrays, read straight from the shared memory blocks
+_worker_state = dict()
+
+
+def _share_arrays(arrays):
+    # copies float arrays into one shared memory block, the layout is what another process needs to map them back
+    size = sum(array.nbytes for array in arrays.values())
+    block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    layout = list()
+    offset = 0
+    for key, array in arrays.items():
+        np.ndarray(array.shape, dtype=np.float64, buffer=block.buf, offset=offset)[:] = array
+        layout.append((key, array.shape, offset))
+        offset += array.nbytes
+    return block, layout
+
+
+def _map_arrays(block, layout):
+    return {key: np.ndarray(shape, dtype=np.float64, buffer=block.buf, offset=offset)
+            for key, shape, offset in layout}
+
+
+def _attach_book(book_name, book_layout, cube_name, cube_layout):
+    book = shared_memory.SharedMemory(name=book_name)
+    cube = shared_memory.SharedMemory(name=cube_name)
+    _worker_state.update(blocks=(book, cube), book=_map_arrays(book, book_layout), cube=_map_arrays(cube, cube_layout))
+
+
+def _evaluate_scenarios(start, stop):
+    evaluate_scenarios(_worker_state['book'], _worker_state['cube'], start, stop)
+    return stop - start
+
+
+def evaluate_scenarios(book, cube, start, stop):
+    # every scenario of [start, stop) against every position at once: scenarios along the rows, positions along
+    # the columns. The P&L rows are written in place into the cube.
+    spot_shock = book['spot_shock'][start:stop, None]
+    vol_shock = book['vol_shock'][start:stop, None]
+    rate_shock = book['rate_shock'][start:stop, None]
+    pnl = cube['pnl']
+
+    nb_options = book['option_quantity'].size
+    if nb_options:
+        shocked = BlackScholesBatchPricer(underlying_price=book['underlying_price'] * (1 + spot_shock),
+                                          strike_price=book['strike_price'],
+                                          rate=book['rate'] + rate_shock,
+                                          time_to_maturity=book['time_to_maturity'],
+                                          volatility=np.maximum(book['volatility'] + vol_shock, 1e-8),
+                                          call_put=book['is_call'] > 0)
+        pnl[start:stop, :nb_options] = (shocked.option_price - book['option_value']) * book['option_quantity']
+    if book['bond_quantity'].size:
+        shocked = BondBatchPricer(par_value=book['par_value'],
+                                  annual_discount_rate=book['annual_discount_rate'] + rate_shock,
+                                  annual_coupon_rate=book['annual_coupon_rate'],
+                                  maturity=book['maturity'],
+                                  coupon_periodicity=book['coupon_periodicity'])
+        pnl[start:stop, nb_options:] = (shocked.price - book['bond_value']) * book['bond_quantity']
+
+
+class ScenarioEngine:
+    # reprices an option and bond book under a grid of spot (relative), volatility and rate (absolute) shocks. The
+    # scenarios are sharded across a process pool; the book and the resulting scenarios x positions P&L cube live in
+    # shared memory, so the workers neither unpickle the book nor send their results back through pipes.
+    def __init__(self, options=None, bonds=None, max_workers=None, block_size=16):
+        self.options = pd.DataFrame(options) if options is not None else pd.DataFrame(
+            columns=OPTION_COLUMNS + ['quantity'])
+        self.bonds = pd.DataFrame(bonds) if bonds is not None else pd.DataFrame(columns=BOND_COLUMNS + ['quantity'])
+        self.max_workers = max_workers
+        self.block_size = block_size
+        self.scenarios = None
+        self.pnl = None
+
+    def _book_arrays(self, scenarios):
+        options, bonds = self.options, self.bonds
+        arrays = {column: options[column].values.astype(float) for column in OPTION_COLUMNS[:-1]}
+        arrays['is_call'] = (options['call_put'].astype(str).str.upper() == 'CALL').values.astype(float)
+        arrays['option_quantity'] = options['quantity'].values.astype(float)
+        arrays['option_value'] = BlackScholesBatchPricer(call_put=arrays['is_call'] > 0, **{
+            column: arrays[column] for column in OPTION_COLUMNS[:-1]}).option_price
+        bond_pricer = BondBatchPricer(**{column: bonds[column].values for column in BOND_COLUMNS})
+        arrays.update({column: np.asarray(getattr(bond_pricer, column), dtype=float) for column in BOND_COLUMNS})
+        arrays['bond_quantity'] = bonds['quantity'].values.astype(float)
+        arrays['bond_value'] = bond_pricer.price
+        for column in ('spot_shock', 'vol_shock', 'rate_shock'):
+            arrays[column] = scenarios[column].values.astype(float)
+        return arrays
+
+    def run(self, spot_shocks=(0.,), vol_shocks=(0.,), rate_shocks=(0.,)):
+        grid = np.meshgrid(spot_shocks, vol_shocks, rate_shocks, indexing='ij')
+        self.scenarios = pd.DataFrame({'spot_shock': grid[0].ravel(), 'vol_shock': grid[1].ravel(),
+                                       'rate_shock': grid[2].ravel()})
+        nb_scenarios = len(self.scenarios)
+        nb_positions = len(self.options) + len(self.bonds)
+        blocks = [(start, min(start + self.block_size, nb_scenarios))
+                  for start in range(0, nb_scenarios, self.block_size)]
+
+        book_block, book_layout = _share_arrays(self._book_arrays(self.scenarios))
+        cube_block, cube_layout = _share_arrays({'pnl': np.zeros((nb_scenarios, nb_positions))})
+        try:
+            if self.max_workers == 1:
+                book, cube = _map_arrays(book_block, book_layout), _map_arrays(cube_block, cube_layout)
+                for start, stop in blocks:
+                    evaluate_scenarios(book, cube, start, stop)
+                del book, cube
+            else:
+                with ProcessPoolExecutor(max_workers=self.max_workers, initializer=_attach_book,
+                                         initargs=(book_block.name, book_layout, cube_block.name,
+                                                   cube_layout)) as executor:
+                    list(executor.map(_evaluate_scenarios, *zip(*blocks)))
+            self.pnl = _map_arrays(cube_block, cube_layout)['pnl'].copy()
+        finally:
+            for block in (book_block, cube_block):
+                block.close()
+                block.unlink()
+        return self.pnl
+
+
+if __name__ == '__main__':
+    engine = ScenarioEngine(
+        options={'underlying_price': [52., 100.], 'strike_price': [50., 110.], 'rate': 0.02,
+                 'time_to_maturity': [0.3, 1.], 'volatility': [0.32, 0.2], 'call_put': ['call', 'put'],
+                 'quantity': [100., -50.]},
+        bonds={'par_value': [100.], 'annual_discount_rate': [0.05], 'annual_coupon_rate': [0.04],
+               'maturity': [10.], 'coupon_periodicity': ['annual'], 'quantity': [1000.]},
+        max_workers=2)
+    pnl = engine.run(spot_shocks=[-0.1, 0., 0.1], vol_shocks=[-0.05, 0., 0.05], rate_shocks=[-0.01, 0., 0.01])
+    print(pd.concat([engine.scenarios, pd.DataFrame(pnl, columns=['option_1', 'option_2', 'bond_1'])], axis=1))
@@ -0,0 +1,59 @@
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+from PythonCourseForBanking.benchmark.benchmark_database import make_deals, make_sqlite_database
+from PythonCourseForBanking.portfolio import revaluation
+from PythonCourseForBanking.portfolio.revaluation import MarketData, RevaluationPipeline
+
+
+class RevaluationPipelineTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.db_mgmt = make_sqlite_database(self.directory)
+        self.addCleanup(self.db_mgmt.engine.dispose)
+        self.deals = make_deals(1000)
+        self.db_mgmt.bulk_insert_deals(self.deals)
+        self.market_data = MarketData(equities=pd.DataFrame({'price': 10.}, index=self.deals['isin'].values))
+        self.nb_threads = threading.active_count()
+
+    def assert_cleaned_up(self):
+        self.assertEqual(threading.active_count(), self.nb_threads)
+        self.assertEqual(self.db_mgmt.metrics()['checked_out'], 0)
+
+    def test_run_revalues_every_deal(self):
+        pipeline = RevaluationPipeline(self.db_mgmt, self.market_data, chunk_size=100, queue_size=1)
+        result = pipeline.run()
+        self.assertEqual(pipeline.nb_deals, 1000)
+        self.assertEqual(result['quantity'].sum(), self.deals['quantity'].sum())
+        self.assert_cleaned_up()
+
+    def test_pricing_failure_is_raised_and_stops_the_reader(self):
+        with mock.patch.object(revaluation, 'price_deals', side_effect=ValueError('no curve')):
+            with self.assertRaises(ValueError):
+                RevaluationPipeline(self.db_mgmt, self.market_data, chunk_size=10, queue_size=1).run()
+        self.assert_cleaned_up()
+
+    def test_aggregation_failure_stops_the_reader_and_the_pricer(self):
+        # the priced chunks have no unpriced column, the aggregation fails on the first one while the reader is
+        # still blocked on its full queue
+        with mock.patch.object(revaluation, 'price_deals', side_effect=lambda deals, market_data: deals):
+            with self.assertRaises(KeyError):
+                RevaluationPipeline(self.db_mgmt, self.market_data, chunk_size=10, queue_size=1).run()
+        self.assert_cleaned_up()
+
+    def test_read_failure_is_raised(self):
+        pipeline = RevaluationPipeline(self.db_mgmt, self.market_data, chunk_size=10, queue_size=1,
+                                       unknown_filter=1)
+        with self.assertRaises(TypeError):
+            pipeline.run()
+        self.assert_cleaned_up()
+
+
+if __name__ == '__main__':
+    unittest.main()
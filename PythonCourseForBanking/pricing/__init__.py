@@ -0,0 +1,17 @@
+import importlib
+
+# the pricers are imported on first access, so importing the package, or a light module of it, stays cheap
+_EXPORTS = {'BlackScholesPricer': 'blackscholes', 'BlackScholesBatchPricer': 'blackscholes',
+            'BondPricer': 'bonds', 'BondBatchPricer': 'bonds', 'COUPON_PERIODICITIES': 'bonds',
+            'ImpliedVolatilitySolver': 'implied_volatility', 'MonteCarloPricer': 'montecarlo',
+            'norm_cdf': 'normal', 'norm_pdf': 'normal', 'YieldCurve': 'curves'}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError('module %r has no attribute %r' % (__name__, name))
+    value = getattr(importlib.import_module('.' + _EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,108 @@
+import threading
+import time
+
+
+class _PendingRequest:
+    __slots__ = ('params', 'lead', 'result', 'error', 'done')
+
+    def __init__(self, params):
+        self.params = params
+        self.lead = False
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class MicroBatcher:
+    # coalesces the requests of concurrent threads into one call of price_batch(list of params), which returns one
+    # result (or exception) per params. The first request of a batch leads it: it waits up to window seconds for
+    # others to join, or until max_batch_size of them have, prices them all and hands each its result. Requests
+    # arriving meanwhile start the next batch, and the requests left over by a full batch are led by the first of
+    # them. There is no background thread, so a batcher survives a fork.
+    # concurrency, when given, returns the number of requests the process is serving (see InFlightRequests): the
+    # leader stops waiting once that many have joined, so a request alone is priced at once.
+    def __init__(self, price_batch, window=0.002, max_batch_size=256, clock=time.monotonic, concurrency=None):
+        self.price_batch = price_batch
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.clock = clock
+        self.concurrency = concurrency
+        self.condition = threading.Condition()
+        self.pending = list()
+        self.nb_batches = 0
+        self.nb_requests = 0
+
+    def submit(self, params):
+        request = _PendingRequest(params)
+        with self.condition:
+            self.pending.append(request)
+            request.lead = len(self.pending) == 1
+            if not request.lead:
+                self.condition.notify()
+        while True:
+            if request.lead:
+                request.lead = False
+                self._lead()
+            request.done.wait()
+            if not request.lead:
+                break
+            request.done.clear()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _lead(self):
+        deadline = self.clock() + self.window
+        with self.condition:
+            while len(self.pending) < self._target_size():
+                remaining = deadline - self.clock()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            batch, self.pending = self.pending[:self.max_batch_size], self.pending[self.max_batch_size:]
+            self.nb_batches += 1
+            self.nb_requests += len(batch)
+            if self.pending:
+                self.pending[0].lead = True
+                self.pending[0].done.set()
+        try:
+            results = self.price_batch([request.params for request in batch])
+        except Exception as e:
+            results = [e] * len(batch)
+        for request, result in zip(batch, results):
+            if isinstance(result, Exception):
+                request.error = result
+            else:
+                request.result = result
+            request.done.set()
+
+    def _target_size(self):
+        if self.concurrency is None:
+            return self.max_batch_size
+        return min(self.max_batch_size, self.concurrency())
+
+    def stats(self):
+        with self.condition:
+            return {'batches': self.nb_batches, 'requests': self.nb_requests,
+                    'mean_batch_size': self.nb_requests / self.nb_batches if self.nb_batches else 0.,
+                    'window': self.window, 'max_batch_size': self.max_batch_size}
+
+
+class InFlightRequests:
+    # WSGI middleware counting the requests the process is serving, for MicroBatcher(concurrency=...)
+    def __init__(self, app):
+        self.app = app
+        self.in_flight = 0
+        self.lock = threading.Lock()
+
+    def count(self):
+        return self.in_flight
+
+    def __call__(self, environ, start_response):
+        with self.lock:
+            self.in_flight += 1
+        try:
+            return self.app(environ, start_response)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
@@ -0,0 +1,102 @@
+import math
+
+import numpy as np
+
+from PythonCourseForBanking.pricing.normal import norm_cdf, norm_pdf
+from PythonCourseForBanking.pricing.metrics import stage
+
+
+class BlackScholesBatchPricer:
+    # prices a whole book at once: every input can be a scalar or an array, they are broadcast together
+    columns = ['option_price', 'delta', 'gamma', 'theta', 'rho', 'vega']
+
+    def __init__(self, underlying_price, strike_price, rate, time_to_maturity, volatility, call_put='call'):
+        self.underlying_price, self.strike_price, self.rate, self.time_to_maturity, self.volatility = \
+            np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in
+                                  (underlying_price, strike_price, rate, time_to_maturity, volatility)])
+        self.sign = self._get_sign(call_put, self.underlying_price.shape)
+        self.d1, self.d2 = self._calculate_d1_d2()
+        self.option_price, self.delta, self.gamma, self.theta, self.rho, self.vega = self.get_price_and_greeks()
+
+    def __len__(self):
+        return self.option_price.size
+
+    @classmethod
+    def from_dataframe(cls, df):
+        return cls(underlying_price=df['underlying_price'].values,
+                   strike_price=df['strike_price'].values,
+                   rate=df['rate'].values,
+                   time_to_maturity=df['time_to_maturity'].values,
+                   volatility=df['volatility'].values,
+                   call_put=df['call_put'].values if 'call_put' in df else 'call')
+
+    @staticmethod
+    def _get_sign(call_put, shape):
+        # +1 for a call, -1 for a put, nan for anything else; booleans are read as is_call flags
+        call_put = np.asarray(call_put)
+        if call_put.dtype == bool:
+            sign = np.where(call_put, 1.0, -1.0)
+        else:
+            call_put = np.char.upper(call_put.astype(str))
+            sign = np.where(call_put == 'CALL', 1.0, np.where(call_put == 'PUT', -1.0, np.nan))
+        return np.broadcast_to(sign, shape)
+
+    def _calculate_d1_d2(self):
+        self.sqrt_time = np.sqrt(self.time_to_maturity)
+        vol_sqrt_time = self.volatility * self.sqrt_time
+        with np.errstate(divide='ignore', invalid='ignore'):
+            d1 = (np.log(self.underlying_price / self.strike_price) + (
+                self.rate + self.volatility * self.volatility / 2) * self.time_to_maturity) / vol_sqrt_time
+        d2 = d1 - vol_sqrt_time
+        return d1, d2
+
+    def get_price_and_greeks(self):
+        # the terms shared by the price and the greeks are only evaluated once per array
+        discounted_strike = self.strike_price * np.exp(-self.rate * self.time_to_maturity)
+        pdf_d1 = norm_pdf(self.d1)
+        # N(d) for a call, N(-d) for a put
+        with stage('norm_cdf'):
+            cdf_d1 = norm_cdf(self.sign * self.d1)
+            cdf_d2 = norm_cdf(self.sign * self.d2)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result_price = self.sign * (self.underlying_price * cdf_d1 - discounted_strike * cdf_d2)
+            delta = self.sign * cdf_d1
+            gamma = pdf_d1 / (self.underlying_price * self.volatility * self.sqrt_time)
+            theta = -((self.underlying_price * pdf_d1 * self.volatility) / (2 * self.sqrt_time) -
+                      self.sign * self.rate * discounted_strike * cdf_d2) / 365
+            rho = self.sign * 0.01 * self.time_to_maturity * discounted_strike * cdf_d2
+            vega = 0.01 * self.underlying_price * self.sqrt_time * pdf_d1
+        return result_price, delta, gamma, theta, rho, vega
+
+    def to_dict(self):
+        return {column: getattr(self, column) for column in self.columns}
+
+    def to_dataframe(self):
+        import pandas as pd
+        return pd.DataFrame({column: np.ravel(getattr(self, column)) for column in self.columns})
+
+
+class BlackScholesPricer:
+    # scalar interface kept for the web pages, the computation is delegated to BlackScholesBatchPricer
+    def __init__(self, underlying_price, strike_price, rate, time_to_maturity, volatility, call_put='call'):
+        self.underlying_price = underlying_price
+        self.strike_price = strike_price
+        self.rate = rate
+        self.time_to_maturity = time_to_maturity
+        self.volatility = volatility
+        self.call_put = call_put
+        self._batch = BlackScholesBatchPricer(underlying_price, strike_price, rate, time_to_maturity, volatility,
+                                              call_put)
+        self.d1, self.d2 = float(self._batch.d1), float(self._batch.d2)
+        self.option_price, self.delta, self.gamma, self.theta, self.rho, self.vega = self.get_price_and_greeks()
+
+    def __str__(self):
+        return ('result_price = ' + str(self.option_price) + ', delta = ' + str(self.delta) + ', gamma = ' + str(
+            self.gamma) + ', theta = ' + str(self.theta) + ', rho = ' + str(self.rho) + ', vega = ' + str(self.vega))
+
+    def get_price_and_greeks(self):
+        values = [float(getattr(self._batch, column)) for column in BlackScholesBatchPricer.columns]
+        # an unknown option type leaves the price, delta, theta and rho undefined (None), as before
+        return tuple(None if math.isnan(value) else value for value in values)
+
@@ -0,0 +1,364 @@
+import numpy as np
+from flask import Blueprint, Response, json, jsonify, request
+
+from PythonCourseForBanking.pricing.batching import MicroBatcher
+from PythonCourseForBanking.pricing.blackscholes import BlackScholesBatchPricer, BlackScholesPricer
+from PythonCourseForBanking.pricing.bonds import COUPON_PERIODICITIES, BondBatchPricer, BondPricer, \
+    price_bond_schedules
+from PythonCourseForBanking.pricing.cache import PricingCache
+from PythonCourseForBanking.pricing.curves import CurveRegistry, YieldCurve
+from PythonCourseForBanking.pricing.implied_volatility import ImpliedVolatilitySolver
+from PythonCourseForBanking.pricing.metrics import stage
+from PythonCourseForBanking.pricing.payload import PayloadError, read_columns, stream_columns
+
+# the pricing API, shared by the website and the standalone blackscholes app
+options_blueprint = Blueprint('options', __name__)
+bonds_blueprint = Blueprint('bonds', __name__)
+# the pages send the same parameter sets over and over, their serialized results are kept here
+pricing_cache = PricingCache()
+# bound the time a single request can spend simulating
+MAX_MONTECARLO_PATHS = 1000000
+MAX_MONTECARLO_STEPS = 5000
+# the curves bonds can be priced off by name, each keeps its discount factor grid between requests. In this process
+# only unless share_curves gives them a directory, as wsgi.py does for its workers
+yield_curves = CurveRegistry()
+# set by enable_micro_batching: concurrent /price_with_blackscholes and /price_bonds requests are then priced
+# together, see price_options_coalesced and price_bonds_coalesced
+option_batcher = None
+bond_batcher = None
+
+
+def price_bond(par_value, annual_discount_rate, annual_coupon_rate, maturity, coupon_periodicity, curve=None):
+    # a ValueError for inputs the bond cannot be priced at (a discount rate of -100%, an overflowing schedule): the
+    # routes answer it with a 400, whether the bond was priced alone or in a batch
+    if coupon_periodicity not in COUPON_PERIODICITIES:
+        raise ValueError('coupon_periodicity must be one of %s' % ', '.join(sorted(COUPON_PERIODICITIES)))
+    with stage('bond_pricer'), np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        try:
+            bond_pricer = BondPricer(par_value=par_value, annual_discount_rate=annual_discount_rate,
+                                     annual_coupon_rate=annual_coupon_rate, maturity=maturity,
+                                     coupon_periodicity=coupon_periodicity, curve=curve)
+        except (ZeroDivisionError, OverflowError):
+            bond_pricer = None
+    if bond_pricer is None or not np.isfinite([bond_pricer.price, bond_pricer.sensitivity,
+                                               bond_pricer.convexity]).all() or \
+            not np.isfinite(bond_pricer.present_values).all():
+        raise ValueError('the bond has no finite price at these inputs')
+    with stage('dataframe'):
+        coupons = bond_pricer.coupons[['Period', 'Payment', 'PresentValue']].to_dict(orient='records')
+    return dict(price=round(bond_pricer.price, 2),
+                coupons=coupons,
+                sensitivity=round(bond_pricer.sensitivity, 4),
+                convexity=round(bond_pricer.convexity, 4))
+
+
+def price_option(underlying_price, strike_price, rate, time_to_maturity, volatility, call_put):
+    with stage('option_pricer'):
+        bsp = BlackScholesPricer(underlying_price=underlying_price,
+                                 strike_price=strike_price,
+                                 rate=rate,
+                                 time_to_maturity=time_to_maturity,
+                                 volatility=volatility,
+                                 call_put=call_put)
+    return dict(option_price=round(bsp.option_price, 5),
+                delta=round(bsp.delta, 5),
+                gamma=round(bsp.gamma, 5),
+                theta=round(bsp.theta, 5),
+                rho=round(bsp.rho, 5),
+                vega=round(bsp.vega, 5))
+
+
+def serialize(result):
+    with stage('serialize'):
+        return json.dumps(result)
+
+
+def _price_individually(price, params):
+    try:
+        return serialize(price(**params))
+    except Exception as e:
+        return e
+
+
+def price_options_coalesced(params_list):
+    # the bodies of price_option for a list of requests, from one batch pricing. A request whose results are not
+    # all defined (unknown option type, degenerate inputs) goes through price_option alone, so it gets exactly the
+    # response, or error, it would have got without batching
+    with stage('option_batch_pricer'):
+        book = BlackScholesBatchPricer(**{column: [params[column] for params in params_list] for column in
+                                          ('underlying_price', 'strike_price', 'rate', 'time_to_maturity',
+                                           'volatility', 'call_put')})
+        columns = [np.ravel(getattr(book, column)).tolist() for column in BlackScholesBatchPricer.columns]
+    bodies = list()
+    for i, params in enumerate(params_list):
+        values = [column[i] for column in columns]
+        if not np.isfinite(values).all():
+            bodies.append(_price_individually(price_option, params))
+        else:
+            bodies.append(serialize(dict(zip(BlackScholesBatchPricer.columns, [round(value, 5)
+                                                                               for value in values]))))
+    return bodies
+
+
+def _price_bond_group(params_list, periods):
+    columns = {column: [params[column] for params in params_list]
+               for column in ('par_value', 'annual_discount_rate', 'annual_coupon_rate', 'maturity')}
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        results = price_bond_schedules(
+            coupon_periodicity=[COUPON_PERIODICITIES[params['coupon_periodicity']] for params in params_list],
+            periods=periods, **columns)
+    # a bond with any result not finite gets no body here, see price_bonds_coalesced
+    finite = np.isfinite(results[1]).all(axis=1) & np.isfinite(np.vstack(results[2:])).all(axis=0)
+    payment, present_values, price, sensitivity, convexity = [result.tolist() for result in results]
+    bodies = list()
+    for i, payment_value in enumerate(payment):
+        if not finite[i]:
+            bodies.append(None)
+            continue
+        coupons = [{'Period': period, 'Payment': payment_value, 'PresentValue': present_value}
+                   for period, present_value in zip(periods.tolist(), present_values[i])]
+        bodies.append(serialize(dict(price=round(price[i], 2), coupons=coupons,
+                                     sensitivity=round(sensitivity[i], 4), convexity=round(convexity[i], 4))))
+    return bodies
+
+
+def price_bonds_coalesced(params_list):
+    # the bodies of price_bond for a list of requests, grouped by coupon schedule; an unknown periodicity or a
+    # result that is not finite goes through price_bond alone, as for the options, and gets its ValueError
+    bodies = [None] * len(params_list)
+    groups = dict()
+    with stage('bond_batch_pricer'):
+        for i, params in enumerate(params_list):
+            if params['coupon_periodicity'] not in COUPON_PERIODICITIES:
+                continue
+            periods = np.arange(1, 1 + params['maturity'] * COUPON_PERIODICITIES[params['coupon_periodicity']])
+            groups.setdefault(periods.size, (periods, list()))[1].append(i)
+        for periods, rows in groups.values():
+            for i, body in zip(rows, _price_bond_group([params_list[i] for i in rows], periods)):
+                bodies[i] = body
+    for i, params in enumerate(params_list):
+        if bodies[i] is None:
+            bodies[i] = _price_individually(price_bond, params)
+    return bodies
+
+
+def enable_micro_batching(window=0.002, max_batch_size=256, concurrency=None):
+    global option_batcher, bond_batcher
+    option_batcher = MicroBatcher(price_options_coalesced, window=window, max_batch_size=max_batch_size,
+                                  concurrency=concurrency)
+    bond_batcher = MicroBatcher(price_bonds_coalesced, window=window, max_batch_size=max_batch_size,
+                                concurrency=concurrency)
+
+
+def share_curves(directory):
+    global yield_curves
+    yield_curves = CurveRegistry(directory)
+
+
+def preload_pricers():
+    # imports and warms up everything the pricing routes use (scipy, pandas, the numpy kernels), so the workers
+    # forked afterwards share it and none of them pays for it on its first request
+    from PythonCourseForBanking.pricing.montecarlo import MonteCarloPricer  # noqa: F401
+    option = dict(underlying_price=100., strike_price=100., rate=0.01, time_to_maturity=1., volatility=0.2,
+                  call_put='call')
+    bond = dict(par_value=1000., annual_discount_rate=0.05, annual_coupon_rate=0.04, maturity=10.,
+                coupon_periodicity='annual')
+    price_option(**option)
+    price_bond(**bond)
+    price_options_coalesced([option])
+    price_bonds_coalesced([bond])
+
+
+@bonds_blueprint.route('/price_bonds')
+def price_bonds():
+    with stage('parse'):
+        params = dict(par_value=request.args.get('par_value', 0, type=float),
+                      annual_discount_rate=request.args.get('annual_discount_rate', 0, type=float),
+                      annual_coupon_rate=request.args.get('annual_coupon_rate', 0, type=float),
+                      maturity=request.args.get('maturity', 0, type=float),
+                      coupon_periodicity=request.args.get('coupon_periodicity', 0, type=str))
+        curve_name = request.args.get('curve', None, type=str)
+    try:
+        if curve_name is None:
+            batcher = bond_batcher
+            body = pricing_cache.get_or_compute('price_bonds', params, lambda: serialize(price_bond(**params))
+                                                if batcher is None else batcher.submit(params))
+            return Response(body, mimetype='application/json')
+        curve = yield_curves.get(curve_name)
+        if curve is None:
+            return jsonify(error='unknown curve %s' % curve_name), 404
+        # a bumped curve has a new version, so its results are never served from before the bump
+        key_params = dict(params, curve=curve_name, curve_version=curve.version)
+        body = pricing_cache.get_or_compute('price_bonds', key_params,
+                                            lambda: serialize(price_bond(curve=curve, **params)))
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    return Response(body, mimetype='application/json')
+
+
+@options_blueprint.route('/price_with_blackscholes')
+def price_with_blackscholes():
+    with stage('parse'):
+        params = dict(underlying_price=request.args.get('underlying_price', 0, type=float),
+                      strike_price=request.args.get('strike_price', 0, type=float),
+                      rate=request.args.get('rate', 0, type=float),
+                      time_to_maturity=request.args.get('time_to_maturity', 0, type=float),
+                      volatility=request.args.get('volatility', 0, type=float),
+                      call_put=request.args.get('call_put', 0, type=str))
+    batcher = option_batcher
+    body = pricing_cache.get_or_compute('price_with_blackscholes', params,
+                                        lambda: serialize(price_option(**params))
+                                        if batcher is None else batcher.submit(params))
+    return Response(body, mimetype='application/json')
+
+
+@bonds_blueprint.route('/price_bonds/batch', methods=['POST'])
+def price_bonds_batch_route():
+    curve_name = request.args.get('curve', None, type=str)
+    curve = yield_curves.get(curve_name) if curve_name is not None else None
+    if curve_name is not None and curve is None:
+        return jsonify(error='unknown curve %s' % curve_name), 404
+    try:
+        with stage('parse'):
+            # the discount rate column is not needed when the book is priced off a curve
+            bonds = read_columns(request, ['par_value', 'annual_discount_rate', 'annual_coupon_rate', 'maturity',
+                                           'coupon_periodicity'],
+                                 defaults={'annual_discount_rate': np.nan} if curve is not None else None)
+    except PayloadError as e:
+        return jsonify(error=str(e)), 400
+    try:
+        with stage('bond_batch_pricer'):
+            book = BondBatchPricer(curve=curve, **bonds)
+    except (ValueError, TypeError) as e:
+        # columns of different lengths or values that are not numbers
+        return jsonify(error=str(e)), 400
+    unknown = np.flatnonzero(np.isnan(book.coupon_periodicity.ravel()))
+    if unknown.size:
+        return jsonify(error='unknown or missing coupon_periodicity in rows %s, expected one of %s' % (
+            ', '.join(str(row) for row in unknown[:10]), ', '.join(COUPON_PERIODICITIES))), 400
+    return Response(stream_columns(book.to_dict(), decimals=4), mimetype='application/json')
+
+
+@options_blueprint.route('/price_with_blackscholes/batch', methods=['POST'])
+def price_with_blackscholes_batch():
+    try:
+        with stage('parse'):
+            options = read_columns(request, ['underlying_price', 'strike_price', 'rate', 'time_to_maturity',
+                                             'volatility', 'call_put'], defaults={'call_put': 'call'})
+    except PayloadError as e:
+        return jsonify(error=str(e)), 400
+    try:
+        with stage('option_batch_pricer'):
+            book = BlackScholesBatchPricer(**options)
+    except (ValueError, TypeError) as e:
+        return jsonify(error=str(e)), 400
+    return Response(stream_columns(book.to_dict(), decimals=5), mimetype='application/json')
+
+
+@options_blueprint.route('/price_with_montecarlo')
+def price_with_montecarlo():
+    # the process pool behind it is only imported once a simulation is asked for
+    from PythonCourseForBanking.pricing.montecarlo import MonteCarloPricer
+    try:
+        mcp = MonteCarloPricer(underlying_price=request.args.get('underlying_price', 0, type=float),
+                               strike_price=request.args.get('strike_price', 0, type=float),
+                               rate=request.args.get('rate', 0, type=float),
+                               time_to_maturity=request.args.get('time_to_maturity', 0, type=float),
+                               volatility=request.args.get('volatility', 0, type=float),
+                               call_put=request.args.get('call_put', 'call', type=str),
+                               payoff=request.args.get('payoff', 'asian', type=str),
+                               barrier=request.args.get('barrier', None, type=float),
+                               barrier_type=request.args.get('barrier_type', 'up_and_out', type=str),
+                               nb_paths=min(request.args.get('nb_paths', 100000, type=int), MAX_MONTECARLO_PATHS),
+                               nb_steps=min(request.args.get('nb_steps', 252, type=int), MAX_MONTECARLO_STEPS),
+                               seed=request.args.get('seed', 0, type=int))
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    return jsonify(option_price=round(mcp.option_price, 5),
+                   standard_error=round(mcp.standard_error, 5),
+                   nb_paths=mcp.nb_paths,
+                   nb_steps=mcp.params['nb_steps'])
+
+
+@options_blueprint.route('/implied_volatility_with_blackscholes')
+def implied_volatility_with_blackscholes():
+    option_price = request.args.get('option_price', 0, type=float)
+    underlying_price = request.args.get('underlying_price', 0, type=float)
+    strike_price = request.args.get('strike_price', 0, type=float)
+    rate = request.args.get('rate', 0, type=float)
+    time_to_maturity = request.args.get('time_to_maturity', 0, type=float)
+    call_put = request.args.get('call_put', 0, type=str)
+    solver = ImpliedVolatilitySolver(option_price=option_price,
+                                     underlying_price=underlying_price,
+                                     strike_price=strike_price,
+                                     rate=rate,
+                                     time_to_maturity=time_to_maturity,
+                                     call_put=call_put)
+    volatility = float(solver.volatility)
+    return jsonify(volatility=None if np.isnan(volatility) else round(volatility, 5),
+                   converged=bool(solver.converged),
+                   iterations=int(solver.iterations))
+
+
+@options_blueprint.route('/implied_volatility_with_blackscholes/batch', methods=['POST'])
+def implied_volatility_with_blackscholes_batch():
+    try:
+        chain = read_columns(request, ['option_price', 'underlying_price', 'strike_price', 'rate',
+                                       'time_to_maturity', 'call_put'], defaults={'call_put': 'call'})
+    except PayloadError as e:
+        return jsonify(error=str(e)), 400
+    tolerance = request.args.get('tolerance', 1e-8, type=float)
+    max_iterations = request.args.get('max_iterations', 100, type=int)
+    try:
+        solver = ImpliedVolatilitySolver(tolerance=tolerance, max_iterations=max_iterations, **chain)
+    except (ValueError, TypeError) as e:
+        return jsonify(error=str(e)), 400
+    results = {'volatility': solver.volatility, 'converged': solver.converged.astype(float),
+               'iterations': solver.iterations}
+    return Response(stream_columns(results, decimals=8), mimetype='application/json')
+
+
+@bonds_blueprint.route('/curves/<name>', methods=['POST'])
+def build_curve(name):
+    # either pillars: {"times", "zero_rates", "compounding"}, or quotes to bootstrap: {"deposits", "swaps", "bonds"}
+    # as lists of tuples, see YieldCurve.bootstrap; "interpolation" is one of linear, cubic or log_df
+    definition = request.get_json(force=True, silent=True)
+    if not isinstance(definition, dict):
+        return jsonify(error='the body must be a JSON object'), 400
+    interpolation = definition.get('interpolation', 'log_df')
+    try:
+        if 'times' in definition:
+            curve = YieldCurve(definition['times'], definition.get('zero_rates', []), interpolation=interpolation,
+                               compounding=definition.get('compounding', 'annual'))
+        else:
+            curve = YieldCurve.bootstrap(deposits=definition.get('deposits', ()), swaps=definition.get('swaps', ()),
+                                         bonds=definition.get('bonds', ()), interpolation=interpolation)
+    except (ValueError, TypeError, IndexError) as e:
+        return jsonify(error=str(e)), 400
+    yield_curves.put(name, curve)
+    return jsonify(name=name, version=curve.version, **curve.to_dict())
+
+
+@bonds_blueprint.route('/curves/<name>')
+def get_curve(name):
+    curve = yield_curves.get(name)
+    if curve is None:
+        return jsonify(error='unknown curve %s' % name), 404
+    return jsonify(name=name, version=curve.version, **curve.to_dict())
+
+
+@bonds_blueprint.route('/curves/<name>/bump', methods=['POST'])
+def bump_curve(name):
+    # {"shift": 0.0001} moves the whole curve, {"shift": 0.0001, "pillar": 3} only the zero rate of that pillar
+    bump = request.get_json(force=True, silent=True) or dict()
+    try:
+        shift = float(bump['shift'])
+        pillar = None if bump.get('pillar') is None else int(bump['pillar'])
+        # applied to the latest version of the curve, whichever worker wrote it
+        curve = yield_curves.update(name, lambda curve: curve.bump_parallel(shift) if pillar is None
+                                    else curve.bump_key_rate(pillar, shift))
+    except (KeyError, ValueError, TypeError, IndexError) as e:
+        return jsonify(error='invalid bump: %s' % e), 400
+    if curve is None:
+        return jsonify(error='unknown curve %s' % name), 404
+    return jsonify(name=name, version=curve.version, **curve.to_dict())
@@ -0,0 +1,199 @@
+import numpy as np
+
+COUPON_PERIODICITIES = {'no_coupon': 0, 'monthly': 12, 'quarterly': 4, 'semi_annual': 2, 'annual': 1}
+
+
+def _calculate_present_values(payment, discount_factors):
+    # each coupon rounded to the cent as in the coupon schedule
+    return np.round(payment * discount_factors, 2)
+
+
+def _flat_discount_factors(annual_discount_rate, periods):
+    # one discount factor vector per bond
+    return (1 + annual_discount_rate) ** -periods
+
+
+def _curve_payments(payment, coupon_periodicity):
+    # at a flat rate the engine pays the annual coupon every period and discounts period k at (1 + r) ** -k. Off a
+    # curve the coupons are market ones: annual coupon / periodicity, paid every 1 / periodicity years
+    coupon_periodicity = np.asarray(coupon_periodicity, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(coupon_periodicity > 0, payment / coupon_periodicity, 0.)
+
+
+def _curve_discount_factors(curve, periods, coupon_periodicity):
+    # the coupon of period k is paid k / coupon_periodicity years from now, on the monthly grid of the curve for
+    # every periodicity; the factors are computed once per distinct periodicity and shared by the bonds that have it
+    coupon_periodicity = np.asarray(coupon_periodicity, dtype=float)
+    periodicities, inverse = np.unique(np.nan_to_num(coupon_periodicity.ravel()), return_inverse=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        times = np.where(periodicities[:, None] > 0, periods / periodicities[:, None], 0.)
+    return curve.discount_factors(times)[inverse].reshape(coupon_periodicity.shape + periods.shape)
+
+
+def _calculate_price_and_trading_indicators(present_values, periods, redemption_value, annual_discount_rate,
+                                            coupon_periodicity):
+    # works on one bond (1d cash flows) or on a matrix of bonds (one row per bond)
+    weighted_present_value = (present_values * periods).sum(axis=-1)
+    price = present_values.sum(axis=-1) + redemption_value
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sensitivity = np.where(coupon_periodicity > 0,
+                               weighted_present_value / coupon_periodicity / price / (1 + annual_discount_rate), 0.)
+        convexity = np.where(coupon_periodicity > 0,
+                             weighted_present_value / (coupon_periodicity * coupon_periodicity + coupon_periodicity) /
+                             price, 0.)
+    return price, sensitivity, convexity
+
+
+def price_bond_schedules(par_value, annual_discount_rate, annual_coupon_rate, maturity, coupon_periodicity, periods):
+    # bonds sharing the same coupon periods, priced with the operations of BondPricer so the results are the same to
+    # the last bit (the padding of BondBatchPricer changes the order of the sums): the coupon payments, the present
+    # values (one row per bond), the prices, the sensitivities and the convexities
+    par_value, annual_discount_rate, annual_coupon_rate, maturity, coupon_periodicity = \
+        [np.asarray(x, dtype=float) for x in (par_value, annual_discount_rate, annual_coupon_rate, maturity,
+                                              coupon_periodicity)]
+    payment = par_value * annual_coupon_rate
+    present_values = _calculate_present_values(payment[:, None],
+                                               _flat_discount_factors(annual_discount_rate[:, None], periods))
+    redemption_value = par_value / ((1 + annual_discount_rate) ** maturity)
+    return (payment, present_values) + _calculate_price_and_trading_indicators(
+        present_values, periods, redemption_value, annual_discount_rate, coupon_periodicity)
+
+
+class BondPricer:
+    # discounted at the flat annual_discount_rate, or off a YieldCurve when one is given; annual_discount_rate is
+    # then the curve zero rate at maturity, the rate the sensitivity is expressed against
+    def __init__(self, par_value, annual_discount_rate, annual_coupon_rate, maturity, coupon_periodicity, curve=None):
+        self.par_value = par_value
+        self.annual_coupon_rate = annual_coupon_rate
+        self.maturity = maturity
+        self.curve = curve
+        self.coupon_periodicity = self._get_coupon_periodicity(coupon_periodicity)
+        self.nb_coupons = self.maturity * self.coupon_periodicity
+        self.periods = np.arange(1, 1 + self.nb_coupons)
+        self.payment = self.par_value * self.annual_coupon_rate
+        if curve is None:
+            self.annual_discount_rate = annual_discount_rate
+            discount_factors = _flat_discount_factors(self.annual_discount_rate, self.periods)
+            self.redemption_value = self.par_value / ((1 + self.annual_discount_rate) ** self.maturity)
+        else:
+            self.annual_discount_rate = float(curve.zero_rates_at(self.maturity))
+            self.payment = float(_curve_payments(self.payment, self.coupon_periodicity))
+            discount_factors = _curve_discount_factors(curve, self.periods, self.coupon_periodicity)
+            self.redemption_value = self.par_value * float(curve.discount_factors(self.maturity))
+        self.present_values = _calculate_present_values(self.payment, discount_factors)
+        self._coupons = None
+        self.price, self.sensitivity, self.convexity = self._calculate_price_and_trading_indicators()
+
+    @staticmethod
+    def _get_coupon_periodicity(coupon_periodicity):
+        if coupon_periodicity in COUPON_PERIODICITIES.keys():
+            return COUPON_PERIODICITIES[coupon_periodicity]
+        else:
+            return None
+
+    @property
+    def coupons(self):
+        # the per-coupon schedule is only built when a caller asks for it
+        if self._coupons is None:
+            import pandas as pd
+            self._coupons = pd.DataFrame({'Period': self.periods,
+                                          'Payment': np.full(self.periods.size, self.payment),
+                                          'PresentValue': self.present_values},
+                                         columns=['Period', 'Payment', 'PresentValue'])
+        return self._coupons
+
+    def _calculate_price_and_trading_indicators(self):
+        price, sensitivity, convexity = _calculate_price_and_trading_indicators(
+            self.present_values, self.periods, self.redemption_value, self.annual_discount_rate,
+            self.coupon_periodicity)
+        return float(price), float(sensitivity), float(convexity)
+
+
+class BondBatchPricer:
+    # prices a matrix of bonds: schedules of different lengths are zero-padded up to the longest one of each chunk.
+    # With a curve, annual_discount_rate is ignored and replaced by the curve zero rate at each maturity, and the
+    # coupons are timed and sized as market ones, see _curve_payments.
+    columns = ['price', 'sensitivity', 'convexity']
+
+    def __init__(self, par_value, annual_discount_rate, annual_coupon_rate, maturity, coupon_periodicity,
+                 chunk_size=10000, curve=None):
+        self.curve = curve
+        if curve is not None:
+            annual_discount_rate = np.nan
+        self.par_value, self.annual_discount_rate, self.annual_coupon_rate, self.maturity, self.coupon_periodicity = \
+            np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in
+                                  (par_value, annual_discount_rate, annual_coupon_rate, maturity,
+                                   self._get_coupon_periodicity(coupon_periodicity))])
+        if curve is None:
+            self.redemption_value = self.par_value / ((1 + self.annual_discount_rate) ** self.maturity)
+        else:
+            self.annual_discount_rate = curve.zero_rates_at(self.maturity)
+            self.redemption_value = self.par_value * curve.discount_factors(self.maturity)
+        self.nb_coupons = self.maturity * self.coupon_periodicity
+        self.payment = self.par_value * self.annual_coupon_rate
+        if curve is not None:
+            self.payment = _curve_payments(self.payment, self.coupon_periodicity)
+        self.chunk_size = chunk_size
+        self.price, self.sensitivity, self.convexity = self._calculate_price_and_trading_indicators()
+
+    def __len__(self):
+        return self.price.size
+
+    @staticmethod
+    def _get_coupon_periodicity(coupon_periodicity):
+        # numbers of coupons per year are used as is, names are mapped once per distinct value, unknown ones give nan
+        coupon_periodicity = np.asarray(coupon_periodicity)
+        if coupon_periodicity.dtype.kind in 'iuf':
+            return coupon_periodicity.astype(float)
+        names, inverse = np.unique(coupon_periodicity.astype(str), return_inverse=True)
+        values = np.array([COUPON_PERIODICITIES.get(name, np.nan) for name in names], dtype=float)
+        return values[inverse].reshape(coupon_periodicity.shape)
+
+    def _calculate_price_and_trading_indicators(self):
+        nb_bonds = self.par_value.size
+        nb_coupons = np.nan_to_num(self.nb_coupons.ravel())
+        results = [np.full(nb_bonds, np.nan) for _ in self.columns]
+        # sorting by schedule length keeps the padding of each chunk small
+        order = np.argsort(nb_coupons, kind='stable')
+        for start in range(0, nb_bonds, self.chunk_size):
+            rows = order[start:start + self.chunk_size]
+            periods = np.arange(1, 1 + max(nb_coupons[rows].max(), 0))
+            cash_flow_mask = periods < 1 + nb_coupons[rows, None]
+            if self.curve is None:
+                discount_factors = _flat_discount_factors(self.annual_discount_rate.ravel()[rows, None], periods)
+            else:
+                discount_factors = _curve_discount_factors(self.curve, periods, self.coupon_periodicity.ravel()[rows])
+            present_values = np.where(cash_flow_mask, _calculate_present_values(
+                self.payment.ravel()[rows, None], discount_factors), 0.)
+            chunk_results = _calculate_price_and_trading_indicators(
+                present_values, periods, self.redemption_value.ravel()[rows], self.annual_discount_rate.ravel()[rows],
+                self.coupon_periodicity.ravel()[rows])
+            for result, chunk_result in zip(results, chunk_results):
+                result[rows] = chunk_result
+        unknown_periodicity = np.isnan(self.coupon_periodicity.ravel())
+        for result in results:
+            result[unknown_periodicity] = np.nan
+        return tuple(result.reshape(self.par_value.shape) for result in results)
+
+    def to_dict(self):
+        return {column: getattr(self, column) for column in self.columns}
+
+    def to_dataframe(self):
+        import pandas as pd
+        return pd.DataFrame({column: np.ravel(getattr(self, column)) for column in self.columns})
+
+
+if __name__ == '__main__':
+    bond_pricer = BondPricer(par_value=1000, annual_discount_rate=0.05, annual_coupon_rate=0.04, maturity=10,
+                             coupon_periodicity='annual')
+    print(bond_pricer.price, bond_pricer.sensitivity, bond_pricer.convexity)
+    print(bond_pricer.coupons)
+    book = BondBatchPricer(par_value=1000, annual_discount_rate=[0.03, 0.05], annual_coupon_rate=0.04,
+                           maturity=[5, 30], coupon_periodicity=['semi_annual', 'annual'])
+    print(book.to_dataframe())
+    # the same book off a bootstrapped curve
+    from PythonCourseForBanking.pricing.curves import YieldCurve
+    curve = YieldCurve.bootstrap(deposits=[(0.5, 0.03)], swaps=[(2, 0.035), (5, 0.04), (10, 0.045), (30, 0.05)])
+    print(BondBatchPricer(par_value=1000, annual_discount_rate=None, annual_coupon_rate=0.04, maturity=[5, 30],
+                          coupon_periodicity=['semi_annual', 'annual'], curve=curve).to_dataframe())
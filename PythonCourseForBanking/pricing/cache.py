@@ -0,0 +1,88 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class PricingCache:
+    # bounded LRU cache of serialized pricing results, keyed on the normalized and rounded pricer inputs
+    def __init__(self, max_bytes=16 * 1024 * 1024, ttl=3600, significant_digits=10, clock=time.monotonic):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.significant_digits = significant_digits
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.nb_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _normalize(self, value):
+        if isinstance(value, float):
+            return float('%.*g' % (self.significant_digits, value))
+        return value
+
+    def make_key(self, name, params):
+        return (name,) + tuple((param, self._normalize(params[param])) for param in sorted(params))
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and self.clock() - entry[1] > self.ttl:
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        size = len(value)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (value, self.clock())
+            self.nb_bytes += size
+            while self.nb_bytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        value, _ = self.entries.pop(key)
+        self.nb_bytes -= len(value)
+
+    def get_or_compute(self, name, params, compute):
+        # compute returns the serialized (str or bytes) result, its length is what counts against max_bytes
+        key = self.make_key(name, params)
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.nb_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            nb_requests = self.hits + self.misses
+            return {'entries': len(self.entries),
+                    'bytes': self.nb_bytes,
+                    'max_bytes': self.max_bytes,
+                    'ttl': self.ttl,
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'hit_ratio': self.hits / nb_requests if nb_requests else 0.,
+                    'evictions': self.evictions,
+                    'expirations': self.expirations}
@@ -0,0 +1,307 @@
+import contextlib
+import json
+import os
+import threading
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: the registry is then shared by the threads of one process only
+    fcntl = None
+
+INTERPOLATIONS = ('linear', 'cubic', 'log_df')
+COMPOUNDINGS = ('annual', 'continuous')
+
+
+def _to_continuous(rates, compounding):
+    if compounding not in COMPOUNDINGS:
+        raise ValueError('compounding must be one of %s' % ', '.join(COMPOUNDINGS))
+    rates = np.asarray(rates, dtype=float)
+    return np.log1p(rates) if compounding == 'annual' else rates
+
+
+class YieldCurve:
+    # zero-coupon curve on pillar times in years, the zero rates are kept continuously compounded. Discount factors
+    # are read from a grid of grid_step spaced times (monthly by default, so every coupon date of the bond engine
+    # falls on it) filled lazily and shared by every bond priced off the curve, grid_step=None reads them straight
+    # from the pillars. A key-rate bump only invalidates the grid points its pillar can move; a parallel shift
+    # rescales the grid in place.
+    def __init__(self, times, zero_rates, interpolation='log_df', compounding='continuous', grid_step=1. / 12):
+        if interpolation not in INTERPOLATIONS:
+            raise ValueError('interpolation must be one of %s' % ', '.join(INTERPOLATIONS))
+        times, zero_rates = np.broadcast_arrays(np.asarray(times, dtype=float).ravel(),
+                                                _to_continuous(zero_rates, compounding).ravel())
+        if times.size == 0 or (times <= 0).any() or np.unique(times).size != times.size:
+            raise ValueError('pillar times must be positive and distinct')
+        order = np.argsort(times)
+        self.times = times[order]
+        self.zero_rates = zero_rates[order]
+        self.interpolation = interpolation
+        self.grid_step = grid_step
+        # bumped on every change of the pillars, so results cached per curve can tell they are stale
+        self.version = 0
+        self.lock = threading.RLock()
+        self._grid = np.empty(0)
+        self._grid_valid = np.empty(0, dtype=bool)
+
+    def __len__(self):
+        return self.times.size
+
+    @classmethod
+    def flat(cls, rate, compounding='annual', **kwargs):
+        return cls([1.], [rate], compounding=compounding, **kwargs)
+
+    @classmethod
+    def bootstrap(cls, deposits=(), swaps=(), bonds=(), interpolation='log_df', grid_step=1. / 12,
+                  tolerance=1e-12, max_iterations=50):
+        # one pillar per quote, at its maturity, solved in maturity order so that the quote reprices exactly.
+        # deposits: (maturity, simple rate), swaps: (maturity, par rate[, fixed payments per year]),
+        # bonds: (maturity, coupon rate, price per 100 of par[, coupons per year]).
+        quotes = [(float(quote[0]), _deposit_residual, (float(quote[1]),)) for quote in deposits]
+        quotes += [(float(quote[0]), _swap_residual, (float(quote[1]), int(quote[2]) if len(quote) > 2 else 1))
+                   for quote in swaps]
+        quotes += [(float(quote[0]), _bond_residual, (float(quote[1]), float(quote[2]),
+                                                      int(quote[3]) if len(quote) > 3 else 1)) for quote in bonds]
+        quotes.sort(key=lambda quote: quote[0])
+        times = np.array([quote[0] for quote in quotes])
+        zero_rates = np.full(times.size, 0.02)
+        # the first pass only knows the pillars before each quote. The following ones solve every pillar on the whole
+        # curve: a second pass confirms the first one, except for the cubic interpolation whose slopes change with
+        # the pillars added after.
+        for iteration in range(max_iterations):
+            previous = zero_rates.copy()
+            for i, (maturity, residual, args) in enumerate(quotes):
+                size = i + 1 if iteration == 0 else times.size
+                zero_rates[i] = _solve_pillar(times[:size], zero_rates[:size], i, interpolation, residual, maturity,
+                                              args, tolerance, max_iterations)
+            if np.abs(zero_rates - previous).max() < tolerance:
+                break
+        return cls(times, zero_rates, interpolation=interpolation, grid_step=grid_step)
+
+    def copy(self):
+        return YieldCurve(self.times, self.zero_rates, interpolation=self.interpolation, grid_step=self.grid_step)
+
+    def _cubic_zero_rates(self, t):
+        # cubic Hermite with Catmull-Rom slopes: a pillar only reaches the two segments on each side of it
+        times, zero_rates = self.times, self.zero_rates
+        if times.size < 2:
+            return np.full(t.shape, zero_rates[0])
+        slopes = np.empty(times.size)
+        slopes[1:-1] = (zero_rates[2:] - zero_rates[:-2]) / (times[2:] - times[:-2])
+        slopes[0] = (zero_rates[1] - zero_rates[0]) / (times[1] - times[0])
+        slopes[-1] = (zero_rates[-1] - zero_rates[-2]) / (times[-1] - times[-2])
+        clipped = np.clip(t, times[0], times[-1])
+        i = np.clip(np.searchsorted(times, clipped, side='right') - 1, 0, times.size - 2)
+        width = times[i + 1] - times[i]
+        s = (clipped - times[i]) / width
+        return ((1 + 2 * s) * (1 - s) ** 2 * zero_rates[i] + s * (1 - s) ** 2 * width * slopes[i] +
+                s * s * (3 - 2 * s) * zero_rates[i + 1] + s * s * (s - 1) * width * slopes[i + 1])
+
+    def _log_discount_factors(self, t):
+        # straight from the pillars, zero rates are extrapolated flat on both sides
+        times, zero_rates = self.times, self.zero_rates
+        if self.interpolation == 'log_df':
+            log_df = np.interp(t, np.concatenate([[0.], times]), np.concatenate([[0.], -zero_rates * times]))
+            beyond = t > times[-1]
+            log_df[beyond] = -zero_rates[-1] * t[beyond]
+            return log_df
+        if self.interpolation == 'linear':
+            return -np.interp(t, times, zero_rates) * t
+        return -self._cubic_zero_rates(t) * t
+
+    def _grow_grid(self, size):
+        if size > self._grid.size:
+            size = max(size, 2 * self._grid.size)
+            self._grid = np.concatenate([self._grid, np.empty(size - self._grid.size)])
+            self._grid_valid = np.concatenate([self._grid_valid, np.zeros(size - self._grid_valid.size, dtype=bool)])
+
+    def discount_factors(self, t):
+        t = np.asarray(t, dtype=float)
+        flat = t.ravel()
+        if self.grid_step is None:
+            return np.exp(self._log_discount_factors(flat)).reshape(t.shape)
+        steps = flat / self.grid_step
+        index = np.rint(steps).astype(np.int64)
+        on_grid = (np.abs(steps - index) < 1e-9) & (index >= 0)
+        grid_index = index[on_grid]
+        discount_factors = np.empty(flat.size)
+        with self.lock:
+            if grid_index.size:
+                self._grow_grid(int(grid_index.max()) + 1)
+                missing = grid_index[~self._grid_valid[grid_index]]
+                if missing.size:
+                    missing = np.unique(missing)
+                    self._grid[missing] = np.exp(self._log_discount_factors(missing * self.grid_step))
+                    self._grid_valid[missing] = True
+                discount_factors[on_grid] = self._grid[grid_index]
+            if not on_grid.all():
+                discount_factors[~on_grid] = np.exp(self._log_discount_factors(flat[~on_grid]))
+        return discount_factors.reshape(t.shape)
+
+    def zero_rates_at(self, t, compounding='annual'):
+        t = np.asarray(t, dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            continuous = np.where(t > 0, -np.log(self.discount_factors(t)) / t, self.zero_rates[0])
+        return np.expm1(continuous) if compounding == 'annual' else continuous
+
+    def _bump_reach(self, pillar):
+        # the pillar times between which a bump of pillar can change the curve, flat extrapolation included
+        reach = 2 if self.interpolation == 'cubic' else 1
+        low = self.times[pillar - reach] if pillar - reach >= 0 else 0.
+        high = self.times[pillar + reach] if pillar + reach < self.times.size else np.inf
+        return low, high
+
+    def bump_parallel(self, shift):
+        with self.lock:
+            self.zero_rates = self.zero_rates + shift
+            # every interpolation moves the log discount factors by exactly -shift * t, nothing is invalidated
+            if self._grid.size:
+                self._grid *= np.exp(-shift * self.grid_step * np.arange(self._grid.size))
+            self.version += 1
+        return self
+
+    def bump_key_rate(self, pillar, shift):
+        # pillar is a position in times, a negative one would clear the grid around the wrong pillar
+        if not 0 <= pillar < self.times.size:
+            raise IndexError('pillar must be between 0 and %d' % (self.times.size - 1))
+        with self.lock:
+            zero_rates = self.zero_rates.copy()
+            zero_rates[pillar] += shift
+            self.zero_rates = zero_rates
+            low, high = self._bump_reach(pillar)
+            if self._grid.size:
+                grid_times = self.grid_step * np.arange(self._grid.size)
+                self._grid_valid[(grid_times > low) & (grid_times < high)] = False
+            self.version += 1
+        return self
+
+    def to_dict(self):
+        return {'times': self.times.tolist(), 'zero_rates': self.zero_rates.tolist(),
+                'interpolation': self.interpolation, 'compounding': 'continuous'}
+
+
+class CurveRegistry:
+    # the curves by name. With a directory, each curve is also written there as JSON with its version, and read
+    # back whenever the file changed, so the worker processes of wsgi.py share the curves built or bumped by any of
+    # them; a lock file serializes the writes across processes. Without one, the curves live in this process only.
+    def __init__(self, directory=None):
+        self.directory = directory
+        self.curves = dict()
+        self.mtimes = dict()
+        self.lock = threading.RLock()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name.replace('/', '_').replace(os.sep, '_') + '.json')
+
+    @contextlib.contextmanager
+    def _write_lock(self):
+        with self.lock:
+            if self.directory is None or fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.directory, '.lock'), 'w') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def get(self, name):
+        if self.directory is None:
+            return self.curves.get(name)
+        path = self._path(name)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        with self.lock:
+            if self.mtimes.get(name) != mtime:
+                with open(path) as f:
+                    definition = json.load(f)
+                curve = self.curves.get(name)
+                if curve is None or curve.version != definition['version']:
+                    curve = YieldCurve(definition['times'], definition['zero_rates'],
+                                       interpolation=definition['interpolation'], compounding='continuous')
+                    curve.version = definition['version']
+                    self.curves[name] = curve
+                self.mtimes[name] = mtime
+            return self.curves[name]
+
+    def _write(self, name, curve):
+        self.curves[name] = curve
+        if self.directory is None:
+            return
+        path = self._path(name)
+        # written aside then renamed, so a reader never loads a half-written file
+        with open(path + '.tmp', 'w') as f:
+            json.dump(dict(curve.to_dict(), version=curve.version), f)
+        os.replace(path + '.tmp', path)
+        self.mtimes[name] = os.stat(path).st_mtime_ns
+
+    def put(self, name, curve):
+        # versions keep increasing across rebuilds, results cached for the previous curve of that name go stale
+        with self._write_lock():
+            previous = self.get(name)
+            if previous is not None:
+                curve.version = previous.version + 1
+            self._write(name, curve)
+        return curve
+
+    def update(self, name, change):
+        # change(curve) modifies the latest version of the curve in place, e.g. a bump; None for an unknown name
+        with self._write_lock():
+            curve = self.get(name)
+            if curve is None:
+                return None
+            change(curve)
+            self._write(name, curve)
+        return curve
+
+
+def _coupon_times(maturity, frequency):
+    # the last coupon falls on the maturity, the others every 1 / frequency years before it
+    return maturity - np.arange(int(np.ceil(maturity * frequency - 1e-9)))[::-1] / frequency
+
+
+def _deposit_residual(curve, maturity, rate):
+    return float(curve.discount_factors(maturity)) - 1 / (1 + rate * maturity)
+
+
+def _swap_residual(curve, maturity, rate, frequency):
+    payment_times = _coupon_times(maturity, frequency)
+    accruals = np.diff(np.concatenate([[0.], payment_times]))
+    discount_factors = curve.discount_factors(payment_times)
+    return float(rate * (accruals * discount_factors).sum() + discount_factors[-1] - 1)
+
+
+def _bond_residual(curve, maturity, coupon_rate, price, frequency):
+    discount_factors = curve.discount_factors(_coupon_times(maturity, frequency))
+    return float(100 * coupon_rate / frequency * discount_factors.sum() + 100 * discount_factors[-1] - price)
+
+
+def _solve_pillar(times, zero_rates, pillar, interpolation, residual, maturity, args, tolerance, max_iterations):
+    # secant on the zero rate of pillar, the residual decreases with it
+    def evaluate(zero_rate):
+        zero_rates[pillar] = zero_rate
+        curve = YieldCurve(times, zero_rates, interpolation=interpolation, grid_step=None)
+        return residual(curve, maturity, *args)
+
+    x0, x1 = zero_rates[pillar], zero_rates[pillar] + 1e-4
+    f0, f1 = evaluate(x0), evaluate(x1)
+    for _ in range(max_iterations):
+        if f1 == f0 or abs(f1) < tolerance:
+            break
+        x0, x1, f0 = x1, x1 - f1 * (x1 - x0) / (f1 - f0), f1
+        f1 = evaluate(x1)
+    zero_rates[pillar] = x1
+    return x1
+
+
+if __name__ == '__main__':
+    curve = YieldCurve.bootstrap(deposits=[(0.25, 0.010), (0.5, 0.012)],
+                                 swaps=[(1, 0.014), (2, 0.016), (5, 0.020), (10, 0.024), (30, 0.027)])
+    print(curve.to_dict())
+    print(curve.zero_rates_at([0.25, 1, 3, 7, 20, 40]))
@@ -0,0 +1,102 @@
+import numpy as np
+
+from PythonCourseForBanking.pricing.blackscholes import BlackScholesBatchPricer
+
+
+class ImpliedVolatilitySolver:
+    # Newton iterations on the Black-Scholes vega, vectorized over a whole option chain. Each option keeps a
+    # [low, high] bracket of its implied volatility and falls back to bisection whenever the Newton step leaves it.
+    def __init__(self, option_price, underlying_price, strike_price, rate, time_to_maturity, call_put='call',
+                 tolerance=1e-8, max_iterations=100, min_volatility=1e-6, max_volatility=5.):
+        self.option_price, self.underlying_price, self.strike_price, self.rate, self.time_to_maturity = \
+            np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in
+                                  (option_price, underlying_price, strike_price, rate, time_to_maturity)])
+        self.call_put = np.broadcast_to(np.asarray(call_put), self.option_price.shape)
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+        self.min_volatility = min_volatility
+        self.max_volatility = max_volatility
+        self.volatility, self.converged, self.iterations = self._solve()
+
+    def __len__(self):
+        return self.volatility.size
+
+    def _price(self, volatility, rows):
+        return BlackScholesBatchPricer(underlying_price=self.underlying_price.ravel()[rows],
+                                       strike_price=self.strike_price.ravel()[rows],
+                                       rate=self.rate.ravel()[rows],
+                                       time_to_maturity=self.time_to_maturity.ravel()[rows],
+                                       volatility=volatility,
+                                       call_put=self.call_put.ravel()[rows])
+
+    def _initial_guess(self, rows):
+        # Manaster-Koehler starting point, the volatility for which the option is at the inflexion of its price
+        underlying_price = self.underlying_price.ravel()[rows]
+        strike_price = self.strike_price.ravel()[rows]
+        rate = self.rate.ravel()[rows]
+        time_to_maturity = self.time_to_maturity.ravel()[rows]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            guess = np.sqrt(2 * np.abs(np.log(underlying_price / strike_price) + rate * time_to_maturity) /
+                            time_to_maturity)
+        return np.clip(np.nan_to_num(guess, nan=0.2), 0.05, 1.)
+
+    def _solve(self):
+        target = self.option_price.ravel()
+        nb_options = target.size
+        volatility = np.full(nb_options, np.nan)
+        converged = np.zeros(nb_options, dtype=bool)
+        iterations = np.zeros(nb_options, dtype=int)
+
+        # prices outside the no-arbitrage bounds have no implied volatility, they stay nan and unconverged
+        all_rows = np.arange(nb_options)
+        low_price = self._price(self.min_volatility, all_rows).option_price
+        high_price = self._price(self.max_volatility, all_rows).option_price
+        rows = all_rows[(target > low_price - self.tolerance) & (target < high_price + self.tolerance)]
+
+        low = np.full(rows.size, self.min_volatility)
+        high = np.full(rows.size, self.max_volatility)
+        sigma = self._initial_guess(rows)
+        for iteration in range(1, self.max_iterations + 1):
+            if rows.size == 0:
+                break
+            pricer = self._price(sigma, rows)
+            difference = pricer.option_price - target[rows]
+            iterations[rows] = iteration
+
+            price_done = np.abs(difference) < self.tolerance
+            volatility[rows[price_done]] = sigma[price_done]
+
+            high = np.where(difference > 0, sigma, high)
+            low = np.where(difference < 0, sigma, low)
+            # the engine returns vega for a 1% move of the volatility
+            with np.errstate(divide='ignore', invalid='ignore'):
+                newton = sigma - difference / (100 * pricer.vega)
+            bisection = (low + high) / 2
+            sigma = np.where(np.isfinite(newton) & (newton > low) & (newton < high), newton, bisection)
+
+            # options whose bracket collapsed below the tolerance are accepted as converged as well
+            bracket_done = ~price_done & ((high - low) < self.tolerance)
+            volatility[rows[bracket_done]] = sigma[bracket_done]
+            done = price_done | bracket_done
+            converged[rows[done]] = True
+
+            keep = ~done
+            rows, sigma, low, high = rows[keep], sigma[keep], low[keep], high[keep]
+
+        volatility[rows] = sigma
+        shape = self.option_price.shape
+        return volatility.reshape(shape), converged.reshape(shape), iterations.reshape(shape)
+
+    def to_dict(self):
+        return {'volatility': self.volatility, 'converged': self.converged, 'iterations': self.iterations}
+
+
+if __name__ == '__main__':
+    strikes = np.arange(30, 80, 5)
+    chain = BlackScholesBatchPricer(underlying_price=52, strike_price=strikes, rate=0.02, time_to_maturity=0.3,
+                                    volatility=0.32, call_put='call')
+    solver = ImpliedVolatilitySolver(option_price=chain.option_price, underlying_price=52, strike_price=strikes,
+                                     rate=0.02, time_to_maturity=0.3, call_put='call')
+    print(solver.volatility)
+    print(solver.converged)
+    print(solver.iterations)
@@ -0,0 +1,159 @@
+import bisect
+import collections
+import os
+import threading
+import time
+
+# upper bounds in seconds, from a cached scalar price to a large batch
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10.)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(label_names, label_values, extra=''):
+    labels = ['%s="%s"' % (name, _escape(value)) for name, value in zip(label_names, label_values)]
+    if extra:
+        labels.append(extra)
+    return '{%s}' % ','.join(labels) if labels else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, help, label_names=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self.values = collections.defaultdict(int)
+        self.lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] += amount
+
+    def samples(self):
+        with self.lock:
+            values = sorted(self.values.items())
+        return [(self.name, label_values, '', value) for label_values, value in values]
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, help, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # per label values: one count per bucket (not cumulative) plus the overflow, the sum and the count
+        self.values = dict()
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(label_values)
+            if state is None:
+                state = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0., 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        with self.lock:
+            values = sorted((label_values, (list(state[0]), state[1], state[2]))
+                            for label_values, state in self.values.items())
+        samples = list()
+        for label_values, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                samples.append((self.name + '_bucket', label_values, 'le="%s"' % _format_value(bound), cumulative))
+            samples.append((self.name + '_sum', label_values, '', total))
+            samples.append((self.name + '_count', label_values, '', count))
+        return samples
+
+
+class _NullStage:
+    # what stage() hands out when the metrics are off, entering and leaving it does nothing
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    def __init__(self, histogram, name):
+        self.histogram = histogram
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, self.name)
+        return False
+
+
+class MetricsRegistry:
+    # the metrics of every instrumented app, rendered in the Prometheus text format. When disabled the request
+    # hooks return at once and stage() is a shared no-op context manager.
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.metrics = list()
+        self.requests = self.add(Counter('pricing_http_requests_total', 'Requests served.',
+                                         ('app', 'route', 'method', 'status')))
+        self.request_duration = self.add(Histogram('pricing_http_request_duration_seconds',
+                                                   'Time spent in the view, from parsing to the response object.',
+                                                   ('app', 'route', 'method')))
+        self.in_flight = self.add(Gauge('pricing_http_requests_in_flight', 'Requests being served.', ('app',)))
+        self.stage_duration = self.add(Histogram('pricing_stage_duration_seconds',
+                                                 'Time spent in each pricing stage.', ('stage',)))
+        self.profiles = self.add(Counter('pricing_slow_request_profiles_total',
+                                         'Slow requests whose sampled stacks were written.', ('app', 'route')))
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def stage(self, name):
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self.stage_duration, name)
+
+    def render(self):
+        lines = list()
+        for metric in self.metrics:
+            lines.append('# HELP %s %s' % (metric.name, metric.help))
+            lines.append('# TYPE %s %s' % (metric.name, metric.type))
+            for name, label_values, extra, value in metric.samples():
+                lines.append('%s%s %s' % (name, _format_labels(metric.label_names, label_values, extra),
+                                          _format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry(enabled=os.environ.get('PRICING_METRICS', '1') != '0')
+
+
+def stage(name):
+    return REGISTRY.stage(name)
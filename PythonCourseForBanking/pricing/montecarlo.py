@@ -0,0 +1,136 @@
+import math
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from PythonCourseForBanking.pricing.blackscholes import BlackScholesBatchPricer
+
+PAYOFFS = ('european', 'asian', 'barrier', 'lookback')
+BARRIER_TYPES = ('up_and_out', 'down_and_out', 'up_and_in', 'down_and_in')
+
+
+def _simulate_chunk(params, chunk_index, nb_paths):
+    # each chunk draws from its own stream spawned from the seed, so the result does not depend on how the chunks
+    # are spread over the workers. Returns the sums needed to combine the chunks: n, sum(y), sum(x), sum(y^2),
+    # sum(x^2), sum(xy) where y is the discounted payoff and x the discounted european payoff (the control).
+    random_state = np.random.default_rng(np.random.SeedSequence(params['seed'], spawn_key=(chunk_index,)))
+    nb_steps = params['nb_steps']
+    dt = params['time_to_maturity'] / nb_steps
+    drift = (params['rate'] - 0.5 * params['volatility'] ** 2) * dt
+    diffusion = params['volatility'] * math.sqrt(dt)
+
+    if params['antithetic']:
+        normals = random_state.standard_normal((nb_paths // 2, nb_steps))
+        normals = np.concatenate([normals, -normals])
+    else:
+        normals = random_state.standard_normal((nb_paths, nb_steps))
+    paths = params['underlying_price'] * np.exp(np.cumsum(drift + diffusion * normals, axis=1))
+
+    sign = 1. if params['call_put'].upper() == 'CALL' else -1.
+    strike_price = params['strike_price']
+    european = np.maximum(sign * (paths[:, -1] - strike_price), 0.)
+    payoff = params['payoff']
+    if payoff == 'european':
+        values = european
+    elif payoff == 'asian':
+        values = np.maximum(sign * (paths.mean(axis=1) - strike_price), 0.)
+    elif payoff == 'lookback':
+        extremum = paths.max(axis=1) if sign > 0 else paths.min(axis=1)
+        values = np.maximum(sign * (extremum - strike_price), 0.)
+    else:
+        barrier_type = params['barrier_type']
+        if barrier_type.startswith('up'):
+            crossed = paths.max(axis=1) >= params['barrier']
+        else:
+            crossed = paths.min(axis=1) <= params['barrier']
+        alive = crossed if barrier_type.endswith('_in') else ~crossed
+        values = np.where(alive, european, 0.)
+
+    discount = math.exp(-params['rate'] * params['time_to_maturity'])
+    y, x = discount * values, discount * european
+    if params['antithetic']:
+        # a path and its antithetic twin are one sample
+        half = nb_paths // 2
+        y, x = (y[:half] + y[half:]) / 2, (x[:half] + x[half:]) / 2
+    return np.array([y.size, y.sum(), x.sum(), (y * y).sum(), (x * x).sum(), (x * y).sum()])
+
+
+def _simulate_chunk_star(args):
+    return _simulate_chunk(*args)
+
+
+class MonteCarloPricer:
+    # path-dependent options under the Black-Scholes GBM dynamics, simulated in memory-bounded chunks of
+    # chunk_size paths, fewer when the chunk would hold more than max_chunk_elements normals (paths x steps).
+    # The european price from BlackScholesBatchPricer serves as control variate when it is defined.
+    def __init__(self, underlying_price, strike_price, rate, time_to_maturity, volatility, call_put='call',
+                 payoff='asian', barrier=None, barrier_type='up_and_out', nb_paths=100000, nb_steps=252,
+                 chunk_size=10000, seed=0, antithetic=True, control_variate=True, max_workers=1,
+                 max_chunk_elements=10000 * 252):
+        if payoff not in PAYOFFS:
+            raise ValueError('payoff must be one of %s' % ', '.join(PAYOFFS))
+        if payoff == 'barrier' and (barrier is None or barrier_type not in BARRIER_TYPES):
+            raise ValueError('a barrier option needs a barrier level and a type among %s' % ', '.join(BARRIER_TYPES))
+        if str(call_put).upper() not in ('CALL', 'PUT'):
+            raise ValueError('call_put must be call or put')
+        # an antithetic pair is one sample, a single path would leave none
+        if int(nb_paths) < 2:
+            raise ValueError('nb_paths must be at least 2')
+        if int(nb_steps) < 1:
+            raise ValueError('nb_steps must be at least 1')
+        if not time_to_maturity > 0 or not volatility >= 0:
+            raise ValueError('time_to_maturity must be positive and volatility not negative')
+        self.params = {'underlying_price': float(underlying_price), 'strike_price': float(strike_price),
+                       'rate': float(rate), 'time_to_maturity': float(time_to_maturity),
+                       'volatility': float(volatility), 'call_put': call_put, 'payoff': payoff,
+                       'barrier': barrier, 'barrier_type': barrier_type, 'nb_steps': int(nb_steps), 'seed': seed,
+                       'antithetic': antithetic}
+        # antithetic paths come in pairs, an odd count is rounded up so that every requested path is simulated
+        self.nb_paths = int(nb_paths) + (int(nb_paths) % 2 if antithetic else 0)
+        chunk_size = max(2, min(int(chunk_size), int(max_chunk_elements) // int(nb_steps)))
+        self.chunk_size = chunk_size + chunk_size % 2  # antithetic pairs are never split
+        self.control_variate = control_variate
+        self.max_workers = max_workers
+        self.option_price, self.standard_error = self._calculate_price()
+
+    def __str__(self):
+        return 'option_price = %s, standard_error = %s' % (self.option_price, self.standard_error)
+
+    def _chunks(self):
+        return [(self.params, i, min(self.chunk_size, self.nb_paths - start))
+                for i, start in enumerate(range(0, self.nb_paths, self.chunk_size))]
+
+    def _calculate_price(self):
+        chunks = self._chunks()
+        if self.max_workers == 1:
+            sums = [_simulate_chunk(*chunk) for chunk in chunks]
+        else:
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                sums = list(executor.map(_simulate_chunk_star, chunks))
+        n, sum_y, sum_x, sum_yy, sum_xx, sum_xy = np.sum(sums, axis=0)
+
+        mean_y, mean_x = sum_y / n, sum_x / n
+        var_y = max(sum_yy / n - mean_y * mean_y, 0.)
+        if not self.control_variate:
+            return mean_y, math.sqrt(var_y / n)
+
+        var_x = sum_xx / n - mean_x * mean_x
+        cov_xy = sum_xy / n - mean_x * mean_y
+        beta = cov_xy / var_x if var_x > 0 else 0.
+        params = self.params
+        exact_x = float(BlackScholesBatchPricer(params['underlying_price'], params['strike_price'], params['rate'],
+                                                params['time_to_maturity'], params['volatility'],
+                                                params['call_put']).option_price)
+        if not math.isfinite(exact_x):
+            # no closed form to control with (e.g. a zero volatility at the money)
+            return mean_y, math.sqrt(var_y / n)
+        price = mean_y - beta * (mean_x - exact_x)
+        variance = max(var_y - 2 * beta * cov_xy + beta * beta * var_x, 0.)
+        return price, math.sqrt(variance / n)
+
+
+if __name__ == '__main__':
+    for payoff in PAYOFFS:
+        mcp = MonteCarloPricer(underlying_price=52, strike_price=50, rate=0.02, time_to_maturity=0.3,
+                               volatility=0.32, call_put='call', payoff=payoff, barrier=60)
+        print(payoff, str(mcp))
@@ -0,0 +1,33 @@
+import math
+
+import numpy as np
+
+INV_SQRT_2PI = 1 / math.sqrt(2 * math.pi)
+
+# scipy is only imported by the first norm_cdf call, and is optional: math.erfc is used when it is not installed
+_ndtr = None
+_erfc = np.frompyfunc(math.erfc, 1, 1)
+
+
+def erfc_norm_cdf(x):
+    # N(x) = erfc(-x / sqrt(2)) / 2, erfc keeps the far left tail accurate where 1 + erf would cancel out
+    return 0.5 * np.asarray(_erfc(np.asarray(x, dtype=float) * -math.sqrt(0.5)), dtype=float)
+
+
+def _load_ndtr():
+    global _ndtr
+    try:
+        from scipy.special import ndtr
+    except ImportError:
+        ndtr = erfc_norm_cdf
+    _ndtr = ndtr
+    return ndtr
+
+
+def norm_cdf(x):
+    return (_ndtr or _load_ndtr())(x)
+
+
+def norm_pdf(x):
+    x = np.asarray(x, dtype=float)
+    return INV_SQRT_2PI * np.exp(-0.5 * x * x)
@@ -0,0 +1,65 @@
+import io
+import json
+
+import numpy as np
+
+NPY_MIMETYPES = ('application/x-npy', 'application/octet-stream')
+ARROW_MIMETYPE = 'application/vnd.apache.arrow.stream'
+
+
+class PayloadError(ValueError):
+    pass
+
+
+def read_columns(request, columns, defaults=None):
+    # accepts a list of records or a dict of columns in JSON, a structured .npy array or an arrow stream,
+    # and always returns one numpy array per requested column
+    defaults = defaults or dict()
+    if request.mimetype in NPY_MIMETYPES:
+        try:
+            array = np.load(io.BytesIO(request.get_data()), allow_pickle=False)
+        except (ValueError, OSError, EOFError) as e:
+            raise PayloadError('the body is not a readable .npy array: %s' % e)
+        if array.dtype.names is None:
+            raise PayloadError('the .npy body must be a structured array with one field per column')
+        payload = {name: array[name] for name in array.dtype.names}
+    elif request.mimetype == ARROW_MIMETYPE:
+        import pyarrow as pa
+        try:
+            table = pa.ipc.open_stream(request.get_data()).read_all()
+        except (pa.ArrowException, ValueError) as e:
+            raise PayloadError('the body is not a readable arrow stream: %s' % e)
+        payload = {name: table.column(name).to_numpy() for name in table.column_names}
+    else:
+        payload = request.get_json(force=True, silent=True)
+        if isinstance(payload, list):
+            if not all(isinstance(record, dict) for record in payload):
+                raise PayloadError('every record of the body must be an object')
+            payload = {column: [record.get(column, defaults.get(column)) for record in payload]
+                       for column in columns if any(column in record for record in payload)}
+        elif not isinstance(payload, dict):
+            raise PayloadError('the body must be a list of records or a dict of columns')
+
+    result = dict()
+    for column in columns:
+        if column in payload:
+            result[column] = np.asarray(payload[column])
+        elif column in defaults:
+            result[column] = np.asarray(defaults[column])
+        else:
+            raise PayloadError('missing column %s' % column)
+    return result
+
+
+def stream_columns(columns, decimals=5, chunk_size=10000):
+    # yields a columnar JSON document chunk by chunk so a large book is never held as one string
+    yield '{'
+    for i, (name, values) in enumerate(columns.items()):
+        yield ('' if i == 0 else ',') + json.dumps(name) + ':['
+        values = np.ravel(values)
+        for start in range(0, values.size, chunk_size):
+            chunk = np.round(values[start:start + chunk_size], decimals).tolist()
+            chunk = [None if value != value else value for value in chunk]  # NaN is not valid JSON
+            yield ('' if start == 0 else ',') + json.dumps(chunk)[1:-1]
+        yield ']'
+    yield '}'
@@ -0,0 +1,88 @@
+import threading
+import unittest
+
+from PythonCourseForBanking.pricing.batching import MicroBatcher
+
+
+class MicroBatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.batches = list()
+
+    def price_batch(self, batch):
+        self.batches.append(list(batch))
+        return [x * 2 for x in batch]
+
+    def submit_concurrently(self, batcher, params):
+        results = dict()
+        errors = dict()
+
+        def submit(x):
+            try:
+                results[x] = batcher.submit(x)
+            except Exception as e:
+                errors[x] = e
+        threads = [threading.Thread(target=submit, args=(x,)) for x in params]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        return results, errors
+
+    def test_request_alone_is_priced_at_once(self):
+        batcher = MicroBatcher(self.price_batch, window=10, concurrency=lambda: 1)
+        self.assertEqual(batcher.submit(3), 6)
+        self.assertEqual(self.batches, [[3]])
+
+    def test_concurrent_requests_are_coalesced(self):
+        batcher = MicroBatcher(self.price_batch, window=10, concurrency=lambda: 8)
+        results, errors = self.submit_concurrently(batcher, range(8))
+        self.assertEqual(results, {x: x * 2 for x in range(8)})
+        self.assertEqual(errors, {})
+        self.assertEqual(len(self.batches), 1)
+        self.assertEqual(batcher.stats()['mean_batch_size'], 8)
+
+    def test_batches_are_capped_at_max_batch_size(self):
+        batcher = MicroBatcher(self.price_batch, window=10, max_batch_size=3, concurrency=lambda: 6)
+        results, errors = self.submit_concurrently(batcher, range(6))
+        self.assertEqual(results, {x: x * 2 for x in range(6)})
+        self.assertEqual([len(batch) for batch in self.batches], [3, 3])
+
+    def test_leader_stops_waiting_after_the_window(self):
+        batcher = MicroBatcher(self.price_batch, window=0.01)
+        self.assertEqual(batcher.submit(3), 6)
+        self.assertEqual(self.batches, [[3]])
+
+    def test_exception_returned_for_one_request_only_fails_that_request(self):
+        def price_batch(batch):
+            return [ValueError(x) if x == 2 else x * 2 for x in batch]
+        batcher = MicroBatcher(price_batch, window=10, concurrency=lambda: 4)
+        results, errors = self.submit_concurrently(batcher, range(4))
+        self.assertEqual(results, {0: 0, 1: 2, 3: 6})
+        self.assertEqual(list(errors), [2])
+        self.assertIsInstance(errors[2], ValueError)
+
+    def test_exception_raised_by_the_batch_fails_every_request(self):
+        def price_batch(batch):
+            raise ZeroDivisionError()
+        batcher = MicroBatcher(price_batch, window=10, concurrency=lambda: 3)
+        results, errors = self.submit_concurrently(batcher, range(3))
+        self.assertEqual(results, {})
+        self.assertEqual(sorted(errors), [0, 1, 2])
+        self.assertTrue(all(isinstance(e, ZeroDivisionError) for e in errors.values()))
+
+    def test_batcher_keeps_working_after_a_failed_batch(self):
+        calls = list()
+
+        def price_batch(batch):
+            calls.append(batch)
+            if len(calls) == 1:
+                raise ZeroDivisionError()
+            return [x * 2 for x in batch]
+        batcher = MicroBatcher(price_batch, window=10, concurrency=lambda: 1)
+        with self.assertRaises(ZeroDivisionError):
+            batcher.submit(1)
+        self.assertEqual(batcher.submit(2), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
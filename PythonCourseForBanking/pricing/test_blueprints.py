@@ -0,0 +1,85 @@
+import unittest
+
+from flask import Flask
+
+from PythonCourseForBanking.pricing import blueprints
+from PythonCourseForBanking.pricing.blueprints import price_bond, price_bonds_coalesced, price_option, \
+    price_options_coalesced, serialize
+
+OPTION = dict(underlying_price=100., strike_price=100., rate=0.01, time_to_maturity=1., volatility=0.2,
+              call_put='call')
+BOND = dict(par_value=1000., annual_discount_rate=0.05, annual_coupon_rate=0.04, maturity=10.,
+            coupon_periodicity='annual')
+
+
+class CoalescedPricingTest(unittest.TestCase):
+    # a batch must answer each request with the body, or the error, the request would have got alone
+    def assert_same_as_alone(self, price, params_list, bodies):
+        self.assertEqual(len(bodies), len(params_list))
+        for params, body in zip(params_list, bodies):
+            try:
+                expected = serialize(price(**params))
+            except Exception as e:
+                self.assertIsInstance(body, type(e))
+            else:
+                self.assertEqual(body, expected)
+
+    def test_options_batch_gives_the_bodies_of_each_request_alone(self):
+        params_list = [dict(OPTION, strike_price=strike, call_put=call_put)
+                       for strike in (80., 100., 120.) for call_put in ('call', 'put')]
+        self.assert_same_as_alone(price_option, params_list, price_options_coalesced(params_list))
+
+    def test_option_with_undefined_results_falls_back_to_pricing_alone(self):
+        params_list = [OPTION, dict(OPTION, call_put='straddle'), dict(OPTION, time_to_maturity=0.)]
+        self.assert_same_as_alone(price_option, params_list, price_options_coalesced(params_list))
+
+    def test_bonds_batch_gives_the_bodies_of_each_request_alone(self):
+        params_list = [dict(BOND, maturity=maturity, coupon_periodicity=periodicity)
+                       for maturity in (1., 5., 30.) for periodicity in ('annual', 'semi_annual', 'no_coupon')]
+        self.assert_same_as_alone(price_bond, params_list, price_bonds_coalesced(params_list))
+
+    def test_bond_with_unknown_periodicity_falls_back_to_pricing_alone(self):
+        params_list = [BOND, dict(BOND, coupon_periodicity='weekly')]
+        bodies = price_bonds_coalesced(params_list)
+        self.assert_same_as_alone(price_bond, params_list, bodies)
+        self.assertIsInstance(bodies[1], Exception)
+
+    def test_bond_without_a_finite_price_fails_alone_and_in_a_batch(self):
+        params_list = [BOND, dict(BOND, annual_discount_rate=-1.),
+                       dict(BOND, annual_discount_rate=-0.999, maturity=200.)]
+        bodies = price_bonds_coalesced(params_list)
+        self.assert_same_as_alone(price_bond, params_list, bodies)
+        self.assertEqual(serialize(price_bond(**BOND)), bodies[0])
+        for body in bodies[1:]:
+            self.assertIsInstance(body, ValueError)
+
+
+class PriceBondsRouteTest(unittest.TestCase):
+    def setUp(self):
+        app = Flask(__name__)
+        app.register_blueprint(blueprints.bonds_blueprint)
+        self.client = app.test_client()
+        blueprints.pricing_cache.clear()
+        self.addCleanup(blueprints.pricing_cache.clear)
+        self.addCleanup(setattr, blueprints, 'bond_batcher', blueprints.bond_batcher)
+
+    def get(self, **params):
+        return self.client.get('/price_bonds', query_string=dict(BOND, **params))
+
+    def test_undefined_price_is_a_bad_request_with_or_without_batching(self):
+        for batcher in (None, blueprints.MicroBatcher(blueprints.price_bonds_coalesced, concurrency=lambda: 1)):
+            blueprints.bond_batcher = batcher
+            for params in (dict(annual_discount_rate=-1.), dict(coupon_periodicity='weekly')):
+                response = self.get(**params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.get_json())
+
+    def test_batched_body_is_the_body_priced_alone(self):
+        alone = self.get(maturity=7).data
+        blueprints.pricing_cache.clear()
+        blueprints.bond_batcher = blueprints.MicroBatcher(blueprints.price_bonds_coalesced, concurrency=lambda: 1)
+        self.assertEqual(self.get(maturity=7).data, alone)
+
+
+if __name__ == '__main__':
+    unittest.main()
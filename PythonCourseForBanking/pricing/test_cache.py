@@ -0,0 +1,92 @@
+import unittest
+
+from PythonCourseForBanking.pricing.cache import PricingCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.
+
+    def __call__(self):
+        return self.now
+
+
+class PricingCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = PricingCache(max_bytes=10, ttl=60, clock=self.clock)
+
+    def test_get_returns_what_was_put(self):
+        self.cache.put('a', 'xyz')
+        self.assertEqual(self.cache.get('a'), 'xyz')
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 0))
+
+    def test_get_of_a_missing_key_is_a_miss(self):
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 1))
+
+    def test_least_recently_used_entry_is_evicted_first(self):
+        self.cache.put('a', 'aaaa')
+        self.cache.put('b', 'bbbb')
+        self.cache.get('a')
+        self.cache.put('c', 'cccc')
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.get('a'), 'aaaa')
+        self.assertEqual(self.cache.evictions, 1)
+
+    def test_byte_budget_is_never_exceeded(self):
+        for i in range(10):
+            self.cache.put(i, 'xxx')
+            self.assertLessEqual(self.cache.nb_bytes, self.cache.max_bytes)
+        self.assertEqual(len(self.cache), 3)
+
+    def test_value_larger_than_the_budget_is_not_stored(self):
+        self.cache.put('a', 'aaaa')
+        self.cache.put('big', 'x' * 11)
+        self.assertIsNone(self.cache.get('big'))
+        self.assertEqual(self.cache.get('a'), 'aaaa')
+
+    def test_replacing_a_key_counts_its_bytes_once(self):
+        self.cache.put('a', 'aaaa')
+        self.cache.put('a', 'aa')
+        self.assertEqual(self.cache.nb_bytes, 2)
+        self.assertEqual(self.cache.get('a'), 'aa')
+
+    def test_entry_older_than_the_ttl_expires(self):
+        self.cache.put('a', 'aaaa')
+        self.clock.now = 60.
+        self.assertEqual(self.cache.get('a'), 'aaaa')
+        self.clock.now = 60.1
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual((self.cache.expirations, self.cache.nb_bytes, len(self.cache)), (1, 0, 0))
+
+    def test_keys_are_rounded_to_the_significant_digits(self):
+        self.assertEqual(self.cache.make_key('bond', {'rate': 0.1 + 0.2, 'maturity': 10}),
+                         self.cache.make_key('bond', {'maturity': 10, 'rate': 0.3}))
+        self.assertNotEqual(self.cache.make_key('bond', {'rate': 0.3}), self.cache.make_key('bond', {'rate': 0.31}))
+
+    def test_get_or_compute_only_computes_on_a_miss(self):
+        calls = list()
+
+        def compute():
+            calls.append(1)
+            return 'value'
+        self.assertEqual(self.cache.get_or_compute('bond', {'rate': 0.3}, compute), 'value')
+        self.assertEqual(self.cache.get_or_compute('bond', {'rate': 0.3}, compute), 'value')
+        self.assertEqual(len(calls), 1)
+
+    def test_get_or_compute_does_not_cache_a_failure(self):
+        def compute():
+            raise ZeroDivisionError()
+        with self.assertRaises(ZeroDivisionError):
+            self.cache.get_or_compute('bond', {'rate': -1.}, compute)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_clear_empties_the_cache(self):
+        self.cache.put('a', 'aaaa')
+        self.cache.clear()
+        self.assertEqual((len(self.cache), self.cache.nb_bytes), (0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
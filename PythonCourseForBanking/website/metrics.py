@@ -0,0 +1,111 @@
+import collections
+import os
+import sys
+import threading
+import time
+
+from flask import Response, g, request
+
+from PythonCourseForBanking.pricing.metrics import REGISTRY
+
+
+class SamplingProfiler:
+    # samples the stack of every thread serving a request each interval seconds; the stacks of a request slower
+    # than slow_threshold are written to directory in the folded format read by flamegraph.pl and speedscope
+    def __init__(self, directory, slow_threshold=0.5, interval=0.005):
+        self.directory = directory
+        self.slow_threshold = slow_threshold
+        self.interval = interval
+        self.active = dict()
+        self.lock = threading.Lock()
+        self.thread = None
+        os.makedirs(self.directory, exist_ok=True)
+
+    @classmethod
+    def from_environment(cls, environ=os.environ):
+        # off unless PRICING_PROFILE_DIR is set
+        directory = environ.get('PRICING_PROFILE_DIR')
+        if not directory:
+            return None
+        return cls(directory, slow_threshold=float(environ.get('PRICING_PROFILE_SLOW_MS', 500)) / 1000,
+                   interval=float(environ.get('PRICING_PROFILE_INTERVAL_MS', 5)) / 1000)
+
+    def start_request(self):
+        with self.lock:
+            self.active[threading.get_ident()] = collections.Counter()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._sample, daemon=True)
+                self.thread.start()
+
+    def end_request(self, app_name, route, elapsed):
+        with self.lock:
+            stacks = self.active.pop(threading.get_ident(), None)
+        if not stacks or elapsed < self.slow_threshold:
+            return None
+        path = os.path.join(self.directory, '%s_%s_%d.folded' % (
+            app_name, route.strip('/').replace('/', '_').replace('<', '').replace('>', '') or 'index',
+            time.time() * 1e6))
+        with open(path, 'w') as f:
+            for stack, count in stacks.most_common():
+                f.write('%s %d\n' % (stack, count))
+        return path
+
+    @staticmethod
+    def _fold(frame):
+        names = list()
+        while frame is not None:
+            code = frame.f_code
+            names.append('%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename), frame.f_lineno))
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def _sample(self):
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self.lock:
+                for ident, stacks in self.active.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        stacks[self._fold(frame)] += 1
+
+
+def instrument_app(app, app_name, registry=REGISTRY, profiler=None):
+    # times every request of app by route, counts them by status, tracks the requests in flight, optionally
+    # profiles the slow ones, and serves registry at /metrics
+    if profiler is None:
+        profiler = SamplingProfiler.from_environment()
+
+    @app.before_request
+    def start_request_metrics():
+        if not registry.enabled:
+            return
+        g.metrics_start = time.perf_counter()
+        registry.in_flight.inc(app_name)
+        if profiler is not None:
+            profiler.start_request()
+
+    @app.after_request
+    def record_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def end_request_metrics(exc):
+        start = g.pop('metrics_start', None)
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        # the rule, not the path, so /chart/share/<code> stays one series whatever the ticker
+        route = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+        registry.in_flight.dec(app_name)
+        registry.request_duration.observe(elapsed, app_name, route, request.method)
+        registry.requests.inc(app_name, route, request.method, g.pop('metrics_status', 500))
+        if profiler is not None and profiler.end_request(app_name, route, elapsed) is not None:
+            registry.profiles.inc(app_name, route)
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+    return app
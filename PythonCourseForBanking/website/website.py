@@ -1,151 +1,52 @@
 import datetime
-import math
+import os
+import threading
+import time
 
 import numpy as np
-import pandas as pd
-from flask import Flask, request, jsonify, render_template
-from scipy.stats import norm
-from yahoo_finance import Share
-
-app = Flask(__name__)
-
-
-class BlackScholesPricer:
-    def __init__(self, underlying_price, strike_price, rate, time_to_maturity, volatility, call_put='call'):
-        self.underlying_price = underlying_price
-        self.strike_price = strike_price
-        self.rate = rate
-        self.time_to_maturity = time_to_maturity
-        self.volatility = volatility
-        self.call_put = call_put
-        self.d1, self.d2 = self._calculate_d1_d2()
-        self.option_price, self.delta, self.gamma, self.theta, self.rho, self.vega = self.get_price_and_greeks()
-
-    def __str__(self):
-        return ('result_price = ' + str(self.option_price) + ', delta = ' + str(self.delta) + ', gamma = ' + str(
-            self.gamma) + ', theta = ' + str(self.theta) + ', rho = ' + str(self.rho) + ', vega = ' + str(self.vega))
-
-    def _calculate_d1_d2(self):
-        d1 = (math.log(self.underlying_price / self.strike_price) + (
-            self.rate + self.volatility * self.volatility / 2) * self.time_to_maturity) / (
-                 self.volatility * math.sqrt(self.time_to_maturity))
-        d2 = d1 - self.volatility * math.sqrt(self.time_to_maturity)
-        return d1, d2
-
-    def get_price_and_greeks(self):
-        result_price = self._calculate_option_price()
-        delta = self._calculate_delta()
-        gamma = self._calculate_gamma()
-        theta = self._calculate_theta()
-        rho = self._calculate_rho()
-        vega = self._calculate_vega()
-        return result_price, delta, gamma, theta, rho, vega
-
-    def _calculate_option_price(self):
-        if self.call_put.upper() == 'CALL':
-            return norm.cdf(self.d1) * self.underlying_price - norm.cdf(self.d2) * self.strike_price * math.exp(
-                -self.rate * self.time_to_maturity)
-        elif self.call_put.upper() == 'PUT':
-            return self.strike_price * math.exp(-self.rate * self.time_to_maturity) * norm.cdf(
-                -self.d2) - self.underlying_price * norm.cdf(-self.d1)
-
-    def _calculate_delta(self):
-        if self.call_put.upper() == 'CALL':
-            return norm.cdf(self.d1)
-        elif self.call_put.upper() == 'PUT':
-            return norm.cdf(self.d1) - 1
-
-    def _calculate_gamma(self):
-        return norm.pdf(self.d1) / (self.underlying_price * self.volatility * math.sqrt(self.time_to_maturity))
-
-    def _calculate_theta(self):
-        if self.call_put.upper() == 'CALL':
-            return -((self.underlying_price * norm.pdf(self.d1) * self.volatility) / (
-                2 * math.sqrt(self.time_to_maturity)) - self.rate * self.strike_price * math.exp(
-                -self.rate * self.time_to_maturity) * norm.cdf(self.d2)) / 365
-        elif self.call_put.upper() == 'PUT':
-            return -((self.underlying_price * norm.pdf(self.d1) * self.volatility) / (
-                2 * math.sqrt(self.time_to_maturity)) + self.rate * self.strike_price * math.exp(
-                -self.rate * self.time_to_maturity) * (1 - norm.cdf(self.d2))) / 365
-
-    def _calculate_rho(self):
-        if self.call_put.upper() == 'CALL':
-            return 0.01 * self.time_to_maturity * self.strike_price * math.exp(
-                - self.rate * self.time_to_maturity) * norm.cdf(self.d2)
-        elif self.call_put.upper() == 'PUT':
-            return -0.01 * self.time_to_maturity * self.strike_price * math.exp(
-                - self.rate * self.time_to_maturity) * (1 - norm.cdf(self.d2))
-
-    def _calculate_vega(self):
-        return 0.01 * self.underlying_price * math.sqrt(self.time_to_maturity) * norm.pdf(self.d1)
-
-
-class BondPricer:
-    def __init__(self, par_value, annual_discount_rate, annual_coupon_rate, maturity, coupon_periodicity):
-        self.par_value = par_value
-        self.annual_discount_rate = annual_discount_rate
-        self.annual_coupon_rate = annual_coupon_rate
-        self.maturity = maturity
-        self.coupon_periodicity = self._get_coupon_periodicity(coupon_periodicity)
-        self.nb_coupons = self.maturity * self.coupon_periodicity
-        self.coupons = self._get_coupons()
-        self.price, self.sensitivity, self.convexity = self._calculate_price_and_trading_indicators()
-
-    @staticmethod
-    def _get_coupon_periodicity(coupon_periodicity):
-        dic_convert_coupons = {'no_coupon': 0, 'monthly': 12, 'quarterly': 4, 'semi_annual': 2, 'annual': 1}
-        if coupon_periodicity in dic_convert_coupons.keys():
-            return dic_convert_coupons[coupon_periodicity]
-        else:
-            return None
-
-    def _get_coupons(self):
-        if self.nb_coupons != 0:
-            result_df = pd.DataFrame(data=np.arange(1, 1 + self.nb_coupons), columns=['Period'])
-            result_df['Payment'] = self.par_value * self.annual_coupon_rate
-            result_df['PresentValue'] = result_df.apply(self._calculate_present_value, axis=1)
-            return result_df
-        else:
-            return pd.DataFrame(columns=['Period', 'Payment', 'PresentValue'])
-
-    def _calculate_present_value(self, x):
-        return round(x['Payment'] * (1 / (1 + self.annual_discount_rate) ** x['Period']), 2)
-
-    def _calculate_price_and_trading_indicators(self):
-        price = self._get_price()
-        sensitivity = self._get_sensitivity(price)
-        convexity = self._get_convexity(price)
-        return price, sensitivity, convexity
-
-    def _get_price(self):
-        return self.coupons['PresentValue'].sum() + self.par_value / ((1 + self.annual_discount_rate) ** self.maturity)
-
-    def _get_sensitivity(self, price):
-        if self.coupons.empty:
-            sensitivity = 0
-        else:
-            self.coupons['IntermediaryCalculSensitivity'] = self.coupons.apply(self._intermediate_calculus_sensitivity,
-                                                                               axis=1)
-            duration = self.coupons['IntermediaryCalculSensitivity'].sum() / price
-            sensitivity = duration / (1 + self.annual_discount_rate)
-        return sensitivity
-
-    def _get_convexity(self, price):
-        if self.coupons.empty:
-            convexity = 0
-        else:
-            self.coupons['IntermediaryCalculConvexity'] = self.coupons.apply(self._intermediate_calculus_convexity,
-                                                                             axis=1)
-            duration = self.coupons['IntermediaryCalculConvexity'].sum() / price
-            convexity = duration / (1 + self.annual_discount_rate) * (1 + self.annual_discount_rate)
-        return convexity
-
-    def _intermediate_calculus_sensitivity(self, x):
-        return x['PresentValue'] * x['Period'] / self.coupon_periodicity
-
-    def _intermediate_calculus_convexity(self, x):
-        return x['PresentValue'] * x['Period'] / (
-            self.coupon_periodicity * self.coupon_periodicity + self.coupon_periodicity)
+from flask import Flask, Response, request, jsonify, render_template
+
+from PythonCourseForBanking.pricing import blueprints
+from PythonCourseForBanking.pricing.blueprints import bonds_blueprint, options_blueprint, pricing_cache
+from PythonCourseForBanking.pricing.cache import PricingCache
+from PythonCourseForBanking.pricing.payload import PayloadError, read_columns
+from PythonCourseForBanking.website.metrics import instrument_app
+from PythonCourseForBanking.yahoofinance.chart_payload import make_historical_payload, serialize_highcharts
+from PythonCourseForBanking.yahoofinance.market_data_store import BackgroundRefresher, HistoricalPriceStore
+from PythonCourseForBanking.yahoofinance.quote_stream import QuoteBook, QuoteStream, tick_source_from_environment
+
+app = instrument_app(Flask(__name__), 'website')
+app.register_blueprint(options_blueprint)
+app.register_blueprint(bonds_blueprint)
+market_data_store = HistoricalPriceStore(os.path.join(app.root_path, 'market_data'))
+# charts are served from the store while stale tickers are refreshed on the side, their serialized Highcharts
+# payloads are cached per ticker, date range and resolution
+chart_refresher = BackgroundRefresher(market_data_store)
+chart_cache = PricingCache(max_bytes=64 * 1024 * 1024, ttl=24 * 3600)
+# intraday analytics of the ticks posted to /quotes, or of the feed PRICING_QUOTE_SOURCE names. The book is per
+# process: each worker of wsgi.py has its own, fed by its own stream
+quote_book = QuoteBook()
+quote_stream = None
+quote_stream_pid = None
+quote_stream_lock = threading.Lock()
+
+
+def start_quote_stream():
+    # the feed is consumed on a thread of the process serving the requests, started by its first request rather
+    # than at import: a thread started before the workers are forked would only run in the master
+    global quote_stream, quote_stream_pid
+    if quote_stream_pid != os.getpid():
+        with quote_stream_lock:
+            if quote_stream_pid != os.getpid():
+                source = tick_source_from_environment()
+                quote_stream = QuoteStream(source, quote_book).start() if source is not None else None
+                quote_stream_pid = os.getpid()
+    return quote_stream
+
+
+@app.before_request
+def ensure_quote_stream():
+    start_quote_stream()
 
 
 @app.route('/')
@@ -153,42 +54,17 @@ def index():
     return render_template('layout.html')
 
 
-@app.route('/price_bonds')
-def price_bonds():
-    par_value = request.args.get('par_value', 0, type=float)
-    annual_discount_rate = request.args.get('annual_discount_rate', 0, type=float)
-    annual_coupon_rate = request.args.get('annual_coupon_rate', 0, type=float)
-    maturity = request.args.get('maturity', 0, type=float)
-    coupon_periodicity = request.args.get('coupon_periodicity', 0, type=str)
-    bond_pricer = BondPricer(par_value=par_value, annual_discount_rate=annual_discount_rate,
-                             annual_coupon_rate=annual_coupon_rate, maturity=maturity,
-                             coupon_periodicity=coupon_periodicity)
-    return jsonify(price=round(bond_pricer.price, 2),
-                   coupons=bond_pricer.coupons[['Period', 'Payment', 'PresentValue']].to_dict(orient='records'),
-                   sensitivity=round(bond_pricer.sensitivity, 4),
-                   convexity=round(bond_pricer.convexity, 4))
-
-
-@app.route('/price_with_blackscholes')
-def price_with_blackscholes():
-    underlying_price = request.args.get('underlying_price', 0, type=float)
-    strike_price = request.args.get('strike_price', 0, type=float)
-    rate = request.args.get('rate', 0, type=float)
-    time_to_maturity = request.args.get('time_to_maturity', 0, type=float)
-    volatility = request.args.get('volatility', 0, type=float)
-    call_put = request.args.get('call_put', 0, type=str)
-    bsp = BlackScholesPricer(underlying_price=underlying_price,
-                             strike_price=strike_price,
-                             rate=rate,
-                             time_to_maturity=time_to_maturity,
-                             volatility=volatility,
-                             call_put=call_put)
-    return jsonify(option_price=round(bsp.option_price, 5),
-                   delta=round(bsp.delta, 5),
-                   gamma=round(bsp.gamma, 5),
-                   theta=round(bsp.theta, 5),
-                   rho=round(bsp.rho, 5),
-                   vega=round(bsp.vega, 5))
+@app.route('/cache_stats')
+def cache_stats():
+    return jsonify(**pricing_cache.stats())
+
+
+@app.route('/batching_stats')
+def batching_stats():
+    # per worker process, empty unless micro-batching was enabled (see wsgi.py)
+    return jsonify({name: batcher.stats() for name, batcher in (('options', blueprints.option_batcher),
+                                                                ('bonds', blueprints.bond_batcher))
+                    if batcher is not None})
 
 
 @app.route('/blackscholes')
@@ -201,25 +77,65 @@ def bondpricer():
     return render_template('bondpricer.html')
 
 
+def get_chart_payload(code, start_date, end_date, max_points, method):
+    records = chart_refresher.load(code)
+    # the number of records and the last stored bar change the key once a background refresh has landed: a refresh
+    # starts from the last stored date, so it can revise that bar (its close, its volume) without adding any
+    params = dict(code=code, start_date=start_date, end_date=end_date, max_points=max_points, method=method,
+                  nb_records=int(records.size), last_bar=records[-1].tobytes().hex() if records.size else '')
+    return chart_cache.get_or_compute('chart', params, lambda: serialize_highcharts(make_historical_payload(
+        HistoricalPriceStore.select(records, start_date, end_date), max_points=max_points, method=method)))
+
+
+def _chart_payload_from_request(code):
+    return get_chart_payload(code,
+                             start_date=request.args.get('start_date', '2017-01-01', type=str),
+                             end_date=request.args.get('end_date', datetime.date.today().strftime('%Y-%m-%d'),
+                                                       type=str),
+                             max_points=request.args.get('max_points', 500, type=int),
+                             method=request.args.get('method', 'lttb', type=str))
+
+
 @app.route('/chart/share/', defaults={'code': 'YHOO'})
 @app.route('/chart/share/<code>')
 def function_chart(code):
-    share = Share(code)
-    historicals = (share.get_historical('2017-01-01', datetime.datetime.today().strftime('%Y-%m-%d')))
-    result_df = pd.DataFrame(data=historicals)
-    chart_id = 'chart_ID'
-    chart_type = 'line'
-    chart_height = 500
-    chart_width = 1000
-    chart = {"renderTo": chart_id, "type": chart_type, "height": chart_height, "width": chart_width}
-    series = [{"name": 'Close', "data": result_df["Close"].astype(float).tolist()},
-              {"name": 'Low', "data": result_df["Low"].astype(float).tolist()},
-              {"name": 'High', "data": result_df["High"].astype(float).tolist()}]
-    title = {"text": 'My awesome HighChart'}
-    xAxis = {"categories": result_df["Date"].tolist()}
-    yAxis = {"title": {"text": 'Price Ccy'}}
-    return render_template('index.html', chartID=chart_id, chart=chart, series=series, title=title, xAxis=xAxis,
-                           yAxis=yAxis)
+    return render_template('index.html', chartID='chart_ID', payload=_chart_payload_from_request(code))
+
+
+@app.route('/chart/share/<code>/data')
+def function_chart_data(code):
+    return Response(_chart_payload_from_request(code), mimetype='application/json')
+
+
+@app.route('/quotes')
+def quotes():
+    # every ticker seen so far, or the comma separated ?tickers= (null statistics for a ticker without ticks)
+    tickers = request.args.get('tickers', None, type=str)
+    # stream is the state of the PRICING_QUOTE_SOURCE feed of this worker, null without one
+    stream = start_quote_stream()
+    return jsonify(quotes=quote_book.to_records(tickers.split(',') if tickers else None),
+                   nb_ticks=quote_book.nb_ticks_total, stream=stream.status() if stream is not None else None)
+
+
+@app.route('/quotes/<ticker>')
+def quote(ticker):
+    if ticker not in quote_book:
+        return jsonify(error='no tick received for %s' % ticker), 404
+    return jsonify(**quote_book.to_records([ticker])[0])
+
+
+@app.route('/quotes', methods=['POST'])
+def post_quotes():
+    # pushes ticks as columns or records of ticker, price, and optionally timestamp (now) and volume (0)
+    try:
+        ticks = read_columns(request, ['ticker', 'timestamp', 'price', 'volume'],
+                             defaults={'timestamp': time.time(), 'volume': 0.})
+        tickers, timestamps, prices, volumes = np.broadcast_arrays(
+            ticks['ticker'], ticks['timestamp'], ticks['price'], ticks['volume'])
+        quote_book.ingest_many(tickers.ravel(), timestamps.ravel(), prices.ravel(), volumes.ravel())
+    except (PayloadError, ValueError, TypeError) as e:
+        return jsonify(error=str(e)), 400
+    return jsonify(ingested=int(tickers.size), nb_ticks=quote_book.nb_ticks_total)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,101 @@
+import argparse
+import os
+import signal
+import socket
+import threading
+
+from PythonCourseForBanking.pricing.batching import InFlightRequests
+from PythonCourseForBanking.pricing.blueprints import enable_micro_batching, preload_pricers, share_curves
+from PythonCourseForBanking.website.website import app, start_quote_stream
+
+# production entry point of the website, see README.md:
+#   gunicorn --preload -w 4 -k gthread --threads 16 -b 0.0.0.0:8000 PythonCourseForBanking.website.wsgi:application
+# or, without gunicorn, the pre-forking server below:
+#   python -m PythonCourseForBanking.website.wsgi --workers 4 --threads 16 --port 8000
+# The pricers are loaded here, before the workers are forked, the quote stream of PRICING_QUOTE_SOURCE is started
+# in each worker after the fork. Micro-batching is on unless PRICING_MICRO_BATCHING=0, PRICING_BATCH_WINDOW_MS and
+# PRICING_BATCH_SIZE tune it.
+preload_pricers()
+# the curves built or bumped through any worker are shared through this directory
+share_curves(os.environ.get('PRICING_CURVE_DIR', os.path.join(app.root_path, 'curves')))
+application = InFlightRequests(app)
+if os.environ.get('PRICING_MICRO_BATCHING', '1') != '0':
+    enable_micro_batching(window=float(os.environ.get('PRICING_BATCH_WINDOW_MS', '2')) / 1000,
+                          max_batch_size=int(os.environ.get('PRICING_BATCH_SIZE', '256')),
+                          concurrency=application.count)
+
+
+def _make_worker_server(listener, threads):
+    from werkzeug.serving import ThreadedWSGIServer, WSGIRequestHandler
+
+    class RequestHandler(WSGIRequestHandler):
+        # the access log of the development server costs more than a pricing, /metrics counts the requests
+        def log_request(self, *args, **kwargs):
+            pass
+
+    class WorkerServer(ThreadedWSGIServer):
+        # a thread per connection as in werkzeug, bounded to threads connections at once
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.slots = threading.BoundedSemaphore(threads)
+
+        def process_request(self, request, client_address):
+            self.slots.acquire()
+            super().process_request(request, client_address)
+
+        def process_request_thread(self, request, client_address):
+            try:
+                super().process_request_thread(request, client_address)
+            finally:
+                self.slots.release()
+
+    host, port = listener.getsockname()[:2]
+    return WorkerServer(host, port, application, handler=RequestHandler, fd=listener.fileno())
+
+
+def serve(host='127.0.0.1', port=8000, workers=None, threads=16, backlog=1024):
+    # the listening socket is opened once and shared by workers forked processes, each serving its connections on
+    # up to threads threads; SIGINT or SIGTERM stops them all
+    workers = workers or os.cpu_count() or 1
+    listener = socket.create_server((host, port), backlog=backlog)
+    listener.setblocking(False)  # the workers race for each connection, the losers go back to waiting
+    children = list()
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, lambda *_: os._exit(0))
+            start_quote_stream()  # the first request would start it, the worker starts ingesting right away instead
+            _make_worker_server(listener, threads).serve_forever()
+            os._exit(0)
+        children.append(pid)
+    print('Serving on http://%s:%d with %d workers of %d threads' % (host, listener.getsockname()[1], workers,
+                                                                      threads), flush=True)
+
+    def stop(*_):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        while children:
+            pid, _ = os.wait()
+            children.remove(pid)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+        listener.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serves the website on pre-forked worker processes')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, one per CPU by default')
+    parser.add_argument('--threads', type=int, default=16, help='concurrent requests per worker')
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers, args.threads)
@@ -0,0 +1,73 @@
+import json
+
+import numpy as np
+
+
+def lttb_indices(values, nb_points):
+    # Largest-Triangle-Three-Buckets: keeps the first and last points and, in each bucket in between, the point
+    # forming the largest triangle with the point kept before it and the average of the next bucket
+    values = np.asarray(values, dtype=float)
+    size = values.size
+    if nb_points >= size or nb_points < 3:
+        return np.arange(size)
+    x = np.arange(size, dtype=float)
+    edges = np.linspace(1, size - 1, nb_points - 1).astype(int)
+    indices = np.empty(nb_points, dtype=int)
+    indices[0], indices[-1] = 0, size - 1
+    previous = 0
+    for bucket in range(nb_points - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        next_start, next_stop = stop, edges[bucket + 2] if bucket + 2 < len(edges) else size
+        next_x, next_y = x[next_start:next_stop].mean(), values[next_start:next_stop].mean()
+        areas = np.abs((x[previous] - next_x) * (values[start:stop] - values[previous]) -
+                       (x[previous] - x[start:stop]) * (next_y - values[previous]))
+        previous = start + int(np.nanargmax(areas)) if np.isfinite(areas).any() else start
+        indices[bucket + 1] = previous
+    return indices
+
+
+def minmax_indices(values, nb_points):
+    # keeps the lowest and the highest point of each of nb_points / 2 buckets, in time order
+    values = np.asarray(values, dtype=float)
+    size = values.size
+    if nb_points >= size or nb_points < 2:
+        return np.arange(size)
+    edges = np.linspace(0, size, nb_points // 2 + 1).astype(int)
+    indices = set()
+    for start, stop in zip(edges[:-1], edges[1:]):
+        if stop > start:
+            indices.add(start + int(np.nanargmin(values[start:stop])))
+            indices.add(start + int(np.nanargmax(values[start:stop])))
+    return np.array(sorted(indices), dtype=int)
+
+
+def downsample_indices(values, nb_points, method='lttb'):
+    if method == 'minmax':
+        return minmax_indices(values, nb_points)
+    return lttb_indices(values, nb_points)
+
+
+def make_highcharts_payload(categories, series, chart_id='chart_ID', chart_type='line', title='', y_title='',
+                            height=500, width=1000):
+    # the options object given to $(chart_id).highcharts(...), series is a list of (name, values)
+    return {'chart': {'renderTo': chart_id, 'type': chart_type, 'height': height, 'width': width},
+            'title': {'text': title},
+            'xAxis': {'categories': list(categories)},
+            'yAxis': {'title': {'text': y_title}},
+            'series': [{'name': name, 'data': np.asarray(values, dtype=float).tolist()} for name, values in series]}
+
+
+def serialize_highcharts(payload):
+    # NaN is not valid JSON, Highcharts reads null as a missing point
+    payload = dict(payload, series=[dict(serie, data=[None if value != value else value for value in serie['data']])
+                                    for serie in payload['series']])
+    return json.dumps(payload, default=str)
+
+
+def make_historical_payload(result_df, max_points=500, method='lttb', title='My awesome HighChart'):
+    # Close, Low and High of a historical DataFrame, downsampled on Close so every series keeps the same dates
+    indices = downsample_indices(result_df['Close'].values, max_points, method)
+    return make_highcharts_payload(categories=result_df['Date'].values[indices],
+                                   series=[(column, result_df[column].values[indices])
+                                           for column in ('Close', 'Low', 'High')],
+                                   title=title, y_title='Price Ccy')
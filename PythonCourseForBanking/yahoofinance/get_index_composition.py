@@ -1,22 +1,122 @@
 import datetime
+import json
+import os
+import time
+import urllib.error
 import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
+import numpy as np
 import pandas as pd
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 from pandas.tseries.offsets import BDay
-from pandas_highcharts import core
 from yahoo_finance import Share
 
+from PythonCourseForBanking.yahoofinance.chart_payload import make_highcharts_payload, serialize_highcharts
+
+
+def fetch_yahoo_quote(ticker):
+    share = Share(ticker)
+    return share.get_price(), share.get_avg_daily_volume()
+
+
+def _fetch_with_retries(quote_fetcher, ticker, max_retries, backoff):
+    for attempt in range(max_retries + 1):
+        try:
+            return quote_fetcher(ticker)
+        except Exception:
+            if attempt == max_retries:
+                raise
+            time.sleep(backoff * 2 ** attempt)
+
+
+def download_quotes(sector_tickers, on_result, quote_fetcher=fetch_yahoo_quote, max_workers=8, max_retries=3,
+                    backoff=0.5):
+    # downloads the quotes of every ticker on a thread pool, each result is passed to on_result as soon as it arrives
+    # (on the calling thread) and the tickers still failing after their retries are returned with their error
+    # instead of stopping the others
+    failures = dict()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(_fetch_with_retries, quote_fetcher, ticker, max_retries, backoff): (sector, ticker)
+                   for sector, tickers in sector_tickers.items() for ticker in tickers}
+        for future in as_completed(futures):
+            sector, ticker = futures[future]
+            try:
+                price, adv = future.result()
+            except Exception as e:
+                failures[ticker] = repr(e)
+                continue
+            on_result({'ticker': ticker, 'sector': sector, 'price': price, 'adv': adv})
+    return failures
+
+
+def _quote_to_float(value):
+    # Yahoo quotes are strings, an unreadable one becomes nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+
+# the Wikipedia page of each index and the columns of its composition table holding the ticker and the sector;
+# an index added here can be parsed and analysed with the others (see index_analytics.load_universe)
+INDEX_DEFINITIONS = {'CAC40': {'url': 'https://en.wikipedia.org/wiki/CAC_40#Composition',
+                               'col_ticker': 0,
+                               'col_sector': 2},
+                     'SMI': {'url': 'https://en.wikipedia.org/wiki/Swiss_Market_Index#Constituents',
+                             'col_ticker': 3,
+                             'col_sector': 1},
+                     'SP500': {'url': 'https://en.wikipedia.org/wiki/List_of_S%26P_500_companies',
+                               'col_ticker': 0,
+                               'col_sector': 2}}
+
+
+class CompositionCache:
+    # index compositions change a few times a year: they are kept on disk with the validators of the page they come
+    # from, trusted as is during ttl seconds and revalidated with a conditional request afterwards
+    def __init__(self, directory, ttl=7 * 24 * 3600):
+        self.directory = directory
+        self.ttl = ttl
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, index):
+        return os.path.join(self.directory, index + '.json')
+
+    def get(self, index):
+        path = self._path(index)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def is_fresh(self, entry):
+        return time.time() - entry['fetched_at'] < self.ttl
+
+    def put(self, index, sector_tickers, etag=None, last_modified=None):
+        entry = {'sector_tickers': sector_tickers, 'etag': etag, 'last_modified': last_modified,
+                 'fetched_at': time.time()}
+        with open(self._path(index), 'w') as f:
+            json.dump(entry, f)
+        return entry
+
+    def touch(self, index, entry):
+        return self.put(index, entry['sector_tickers'], entry['etag'], entry['last_modified'])
+
 
 class IndexParser:
-    def __init__(self, index, start_date, end_date):
-        self.dic_index = {'CAC40': {'url': 'https://en.wikipedia.org/wiki/CAC_40#Composition',
-                                    'col_ticker': 0,
-                                    'col_sector': 2},
-                          'SMI': {'url': 'https://en.wikipedia.org/wiki/Swiss_Market_Index#Constituents',
-                                  'col_ticker': 3,
-                                  'col_sector': 1}}
+    # building a parser is cheap, the composition and the quotes are only downloaded by load() or on first use
+    def __init__(self, index, start_date, end_date, max_workers=8, max_retries=3, backoff=0.5,
+                 quote_fetcher=fetch_yahoo_quote, composition_cache=None):
+        self.dic_index = INDEX_DEFINITIONS
         if index in self.dic_index.keys():
+            self.index = index
             self.site = self.dic_index[index]['url']
             self.col_ticker = self.dic_index[index]['col_ticker']
             self.col_sector = self.dic_index[index]['col_sector']
@@ -24,19 +124,54 @@ class IndexParser:
             self.end_date = end_date
             self.headers = {'User-Agent': 'Mozilla/5.0'}
             self.sector_tickers = dict()
-            self.results = list()
+            self.failures = dict()
             self.result_df = None
+            self.max_workers = max_workers
+            self.max_retries = max_retries
+            self.backoff = backoff
+            self.quote_fetcher = quote_fetcher
             self.chart = None
-            self.scrape_index_list()
-            self.download_data()
-            # self.make_json_highcharts()
+            self.composition_cache = composition_cache if composition_cache is not None else CompositionCache(
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'index_cache'))
         else:
             print('Index not in list')
 
-    def scrape_index_list(self):
-        req = urllib.request.Request(self.site, headers=self.headers)
-        page = urllib.request.urlopen(req)
-        soup = BeautifulSoup(page)
+    def load(self):
+        self.scrape_index_list()
+        self.download_data()
+        # self.make_json_highcharts()
+        return self
+
+    def scrape_index_list(self, force=False):
+        entry = self.composition_cache.get(self.index)
+        if entry is not None and not force and self.composition_cache.is_fresh(entry):
+            self.sector_tickers = entry['sector_tickers']
+            return
+
+        headers = dict(self.headers)
+        if entry is not None and entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry is not None and entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+        req = urllib.request.Request(self.site, headers=headers)
+        try:
+            page = urllib.request.urlopen(req)
+        except urllib.error.HTTPError as e:
+            if e.code != 304 or entry is None:
+                raise
+            # the page did not change since it was cached
+            self.composition_cache.touch(self.index, entry)
+            self.sector_tickers = entry['sector_tickers']
+            return
+
+        self.sector_tickers = self._parse_index_table(page.read())
+        self.composition_cache.put(self.index, self.sector_tickers, etag=page.headers.get('ETag'),
+                                   last_modified=page.headers.get('Last-Modified'))
+
+    def _parse_index_table(self, page):
+        # only the composition table is handed to the parser, the rest of the page is skipped
+        soup = BeautifulSoup(page, HTML_PARSER, parse_only=SoupStrainer('table', {'class': 'wikitable sortable'}))
+        sector_tickers = dict()
 
         table = soup.find('table', {'class': 'wikitable sortable'})
         for row in table.findAll('tr'):
@@ -44,28 +179,69 @@ class IndexParser:
             if len(col) > 0:
                 sector = str(col[self.col_sector].string.strip()).lower().replace(' ', '_')
                 ticker = str(col[self.col_ticker].string.strip())
-                if sector not in self.sector_tickers:
-                    self.sector_tickers[sector] = list()
-                self.sector_tickers[sector].append(ticker)
+                if sector not in sector_tickers:
+                    sector_tickers[sector] = list()
+                sector_tickers[sector].append(ticker)
+        return sector_tickers
 
     def download_data(self):
-        for sector, tickers in self.sector_tickers.items():
-            print('Downloading data from Yahoo for %s sector' % sector)
-            for ticker in tickers:
-                share = Share(ticker)
-                price = share.get_price()
-                adv = share.get_avg_daily_volume()
-                data = {'ticker': ticker, 'sector': sector, 'price': price, 'adv': adv}
-                self.results.append(data)
-        self.result_df = pd.DataFrame(self.results)
+        if not self.sector_tickers:
+            self.scrape_index_list()
+        print('Downloading data from Yahoo for %d sectors' % len(self.sector_tickers))
+        # each quote is written into its row of the table as soon as it arrives, the rows keep the order of the
+        # index composition whatever the completion order
+        tickers = [ticker for tickers in self.sector_tickers.values() for ticker in tickers]
+        sectors = [sector for sector, tickers in self.sector_tickers.items() for _ in tickers]
+        row = {ticker: i for i, ticker in enumerate(tickers)}
+        price = np.full(len(tickers), np.nan)
+        adv = np.full(len(tickers), np.nan)
+        received = np.zeros(len(tickers), dtype=bool)
+
+        def store_quote(data):
+            i = row[data['ticker']]
+            price[i] = _quote_to_float(data['price'])
+            adv[i] = _quote_to_float(data['adv'])
+            received[i] = True
 
+        self.failures = download_quotes(self.sector_tickers, store_quote, quote_fetcher=self.quote_fetcher,
+                                        max_workers=self.max_workers, max_retries=self.max_retries,
+                                        backoff=self.backoff)
+        # the failed tickers are left out of the table
+        self.result_df = pd.DataFrame({'ticker': np.array(tickers, dtype=object)[received],
+                                       'sector': pd.Categorical(np.array(sectors, dtype=object)[received]),
+                                       'price': price[received], 'adv': adv[received]},
+                                      columns=['ticker', 'sector', 'price', 'adv'])
+
+        for ticker, error in self.failures.items():
+            print('Failed to download data for %s: %s' % (ticker, error))
         print('Finished downloading data')
 
+    def apply_live_quotes(self, quote_book):
+        # the price and adv columns are taken from a live QuoteBook (which can also be given as quote_fetcher=
+        # quote_book.quote); tickers without ticks keep their downloaded values, nan when nothing was downloaded
+        if self.result_df is None:
+            if not self.sector_tickers:
+                self.scrape_index_list()
+            self.result_df = pd.DataFrame([{'ticker': ticker, 'sector': sector}
+                                           for sector, tickers in self.sector_tickers.items() for ticker in tickers],
+                                          columns=['ticker', 'sector', 'price', 'adv'])
+        live = quote_book.snapshot(self.result_df['ticker'].values)
+        for column, live_column in (('price', 'last_price'), ('adv', 'adv')):
+            downloaded = pd.to_numeric(self.result_df[column], errors='coerce').values
+            self.result_df[column] = np.where(np.isnan(live[live_column]), downloaded, live[live_column])
+        return self
+
+    def to_universe(self):
+        from PythonCourseForBanking.yahoofinance.index_analytics import IndexUniverse
+        return IndexUniverse.from_parsers([self])
+
     def make_json_highcharts(self):
-        self.chart = core.serialize(df=self.results, render_to='my-chart', output_type='json')
+        self.chart = serialize_highcharts(make_highcharts_payload(
+            categories=self.result_df['ticker'].values, series=[('price', self.result_df['price'].values)],
+            chart_id='my-chart', chart_type='column', title=self.index, y_title='Price Ccy'))
 
 
 if __name__ == '__main__':
     index_parser = IndexParser(index='CAC40',
                                start_date=datetime.datetime.today() + BDay(-1),
-                               end_date=datetime.datetime.today() + BDay(-1))
+                               end_date=datetime.datetime.today() + BDay(-1)).load()
@@ -0,0 +1,212 @@
+import numpy as np
+
+from PythonCourseForBanking.yahoofinance.chart_payload import make_highcharts_payload, serialize_highcharts
+
+WEIGHTINGS = ('cap', 'price', 'equal')
+AGGREGATE_COLUMNS = ['nb_constituents', 'weight', 'cap', 'liquidity', 'adv']
+
+
+def _codes(values):
+    # categorical encoding: the sorted distinct values, their lookup and the code of each value. Only the distinct
+    # values are sorted, sorting all the strings (np.unique) would cost more than the rest of the build
+    categories = sorted(dict.fromkeys(values))
+    lookup = {category: i for i, category in enumerate(categories)}
+    return np.array(categories, dtype=object), lookup, np.fromiter(map(lookup.__getitem__, values), dtype=np.int64,
+                                                                   count=len(values))
+
+
+class IndexUniverse:
+    # constituents of several indexes as columns: one membership row per (index, ticker) with integer codes for the
+    # index, the sector and the ticker, and the quotes once per ticker, so a ticker listed in several indexes is
+    # updated once. The rows of an index are contiguous and keep the order of its composition.
+    def __init__(self, compositions):
+        # compositions: {index: {sector: [tickers]}}, the sector_tickers of an IndexParser per index
+        blocks = [(index, sector, members) for index, sector_tickers in compositions.items()
+                  for sector, members in sector_tickers.items()]
+        lengths = [len(members) for _, _, members in blocks]
+        self.indexes, self.index_lookup, index_codes = _codes([index for index, _, _ in blocks])
+        self.sectors, _, sector_codes = _codes([sector for _, sector, _ in blocks])
+        self.tickers, self.ticker_lookup, self.ticker_codes = _codes([ticker for _, _, members in blocks
+                                                                      for ticker in members])
+        self.index_codes, self.sector_codes = np.repeat(index_codes, lengths), np.repeat(sector_codes, lengths)
+        order = np.argsort(self.index_codes, kind='stable')
+        self.index_codes, self.sector_codes, self.ticker_codes = \
+            self.index_codes[order], self.sector_codes[order], self.ticker_codes[order]
+        self.index_offsets = np.searchsorted(self.index_codes, np.arange(self.indexes.size + 1))
+        # the membership rows of each ticker, as slices of ticker_rows
+        self.ticker_rows = np.argsort(self.ticker_codes, kind='stable')
+        self.ticker_offsets = np.searchsorted(self.ticker_codes[self.ticker_rows], np.arange(self.tickers.size + 1))
+        self.price = np.full(self.tickers.size, np.nan)
+        self.adv = np.full(self.tickers.size, np.nan)
+        self.shares = np.full(self.tickers.size, np.nan)
+
+    def __len__(self):
+        return self.index_codes.size
+
+    @classmethod
+    def from_parsers(cls, parsers):
+        # IndexParsers with their composition scraped, and their quotes when they were downloaded
+        universe = cls({parser.index: parser.sector_tickers for parser in parsers})
+        for parser in parsers:
+            if parser.result_df is not None:
+                universe.update_quotes(parser.result_df['ticker'].values, price=parser.result_df['price'].values,
+                                       adv=parser.result_df['adv'].values)
+        return universe
+
+    def lookup(self, tickers):
+        # ticker codes, -1 for the tickers of no index
+        return np.fromiter(map(self.ticker_lookup.get, tickers, [-1] * len(tickers)), dtype=np.int64,
+                           count=len(tickers))
+
+    def rows(self, ticker):
+        # the membership rows of a ticker, one per index it belongs to
+        code = self.ticker_lookup[ticker]
+        return self.ticker_rows[self.ticker_offsets[code]:self.ticker_offsets[code + 1]]
+
+    def index_rows(self, index):
+        code = self.index_lookup[index]
+        return slice(self.index_offsets[code], self.index_offsets[code + 1])
+
+    def update_quotes(self, tickers, price=None, adv=None, shares=None):
+        # the quotes of tickers of no index are ignored, as are missing (None or nan) values; Yahoo gives strings
+        codes = self.lookup(np.asarray(tickers, dtype=object).ravel().tolist())
+        known = codes >= 0
+        for column, values in (('price', price), ('adv', adv), ('shares', shares)):
+            if values is None:
+                continue
+            values = np.broadcast_to(_to_float(values), codes.shape)
+            valid = known & ~np.isnan(values)
+            getattr(self, column)[codes[valid]] = values[valid]
+        return self
+
+    def apply_quote_book(self, quote_book):
+        # live last prices and ADVs of a QuoteBook, for the tickers it has ticks for
+        snapshot = quote_book.snapshot(self.tickers)
+        return self.update_quotes(self.tickers, price=snapshot['last_price'], adv=snapshot['adv'])
+
+    def _raw_weights(self, weighting):
+        # cap weighting needs the shares outstanding, which only update_quotes(shares=...) provides: the quotes
+        # downloaded by IndexParser carry a price and an adv, hence price weighting by default
+        price = self.price[self.ticker_codes]
+        if weighting == 'cap':
+            raw = price * self.shares[self.ticker_codes]
+        elif weighting == 'price':
+            raw = price
+        elif weighting == 'equal':
+            raw = np.ones(price.size)
+        else:
+            raise ValueError('weighting must be one of %s' % ', '.join(WEIGHTINGS))
+        # a constituent without a quote weighs nothing
+        return np.nan_to_num(raw)
+
+    def weights(self, weighting='price'):
+        # weight of each membership row in its index
+        raw = self._raw_weights(weighting)
+        totals = np.bincount(self.index_codes, weights=raw, minlength=self.indexes.size)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return raw / totals[self.index_codes]
+
+    def aggregate(self, weighting='price', by_sector=True):
+        # one row per (index, sector), or per index, computed with bincount on the codes: number of constituents,
+        # weight, market cap, liquidity (traded value a day, price * adv) and adv
+        nb_sectors = self.sectors.size if by_sector else 1
+        keys = self.index_codes * nb_sectors + (self.sector_codes if by_sector else 0)
+        minlength = self.indexes.size * nb_sectors
+        price, adv = self.price[self.ticker_codes], self.adv[self.ticker_codes]
+        values = {'nb_constituents': np.ones(keys.size), 'weight': np.nan_to_num(self.weights(weighting)),
+                  'cap': np.nan_to_num(price * self.shares[self.ticker_codes]),
+                  'liquidity': np.nan_to_num(price * adv), 'adv': np.nan_to_num(adv)}
+        counts = np.bincount(keys, minlength=minlength)
+        present = np.flatnonzero(counts)
+        result = {'index': self.indexes[present // nb_sectors]}
+        if by_sector:
+            result['sector'] = self.sectors[present % nb_sectors]
+        for column in AGGREGATE_COLUMNS:
+            result[column] = np.bincount(keys, weights=values[column], minlength=minlength)[present]
+        return result
+
+    def to_dataframe(self):
+        import pandas as pd
+        return pd.DataFrame({'index': pd.Categorical.from_codes(self.index_codes, self.indexes),
+                             'sector': pd.Categorical.from_codes(self.sector_codes, self.sectors),
+                             'ticker': self.tickers[self.ticker_codes],
+                             'price': self.price[self.ticker_codes],
+                             'adv': self.adv[self.ticker_codes],
+                             'shares': self.shares[self.ticker_codes]})
+
+    def constituents_payload(self, index, column='price', chart_id='my-chart'):
+        # the column chart of IndexParser.make_json_highcharts: one bar per constituent, in composition order
+        rows = self.index_rows(index)
+        return make_highcharts_payload(categories=self.tickers[self.ticker_codes[rows]],
+                                       series=[(column, getattr(self, column)[self.ticker_codes[rows]])],
+                                       chart_id=chart_id, chart_type='column', title=index, y_title='Price Ccy')
+
+    def sectors_payload(self, indexes=None, column='weight', weighting='price', chart_id='my-chart'):
+        # one bar per sector and one series per index, so several indexes can be compared on one chart
+        aggregated = self.aggregate(weighting=weighting)
+        indexes = list(self.indexes) if indexes is None else list(indexes)
+        sectors = np.unique(aggregated['sector'][np.isin(aggregated['index'], indexes)].astype(str))
+        series = list()
+        for index in indexes:
+            rows = aggregated['index'] == index
+            values = np.full(sectors.size, np.nan)
+            values[np.searchsorted(sectors, aggregated['sector'][rows].astype(str))] = aggregated[column][rows]
+            series.append((index, values))
+        return make_highcharts_payload(categories=sectors, series=series, chart_id=chart_id, chart_type='column',
+                                       title='Sector %s' % column, y_title=column)
+
+    def make_json_highcharts(self, index, column='price'):
+        return serialize_highcharts(self.constituents_payload(index, column=column))
+
+
+def _to_float(values):
+    # strings, None and numbers to floats, nan for what cannot be read
+    values = np.asarray(values)
+    if values.dtype.kind in 'iuf':
+        return values.astype(float)
+    try:
+        return values.astype(float)
+    except (TypeError, ValueError):
+        pass
+    result = np.full(values.shape, np.nan)
+    for i, value in enumerate(values.ravel().tolist()):
+        try:
+            result.flat[i] = float(value)
+        except (TypeError, ValueError):
+            pass
+    return result
+
+
+def load_universe(indexes, quote_fetcher=None, **parser_kwargs):
+    # scrapes the composition of every index, then downloads the quotes of their tickers once, on a single pool
+    from PythonCourseForBanking.yahoofinance.get_index_composition import INDEX_DEFINITIONS, IndexParser, \
+        download_quotes
+    unknown = [index for index in indexes if index not in INDEX_DEFINITIONS]
+    if unknown:
+        raise ValueError('unknown indexes %s, add them to INDEX_DEFINITIONS' % ', '.join(unknown))
+    if quote_fetcher is not None:
+        parser_kwargs['quote_fetcher'] = quote_fetcher
+    parsers = [IndexParser(index, None, None, **parser_kwargs) for index in indexes]
+    for parser in parsers:
+        parser.scrape_index_list()
+    universe = IndexUniverse.from_parsers(parsers)
+    results = list()
+    failures = download_quotes({'all': list(universe.tickers)}, results.append, quote_fetcher=parsers[0].quote_fetcher,
+                               max_workers=parsers[0].max_workers, max_retries=parsers[0].max_retries,
+                               backoff=parsers[0].backoff)
+    universe.update_quotes([data['ticker'] for data in results], price=[data['price'] for data in results],
+                           adv=[data['adv'] for data in results])
+    return universe, failures
+
+
+if __name__ == '__main__':
+    universe = IndexUniverse({'CAC40': {'banks': ['BNP.PA', 'GLE.PA', 'ACA.PA'], 'energy': ['TTE.PA']},
+                              'EURO_STOXX_50': {'banks': ['BNP.PA', 'SAN.MC'], 'energy': ['TTE.PA', 'ENI.MI']}})
+    universe.update_quotes(['BNP.PA', 'GLE.PA', 'ACA.PA', 'TTE.PA', 'SAN.MC', 'ENI.MI'],
+                           price=['60.1', '25.3', '13.2', '58.0', '4.1', '14.2'],
+                           adv=[3.1e6, 4.2e6, 5.0e6, 5.5e6, 3.0e7, 1.2e7],
+                           shares=[1.13e9, 0.8e9, 3.0e9, 2.4e9, 15.8e9, 3.2e9])
+    print(universe.to_dataframe())
+    print(universe.aggregate())
+    print(universe.make_json_highcharts('CAC40'))
+    print(serialize_highcharts(universe.sectors_payload()))
@@ -1,12 +1,13 @@
 import datetime
+import os
 from pprint import pprint
 
 from yahoo_finance import Share
 
-import pandas as pd
-
 import matplotlib.pyplot as plt
 
+from PythonCourseForBanking.yahoofinance.market_data_store import HistoricalPriceStore
+
 if __name__ == '__main__':
     yahoo = Share('YHOO')
 
@@ -24,12 +25,11 @@ if __name__ == '__main__':
     print(yahoo.get_dividend_yield())
     print(yahoo.get_50day_moving_avg())
 
-    pprint(yahoo.get_historical('2017-01-01', datetime.datetime.today().strftime('%Y-%m-%d')))
+    # historicals are kept on disk, only the days since the last run are downloaded
+    store = HistoricalPriceStore(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'market_data'))
+    result_df = store.get_historical('YHOO', datetime.date(2017, 1, 1))
+    pprint(result_df.to_dict(orient='records'))
 
     # display historical graph of Yahoo
-    historicals = (yahoo.get_historical('2017-01-01', datetime.datetime.today().strftime('%Y-%m-%d')))
-    result_df = pd.DataFrame(data=historicals)
-    result_df.set_index('Date')
-    result_df['Close'] = result_df['Close'].astype(float)
     plots = result_df[['Close', 'Date']].plot(x='Date', y='Close')
     plt.show()
\ No newline at end of file
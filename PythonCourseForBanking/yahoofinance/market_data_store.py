@@ -0,0 +1,161 @@
+import datetime
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+HISTORICAL_DTYPE = np.dtype([('Date', 'datetime64[D]'), ('Open', 'f8'), ('High', 'f8'), ('Low', 'f8'),
+                             ('Close', 'f8'), ('Adj_Close', 'f8'), ('Volume', 'f8')])
+
+
+class HistoricalFetcher:
+    # a fetcher returns the daily historicals of a ticker between two dates (inclusive) as a DataFrame with the
+    # columns of HISTORICAL_DTYPE, in any order
+    def fetch(self, ticker, start_date, end_date):
+        raise NotImplementedError
+
+
+class YahooHistoricalFetcher(HistoricalFetcher):
+    def fetch(self, ticker, start_date, end_date):
+        import pandas as pd
+        from yahoo_finance import Share
+        historicals = Share(ticker).get_historical(start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'))
+        return pd.DataFrame(data=historicals, columns=HISTORICAL_DTYPE.names)
+
+
+class DataFrameFetcher(HistoricalFetcher):
+    # local stand-in for the remote source, serves historicals from DataFrames kept in memory
+    def __init__(self, historicals):
+        self.historicals = historicals
+        self.nb_calls = 0
+
+    def fetch(self, ticker, start_date, end_date):
+        import pandas as pd
+        self.nb_calls += 1
+        df = self.historicals[ticker]
+        dates = pd.to_datetime(df['Date']).dt.date
+        return df[(dates >= start_date) & (dates <= end_date)]
+
+
+class HistoricalPriceStore:
+    # one memory-mapped .npy file of daily historicals per ticker, only the days after the last fetch are downloaded.
+    # pandas is only imported to convert the fetched or selected rows, a service start does not pay for it
+    def __init__(self, directory, fetcher=None, first_date=datetime.date(2017, 1, 1)):
+        self.directory = directory
+        self.fetcher = fetcher if fetcher is not None else YahooHistoricalFetcher()
+        self.first_date = first_date
+        self.lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, ticker, extension):
+        return os.path.join(self.directory, ticker.replace('/', '_') + extension)
+
+    def load(self, ticker):
+        path = self._path(ticker, '.npy')
+        if not os.path.exists(path):
+            return np.empty(0, dtype=HISTORICAL_DTYPE)
+        return np.load(path, mmap_mode='r')
+
+    def _fetched_until(self, ticker):
+        path = self._path(ticker, '.json')
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return datetime.datetime.strptime(json.load(f)['fetched_until'], '%Y-%m-%d').date()
+
+    @staticmethod
+    def _to_records(df):
+        import pandas as pd
+        records = np.empty(len(df), dtype=HISTORICAL_DTYPE)
+        records['Date'] = pd.to_datetime(df['Date']).values.astype('datetime64[D]')
+        for column in HISTORICAL_DTYPE.names[1:]:
+            records[column] = df[column].astype(float).values if column in df else np.nan
+        return records
+
+    def is_stale(self, ticker, end_date=None):
+        fetched_until = self._fetched_until(ticker)
+        return fetched_until is None or fetched_until < (end_date or datetime.date.today())
+
+    def refresh(self, ticker, end_date=None):
+        end_date = end_date or datetime.date.today()
+        with self.lock:
+            fetched_until = self._fetched_until(ticker)
+            if fetched_until is not None and fetched_until >= end_date:
+                return self.load(ticker)
+            # fetched_until is the last day the source was asked for, not the last day it had: the daily bar of
+            # today only exists after the close. The fetch restarts from the last stored day, so a day the source
+            # did not have yet is asked for again, and the last stored bar is replaced if it was revised
+            stored = np.array(self.load(ticker))
+            start_date = self.first_date if stored.size == 0 else stored['Date'][-1].astype(datetime.date)
+            new_records = self._to_records(self.fetcher.fetch(ticker, start_date, end_date))
+
+            # np.unique keeps the first row of each date, the fetched rows come first so they win over the stored ones
+            records = np.concatenate([new_records, stored])
+            _, unique_rows = np.unique(records['Date'], return_index=True)  # sorted by date, duplicates dropped
+            records = records[unique_rows]
+
+            # written aside then renamed, so a reader never maps a half-written file
+            tmp_path = self._path(ticker, '.npy.tmp')
+            with open(tmp_path, 'wb') as f:
+                np.save(f, records)
+            os.replace(tmp_path, self._path(ticker, '.npy'))
+            with open(self._path(ticker, '.json'), 'w') as f:
+                json.dump({'fetched_until': end_date.strftime('%Y-%m-%d')}, f)
+            return self.load(ticker)
+
+    def get_historical(self, ticker, start_date, end_date=None, refresh=True):
+        end_date = end_date or datetime.date.today()
+        records = self.refresh(ticker, end_date) if refresh else self.load(ticker)
+        return self.select(records, start_date, end_date)
+
+    @staticmethod
+    def select(records, start_date, end_date):
+        import pandas as pd
+        dates = records['Date']
+        first, last = np.searchsorted(dates, np.datetime64(start_date, 'D')), \
+            np.searchsorted(dates, np.datetime64(end_date, 'D'), side='right')
+        result_df = pd.DataFrame(records[first:last])
+        result_df['Date'] = result_df['Date'].dt.strftime('%Y-%m-%d')
+        return result_df
+
+
+class BackgroundRefresher:
+    # refreshes stale tickers of a store on worker threads, so a request can serve the stored historicals at once
+    # instead of waiting for the remote source; a ticker is never refreshed twice at the same time
+    def __init__(self, store, max_workers=2):
+        self.store = store
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.in_flight = dict()
+        self.lock = threading.RLock()
+
+    def schedule(self, ticker):
+        with self.lock:
+            future = self.in_flight.get(ticker)
+            if future is None:
+                future = self.executor.submit(self.store.refresh, ticker)
+                self.in_flight[ticker] = future
+                # runs right here when the refresh is already over, hence the reentrant lock
+                future.add_done_callback(lambda _: self._done(ticker))
+            return future
+
+    def _done(self, ticker):
+        with self.lock:
+            self.in_flight.pop(ticker, None)
+
+    def load(self, ticker):
+        # stored records right away, refreshed in the background when stale; only a ticker never stored before
+        # is waited for
+        records = self.store.load(ticker)
+        if records.size == 0:
+            self.schedule(ticker).result()
+            return self.store.load(ticker)
+        if self.store.is_stale(ticker):
+            self.schedule(ticker)
+        return records
+
+
+if __name__ == '__main__':
+    store = HistoricalPriceStore(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'market_data'))
+    print(store.get_historical('YHOO', datetime.date(2017, 1, 1)))
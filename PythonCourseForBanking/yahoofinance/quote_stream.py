@@ -0,0 +1,432 @@
+import logging
+import math
+import os
+import socket
+import socketserver
+import threading
+import time
+
+import numpy as np
+
+SECONDS_PER_DAY = 24 * 3600
+# 252 sessions of 6.5 hours, the EWMA variance is kept per second of trading and annualized with it
+TRADING_SECONDS_PER_YEAR = 252 * 6.5 * 3600
+SNAPSHOT_COLUMNS = ['last_price', 'timestamp', 'rolling_mean', 'ewma_volatility', 'vwap', 'adv', 'nb_ticks']
+
+logger = logging.getLogger(__name__)
+
+
+def parse_tick(line):
+    # "timestamp,ticker,price,volume" with the timestamp in seconds since the epoch; blank lines, comments, the
+    # header and malformed lines give None
+    line = line.strip()
+    if not line or line.startswith('#') or line.startswith('timestamp'):
+        return None
+    try:
+        timestamp, ticker, price, volume = line.split(',')
+        return ticker.strip(), float(timestamp), float(price), float(volume)
+    except ValueError:
+        return None
+
+
+def format_tick(ticker, timestamp, price, volume):
+    return '%.6f,%s,%r,%r\n' % (timestamp, ticker, float(price), float(volume))
+
+
+class TickSource:
+    # a source yields (ticker, timestamp, price, volume) ticks until it is exhausted or closed
+    def ticks(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class IterableTickSource(TickSource):
+    def __init__(self, ticks):
+        self._ticks = ticks
+
+    def ticks(self):
+        return iter(self._ticks)
+
+
+class FileReplaySource(TickSource):
+    # replays a file of ticks, as fast as it can be read or at speed times the pace of its timestamps
+    def __init__(self, path, speed=None):
+        self.path = path
+        self.speed = speed
+        self.closed = threading.Event()
+
+    def ticks(self):
+        first_timestamp, started = None, time.monotonic()
+        with open(self.path) as f:
+            for line in f:
+                if self.closed.is_set():
+                    return
+                tick = parse_tick(line)
+                if tick is None:
+                    continue
+                if self.speed:
+                    if first_timestamp is None:
+                        first_timestamp = tick[1]
+                    delay = (tick[1] - first_timestamp) / self.speed - (time.monotonic() - started)
+                    if delay > 0:
+                        self.closed.wait(delay)
+                yield tick
+
+    def close(self):
+        self.closed.set()
+
+
+class SocketTickSource(TickSource):
+    # reads newline separated ticks from a TCP feed, in the format of the replay files; each call to ticks() opens
+    # a new connection. A connection that fails raises its OSError, one closed by close() just ends the ticks
+    def __init__(self, host, port, timeout=None):
+        self.address = (host, port)
+        self.timeout = timeout
+        self.connection = None
+        self.closed = threading.Event()
+
+    def ticks(self):
+        if self.closed.is_set():
+            return
+        self.connection = socket.create_connection(self.address, timeout=self.timeout)
+        try:
+            with self.connection.makefile('r') as f:
+                for line in f:
+                    tick = parse_tick(line)
+                    if tick is not None:
+                        yield tick
+        except OSError:
+            if not self.closed.is_set():
+                raise
+        finally:
+            self.connection.close()
+
+    def close(self):
+        self.closed.set()
+        if self.connection is not None:
+            try:
+                self.connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+class YahooPollingSource(TickSource):
+    # polls the last quote of each ticker every interval seconds; Yahoo gives the volume traded since the open, the
+    # tick carries the volume traded since the previous poll
+    def __init__(self, tickers, interval=5.):
+        self.tickers = tickers
+        self.interval = interval
+        self.closed = threading.Event()
+
+    def ticks(self):
+        from yahoo_finance import Share
+        shares = {ticker: Share(ticker) for ticker in self.tickers}
+        day_volumes = dict()
+        while not self.closed.is_set():
+            for ticker, share in shares.items():
+                share.refresh()
+                price, day_volume = share.get_price(), share.get_volume()
+                if price is None:
+                    continue
+                day_volume = float(day_volume or 0)
+                previous = day_volumes.get(ticker, day_volume)
+                day_volumes[ticker] = day_volume
+                yield ticker, time.time(), float(price), day_volume - previous if day_volume >= previous else \
+                    day_volume
+            self.closed.wait(self.interval)
+
+    def close(self):
+        self.closed.set()
+
+
+class ReplayServer(socketserver.ThreadingTCPServer):
+    # local stand-in for a socket feed: every client gets the ticks of the file, at speed times their pace
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, path, address=('127.0.0.1', 0), speed=None):
+        self.path = path
+        self.speed = speed
+        super().__init__(address, _ReplayHandler)
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class _ReplayHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            for tick in FileReplaySource(self.server.path, speed=self.server.speed).ticks():
+                self.wfile.write(format_tick(*tick).encode())
+        except OSError:
+            pass
+
+
+def tick_source_from_environment():
+    # PRICING_QUOTE_SOURCE=file:<path>[@<speed>] replays a file, socket:<host>:<port> reads a feed
+    source = os.environ.get('PRICING_QUOTE_SOURCE', '')
+    if source.startswith('file:'):
+        path, _, speed = source[len('file:'):].partition('@')
+        return FileReplaySource(path, speed=float(speed) if speed else None)
+    if source.startswith('socket:'):
+        host, _, port = source[len('socket:'):].rpartition(':')
+        return SocketTickSource(host, int(port))
+    return None
+
+
+class QuoteBook:
+    # one row per ticker of fixed-size ring buffers: the last window prices for the rolling mean and the volumes of
+    # the last adv_days completed sessions for the ADV. Every statistic is updated in O(1) per tick from running
+    # sums, which are recomputed from their buffer each time it wraps so rounding errors cannot pile up.
+    # Sessions are UTC days; the EWMA variance is the one of the log returns per second between two ticks.
+    def __init__(self, window=100, adv_days=20, ewma_lambda=0.94, capacity=64, min_interval=1e-3):
+        self.window = window
+        self.adv_days = adv_days
+        self.ewma_lambda = ewma_lambda
+        self.min_interval = min_interval
+        self.index = dict()
+        self.tickers = list()
+        self.lock = threading.Lock()
+        self.nb_ticks_total = 0
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        self.prices = np.zeros((capacity, self.window))
+        self.price_positions = np.zeros(capacity, dtype=np.int64)
+        self.price_counts = np.zeros(capacity, dtype=np.int64)
+        self.price_sums = np.zeros(capacity)
+        self.daily_volumes = np.zeros((capacity, self.adv_days))
+        self.daily_positions = np.zeros(capacity, dtype=np.int64)
+        self.daily_counts = np.zeros(capacity, dtype=np.int64)
+        self.daily_sums = np.zeros(capacity)
+        self.last_price = np.full(capacity, np.nan)
+        self.last_timestamp = np.full(capacity, np.nan)
+        self.ewma_variance = np.full(capacity, np.nan)
+        self.session_day = np.full(capacity, -1, dtype=np.int64)
+        self.session_notional = np.zeros(capacity)
+        self.session_volume = np.zeros(capacity)
+        self.nb_ticks = np.zeros(capacity, dtype=np.int64)
+
+    def _grow(self):
+        capacity = self.prices.shape[0]
+        arrays = {name: value for name, value in vars(self).items()
+                  if isinstance(value, np.ndarray) and value.shape[0] == capacity}
+        self._allocate(2 * capacity)
+        for name, value in arrays.items():
+            getattr(self, name)[:capacity] = value
+
+    def __len__(self):
+        return len(self.tickers)
+
+    def __contains__(self, ticker):
+        return ticker in self.index
+
+    def _row(self, ticker):
+        row = self.index.get(ticker)
+        if row is None:
+            row = len(self.tickers)
+            if row == self.prices.shape[0]:
+                self._grow()
+            self.index[ticker] = row
+            self.tickers.append(ticker)
+        return row
+
+    def _push_daily_volume(self, row, volume):
+        position = self.daily_positions[row]
+        if self.daily_counts[row] == self.adv_days:
+            self.daily_sums[row] -= self.daily_volumes[row, position]
+        else:
+            self.daily_counts[row] += 1
+        self.daily_volumes[row, position] = volume
+        self.daily_sums[row] += volume
+        position = (position + 1) % self.adv_days
+        if position == 0:
+            self.daily_sums[row] = self.daily_volumes[row].sum()
+        self.daily_positions[row] = position
+
+    def seed_daily_volumes(self, ticker, volumes):
+        # completed sessions known beforehand, e.g. the Volume column of the stored historicals, oldest first
+        with self.lock:
+            row = self._row(ticker)
+            for volume in np.asarray(volumes, dtype=float)[-self.adv_days:].tolist():
+                self._push_daily_volume(row, volume)
+
+    def _ingest(self, ticker, timestamp, price, volume):
+        row = self._row(ticker)
+        day = int(timestamp // SECONDS_PER_DAY)
+        if self.session_day[row] != day:
+            if self.session_day[row] >= 0:
+                self._push_daily_volume(row, self.session_volume[row])
+            self.session_day[row] = day
+            self.session_notional[row] = 0.
+            self.session_volume[row] = 0.
+
+        position = self.price_positions[row]
+        if self.price_counts[row] == self.window:
+            self.price_sums[row] -= self.prices[row, position]
+        else:
+            self.price_counts[row] += 1
+        self.prices[row, position] = price
+        self.price_sums[row] += price
+        position = (position + 1) % self.window
+        if position == 0:
+            self.price_sums[row] = self.prices[row].sum()
+        self.price_positions[row] = position
+
+        last_price = self.last_price[row]
+        if last_price > 0 and price > 0:
+            log_return = math.log(price / last_price)
+            variance = log_return * log_return / max(timestamp - self.last_timestamp[row], self.min_interval)
+            previous = self.ewma_variance[row]
+            self.ewma_variance[row] = variance if previous != previous else \
+                self.ewma_lambda * previous + (1 - self.ewma_lambda) * variance
+
+        self.session_notional[row] += price * volume
+        self.session_volume[row] += volume
+        self.last_price[row] = price
+        self.last_timestamp[row] = timestamp
+        self.nb_ticks[row] += 1
+        self.nb_ticks_total += 1
+
+    def ingest(self, ticker, timestamp, price, volume=0.):
+        with self.lock:
+            self._ingest(ticker, float(timestamp), float(price), float(volume))
+
+    def ingest_many(self, tickers, timestamps, prices, volumes):
+        # columns of ticks, applied in order under a single acquisition of the lock
+        ticks = zip(np.asarray(tickers).astype(str).tolist(), np.asarray(timestamps, dtype=float).tolist(),
+                    np.asarray(prices, dtype=float).tolist(), np.asarray(volumes, dtype=float).tolist())
+        with self.lock:
+            for tick in ticks:
+                self._ingest(*tick)
+
+    def snapshot(self, tickers=None):
+        # one array per statistic, in the order of tickers (every ticker seen by default), nan for the unknown ones
+        with self.lock:
+            tickers = list(self.tickers) if tickers is None else [str(ticker) for ticker in tickers]
+            rows = np.array([self.index.get(ticker, -1) for ticker in tickers], dtype=np.int64)
+            known = rows >= 0
+            rows = rows[known]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                columns = {'last_price': self.last_price[rows],
+                           'timestamp': self.last_timestamp[rows],
+                           'rolling_mean': self.price_sums[rows] / self.price_counts[rows],
+                           'ewma_volatility': np.sqrt(self.ewma_variance[rows] * TRADING_SECONDS_PER_YEAR),
+                           'vwap': self.session_notional[rows] / self.session_volume[rows],
+                           'adv': np.where(self.daily_counts[rows] > 0,
+                                           self.daily_sums[rows] / self.daily_counts[rows], np.nan),
+                           'nb_ticks': self.nb_ticks[rows].astype(float)}
+        result = {'ticker': np.array(tickers, dtype=object)}
+        for column in SNAPSHOT_COLUMNS:
+            result[column] = np.full(len(tickers), np.nan)
+            result[column][known] = columns[column]
+        return result
+
+    def to_records(self, tickers=None):
+        snapshot = self.snapshot(tickers)
+        return [dict(ticker=ticker, **{column: None if snapshot[column][i] != snapshot[column][i]
+                                       else float(snapshot[column][i]) for column in SNAPSHOT_COLUMNS})
+                for i, ticker in enumerate(snapshot['ticker'])]
+
+    def quote(self, ticker):
+        # same signature as fetch_yahoo_quote, so a book can be given to IndexParser as its quote_fetcher
+        if ticker not in self.index:
+            raise KeyError('no tick received for %s' % ticker)
+        snapshot = self.snapshot([ticker])
+        return float(snapshot['last_price'][0]), float(snapshot['adv'][0])
+
+
+class QuoteStream:
+    # consumes a tick source into a book on a daemon thread, a tick the book cannot take is counted and skipped.
+    # When the source fails (the feed drops, refuses the connection), the error is logged and the source is read
+    # again after backoff seconds, doubled after each failure in a row up to max_backoff. The stream ends when the
+    # source is exhausted or stop() is called.
+    def __init__(self, source, book, backoff=0.5, max_backoff=30.):
+        self.source = source
+        self.book = book
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.nb_ticks = 0
+        self.nb_errors = 0
+        self.nb_failures = 0
+        self.last_error = None
+        self.last_tick_time = None
+        self.state = 'idle'
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.state = 'connecting'
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def run(self):
+        delay = self.backoff
+        while not self.stopped.is_set():
+            try:
+                for tick in self.source.ticks():
+                    self.state = 'streaming'
+                    delay = self.backoff
+                    try:
+                        self.book.ingest(*tick)
+                    except (TypeError, ValueError):
+                        self.nb_errors += 1
+                        continue
+                    self.nb_ticks += 1
+                    self.last_tick_time = time.time()
+                break
+            except Exception as e:
+                if self.stopped.is_set():
+                    break
+                self.nb_failures += 1
+                self.last_error = repr(e)
+                self.state = 'reconnecting'
+                # the traceback of a dropped or refused connection says nothing more than its error
+                logger.warning('quote stream failed: %r, reconnecting in %.1fs', e, delay,
+                               exc_info=not isinstance(e, OSError))
+                self.stopped.wait(delay)
+                delay = min(2 * delay, self.max_backoff)
+        self.state = 'stopped' if self.stopped.is_set() else 'ended'
+        logger.info('quote stream %s after %d ticks', self.state, self.nb_ticks)
+
+    def stop(self, timeout=None):
+        self.stopped.set()
+        self.source.close()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def status(self):
+        # last_tick_age is the number of seconds since the last tick was ingested, None before the first one
+        return {'state': self.state,
+                'nb_ticks': self.nb_ticks,
+                'nb_errors': self.nb_errors,
+                'nb_failures': self.nb_failures,
+                'last_error': self.last_error,
+                'last_tick_age': None if self.last_tick_time is None else time.time() - self.last_tick_time}
+
+
+if __name__ == '__main__':
+    import tempfile
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'ticks.csv')
+        with open(path, 'w') as f:
+            f.write('timestamp,ticker,price,volume\n')
+            for day in range(3):
+                for i in range(1000):
+                    ticker = ('AIR.PA', 'BNP.PA')[i % 2]
+                    f.write(format_tick(ticker, 1.5e9 + day * SECONDS_PER_DAY + 9 * 3600 + 20 * i,
+                                        100 * math.exp(0.0005 * rng.standard_normal() + 0.01 * day),
+                                        rng.integers(1, 500)))
+        server = ReplayServer(path).start()
+        book = QuoteBook(window=50)
+        stream = QuoteStream(SocketTickSource(*server.server_address), book).start()
+        stream.thread.join()
+        server.shutdown()
+        print('%d ticks, %d errors' % (stream.nb_ticks, stream.nb_errors))
+        for record in book.to_records():
+            print(record)
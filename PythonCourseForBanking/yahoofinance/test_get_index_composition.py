@@ -0,0 +1,187 @@
+import email.message
+import shutil
+import tempfile
+import unittest
+import urllib.error
+from unittest import mock
+
+from PythonCourseForBanking.yahoofinance import get_index_composition
+from PythonCourseForBanking.yahoofinance.get_index_composition import CompositionCache, IndexParser, download_quotes
+
+PAGE = b'''<html><body><table class="wikitable sortable">
+<tr><th>Ticker</th><th>Name</th><th>Sector</th></tr>
+<tr><td>AI.PA</td><td>Air Liquide</td><td>Basic Materials</td></tr>
+<tr><td>BNP.PA</td><td>BNP Paribas</td><td>Financials</td></tr>
+</table></body></html>'''
+
+
+class FakePage:
+    def __init__(self, content, etag=None, last_modified=None):
+        self.content = content
+        self.headers = email.message.Message()
+        if etag is not None:
+            self.headers['ETag'] = etag
+        if last_modified is not None:
+            self.headers['Last-Modified'] = last_modified
+
+    def read(self):
+        return self.content
+
+
+def not_modified(url):
+    return urllib.error.HTTPError(url, 304, 'Not Modified', email.message.Message(), None)
+
+
+class CompositionCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.cache = CompositionCache(self.directory, ttl=3600)
+        self.parser = IndexParser('CAC40', None, None, composition_cache=self.cache)
+        self.requests = list()
+
+    def urlopen(self, *responses):
+        responses = list(responses)
+
+        def urlopen(request):
+            self.requests.append(request)
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+        return mock.patch('urllib.request.urlopen', urlopen)
+
+    def expire(self):
+        entry = self.cache.get('CAC40')
+        with mock.patch('time.time', return_value=entry['fetched_at'] - 3601):
+            self.cache.put('CAC40', entry['sector_tickers'], entry['etag'], entry['last_modified'])
+
+    def test_first_scrape_stores_the_composition_and_its_validators(self):
+        with self.urlopen(FakePage(PAGE, etag='"v1"', last_modified='Mon, 01 Jan 2024 00:00:00 GMT')):
+            self.parser.scrape_index_list()
+        self.assertEqual(self.parser.sector_tickers, {'basic_materials': ['AI.PA'], 'financials': ['BNP.PA']})
+        entry = self.cache.get('CAC40')
+        self.assertEqual((entry['etag'], entry['last_modified']), ('"v1"', 'Mon, 01 Jan 2024 00:00:00 GMT'))
+        self.assertNotIn('If-none-match', self.requests[0].headers)
+
+    def test_fresh_entry_is_used_without_any_request(self):
+        with self.urlopen(FakePage(PAGE, etag='"v1"')):
+            self.parser.scrape_index_list()
+        with self.urlopen():
+            self.parser.scrape_index_list()
+        self.assertEqual(len(self.requests), 1)
+
+    def test_stale_entry_is_revalidated_with_its_validators(self):
+        with self.urlopen(FakePage(PAGE, etag='"v1"', last_modified='Mon, 01 Jan 2024 00:00:00 GMT')):
+            self.parser.scrape_index_list()
+        self.expire()
+        with self.urlopen(not_modified(self.parser.site)):
+            self.parser.scrape_index_list()
+        headers = self.requests[1].headers
+        self.assertEqual(headers['If-none-match'], '"v1"')
+        self.assertEqual(headers['If-modified-since'], 'Mon, 01 Jan 2024 00:00:00 GMT')
+
+    def test_not_modified_keeps_the_composition_and_makes_it_fresh_again(self):
+        with self.urlopen(FakePage(PAGE, etag='"v1"')):
+            self.parser.scrape_index_list()
+        self.expire()
+        self.parser.sector_tickers = dict()
+        with self.urlopen(not_modified(self.parser.site)):
+            self.parser.scrape_index_list()
+        self.assertEqual(self.parser.sector_tickers, {'basic_materials': ['AI.PA'], 'financials': ['BNP.PA']})
+        self.assertTrue(self.cache.is_fresh(self.cache.get('CAC40')))
+
+    def test_modified_page_replaces_the_composition(self):
+        with self.urlopen(FakePage(PAGE, etag='"v1"')):
+            self.parser.scrape_index_list()
+        self.expire()
+        with self.urlopen(FakePage(PAGE.replace(b'BNP.PA', b'GLE.PA'), etag='"v2"')):
+            self.parser.scrape_index_list()
+        self.assertEqual(self.parser.sector_tickers['financials'], ['GLE.PA'])
+        self.assertEqual(self.cache.get('CAC40')['etag'], '"v2"')
+
+    def test_force_revalidates_a_fresh_entry(self):
+        with self.urlopen(FakePage(PAGE, etag='"v1"')):
+            self.parser.scrape_index_list()
+        with self.urlopen(not_modified(self.parser.site)):
+            self.parser.scrape_index_list(force=True)
+        self.assertEqual(len(self.requests), 2)
+
+    def test_not_modified_without_a_cached_entry_is_an_error(self):
+        with self.urlopen(not_modified(self.parser.site)):
+            with self.assertRaises(urllib.error.HTTPError):
+                self.parser.scrape_index_list()
+
+    def test_other_http_errors_are_raised(self):
+        with self.urlopen(FakePage(PAGE, etag='"v1"')):
+            self.parser.scrape_index_list()
+        self.expire()
+        error = urllib.error.HTTPError(self.parser.site, 503, 'Unavailable', email.message.Message(), None)
+        with self.urlopen(error):
+            with self.assertRaises(urllib.error.HTTPError):
+                self.parser.scrape_index_list()
+
+
+class DownloadQuotesTest(unittest.TestCase):
+    def setUp(self):
+        sleep = mock.patch.object(get_index_composition.time, 'sleep')
+        self.sleep = sleep.start()
+        self.addCleanup(sleep.stop)
+
+    def flaky_fetcher(self, nb_failures):
+        calls = dict()
+
+        def fetch(ticker):
+            calls[ticker] = calls.get(ticker, 0) + 1
+            if calls[ticker] <= nb_failures.get(ticker, 0):
+                raise IOError('timeout on %s' % ticker)
+            return '1.5', 1000
+        fetch.calls = calls
+        return fetch
+
+    def test_every_result_is_passed_to_on_result(self):
+        results = list()
+        failures = download_quotes({'banks': ['BNP.PA', 'GLE.PA'], 'energy': ['TTE.PA']}, results.append,
+                                   quote_fetcher=self.flaky_fetcher({}))
+        self.assertEqual(failures, {})
+        self.assertEqual(sorted((data['ticker'], data['sector']) for data in results),
+                         [('BNP.PA', 'banks'), ('GLE.PA', 'banks'), ('TTE.PA', 'energy')])
+
+    def test_failing_ticker_is_retried_with_exponential_backoff(self):
+        fetch = self.flaky_fetcher({'BNP.PA': 2})
+        results = list()
+        failures = download_quotes({'banks': ['BNP.PA']}, results.append, quote_fetcher=fetch, max_retries=3,
+                                   backoff=0.5)
+        self.assertEqual(failures, {})
+        self.assertEqual(fetch.calls['BNP.PA'], 3)
+        self.assertEqual([call.args[0] for call in self.sleep.call_args_list], [0.5, 1.])
+
+    def test_ticker_failing_after_its_retries_is_reported_without_stopping_the_others(self):
+        fetch = self.flaky_fetcher({'BNP.PA': 10})
+        results = list()
+        failures = download_quotes({'banks': ['BNP.PA', 'GLE.PA']}, results.append, quote_fetcher=fetch,
+                                   max_retries=2, backoff=0.5)
+        self.assertEqual(list(failures), ['BNP.PA'])
+        self.assertIn('timeout on BNP.PA', failures['BNP.PA'])
+        self.assertEqual(fetch.calls['BNP.PA'], 3)
+        self.assertEqual([data['ticker'] for data in results], ['GLE.PA'])
+
+    def test_no_retry_when_max_retries_is_zero(self):
+        fetch = self.flaky_fetcher({'BNP.PA': 1})
+        failures = download_quotes({'banks': ['BNP.PA']}, lambda data: None, quote_fetcher=fetch, max_retries=0)
+        self.assertEqual(list(failures), ['BNP.PA'])
+        self.sleep.assert_not_called()
+
+    def test_download_data_keeps_the_composition_order_and_leaves_failures_out(self):
+        parser = IndexParser('CAC40', None, None, quote_fetcher=self.flaky_fetcher({'GLE.PA': 10}), max_retries=0,
+                             composition_cache=CompositionCache(tempfile.mkdtemp()))
+        self.addCleanup(shutil.rmtree, parser.composition_cache.directory)
+        parser.sector_tickers = {'banks': ['BNP.PA', 'GLE.PA', 'ACA.PA'], 'energy': ['TTE.PA']}
+        parser.download_data()
+        self.assertEqual(parser.result_df['ticker'].tolist(), ['BNP.PA', 'ACA.PA', 'TTE.PA'])
+        self.assertEqual(parser.result_df['price'].tolist(), [1.5, 1.5, 1.5])
+        self.assertEqual(list(parser.failures), ['GLE.PA'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import datetime
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from PythonCourseForBanking.yahoofinance.market_data_store import DataFrameFetcher, HistoricalFetcher, \
+    HistoricalPriceStore
+
+
+def make_historicals(dates, closes):
+    return pd.DataFrame({'Date': dates, 'Open': closes, 'High': closes, 'Low': closes, 'Close': closes,
+                         'Adj_Close': closes, 'Volume': 1000.})
+
+
+class RecordingFetcher(DataFrameFetcher):
+    def __init__(self, historicals):
+        DataFrameFetcher.__init__(self, historicals)
+        self.requested = list()
+
+    def fetch(self, ticker, start_date, end_date):
+        self.requested.append((start_date, end_date))
+        return DataFrameFetcher.fetch(self, ticker, start_date, end_date)
+
+
+class FailingFetcher(HistoricalFetcher):
+    def fetch(self, ticker, start_date, end_date):
+        raise IOError('source unavailable')
+
+
+class HistoricalPriceStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.historicals = {'X': make_historicals(['2024-01-02', '2024-01-03'], [10., 11.])}
+        self.fetcher = RecordingFetcher(self.historicals)
+        self.store = HistoricalPriceStore(self.directory, fetcher=self.fetcher, first_date=datetime.date(2024, 1, 1))
+
+    def test_first_refresh_fetches_from_the_first_date(self):
+        records = self.store.refresh('X', datetime.date(2024, 1, 3))
+        self.assertEqual(self.fetcher.requested, [(datetime.date(2024, 1, 1), datetime.date(2024, 1, 3))])
+        self.assertEqual(records['Close'].tolist(), [10., 11.])
+
+    def test_refresh_restarts_from_the_last_stored_date(self):
+        self.store.refresh('X', datetime.date(2024, 1, 3))
+        self.historicals['X'] = make_historicals(['2024-01-02', '2024-01-03', '2024-01-04'], [10., 11., 12.])
+        records = self.store.refresh('X', datetime.date(2024, 1, 4))
+        self.assertEqual(self.fetcher.requested[-1], (datetime.date(2024, 1, 3), datetime.date(2024, 1, 4)))
+        self.assertEqual(records['Date'].astype(str).tolist(), ['2024-01-02', '2024-01-03', '2024-01-04'])
+        self.assertEqual(records['Close'].tolist(), [10., 11., 12.])
+
+    def test_revised_last_bar_replaces_the_stored_one(self):
+        self.store.refresh('X', datetime.date(2024, 1, 3))
+        self.historicals['X'] = make_historicals(['2024-01-02', '2024-01-03'], [10., 11.5])
+        records = self.store.refresh('X', datetime.date(2024, 1, 4))
+        self.assertEqual(records['Close'].tolist(), [10., 11.5])
+
+    def test_day_the_source_did_not_have_yet_is_asked_again(self):
+        self.historicals['X'] = make_historicals(['2024-01-02'], [10.])
+        self.store.refresh('X', datetime.date(2024, 1, 3))
+        self.historicals['X'] = make_historicals(['2024-01-02', '2024-01-03'], [10., 11.])
+        records = self.store.refresh('X', datetime.date(2024, 1, 4))
+        self.assertEqual(records['Close'].tolist(), [10., 11.])
+
+    def test_refresh_up_to_date_does_not_fetch(self):
+        self.store.refresh('X', datetime.date(2024, 1, 3))
+        self.assertFalse(self.store.is_stale('X', datetime.date(2024, 1, 3)))
+        self.store.refresh('X', datetime.date(2024, 1, 3))
+        self.assertEqual(len(self.fetcher.requested), 1)
+
+    def test_failed_refresh_keeps_the_stored_records(self):
+        self.store.refresh('X', datetime.date(2024, 1, 3))
+        store = HistoricalPriceStore(self.directory, fetcher=FailingFetcher(), first_date=datetime.date(2024, 1, 1))
+        with self.assertRaises(IOError):
+            store.refresh('X', datetime.date(2024, 1, 4))
+        self.assertEqual(np.array(store.load('X'))['Close'].tolist(), [10., 11.])
+        self.assertTrue(store.is_stale('X', datetime.date(2024, 1, 4)))
+
+    def test_unknown_ticker_loads_no_record(self):
+        self.assertEqual(self.store.load('Y').size, 0)
+        self.assertTrue(self.store.is_stale('Y'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import socket
+import unittest
+from unittest import mock
+
+from PythonCourseForBanking.yahoofinance.quote_stream import QuoteBook, QuoteStream, SocketTickSource, TickSource
+
+TICKS = [('BNP.PA', 1.5e9 + i, 60. + i, 100.) for i in range(5)]
+
+
+class FlakySource(TickSource):
+    # fails nb_failures times, after yielding the first nb_before ticks each time, then yields every tick
+    def __init__(self, ticks, nb_failures, nb_before=0):
+        self._ticks = ticks
+        self.nb_failures = nb_failures
+        self.nb_before = nb_before
+        self.nb_calls = 0
+
+    def ticks(self):
+        self.nb_calls += 1
+        if self.nb_calls <= self.nb_failures:
+            for tick in self._ticks[:self.nb_before]:
+                yield tick
+            raise ConnectionResetError('feed dropped')
+        for tick in self._ticks:
+            yield tick
+
+
+def closed_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class QuoteStreamTest(unittest.TestCase):
+    def run_stream(self, stream):
+        with self.assertLogs('PythonCourseForBanking.yahoofinance.quote_stream', 'INFO') as logs:
+            stream.start().thread.join(10)
+        self.assertFalse(stream.thread.is_alive())
+        return logs
+
+    def test_source_is_read_again_after_a_failure(self):
+        stream = QuoteStream(FlakySource(TICKS, nb_failures=2), QuoteBook(), backoff=0.001)
+        logs = self.run_stream(stream)
+        self.assertEqual(stream.nb_ticks, 5)
+        self.assertEqual(stream.nb_failures, 2)
+        self.assertIn('feed dropped', stream.last_error)
+        self.assertEqual(sum('reconnecting' in line for line in logs.output), 2)
+        self.assertEqual(stream.state, 'ended')
+
+    def test_backoff_doubles_up_to_its_maximum_and_is_reset_by_a_tick(self):
+        stream = QuoteStream(FlakySource(TICKS, nb_failures=4), QuoteBook(), backoff=1., max_backoff=3.)
+        with mock.patch.object(stream.stopped, 'wait') as wait:
+            self.run_stream(stream)
+        self.assertEqual([call.args[0] for call in wait.call_args_list], [1., 2., 3., 3.])
+
+        stream = QuoteStream(FlakySource(TICKS, nb_failures=3, nb_before=1), QuoteBook(), backoff=1.)
+        with mock.patch.object(stream.stopped, 'wait') as wait:
+            self.run_stream(stream)
+        self.assertEqual([call.args[0] for call in wait.call_args_list], [1., 1., 1.])
+
+    def test_malformed_tick_is_counted_and_skipped(self):
+        stream = QuoteStream(FlakySource([('BNP.PA', 1.5e9, 'not a price', 1.)] + TICKS, 0), QuoteBook())
+        self.run_stream(stream)
+        self.assertEqual((stream.nb_ticks, stream.nb_errors, stream.nb_failures), (5, 1, 0))
+
+    def test_status_gives_the_age_of_the_last_tick(self):
+        stream = QuoteStream(FlakySource(TICKS, 0), QuoteBook())
+        self.assertIsNone(stream.status()['last_tick_age'])
+        self.run_stream(stream)
+        status = stream.status()
+        self.assertEqual((status['state'], status['nb_ticks']), ('ended', 5))
+        self.assertGreaterEqual(status['last_tick_age'], 0.)
+        self.assertLess(status['last_tick_age'], 10.)
+
+    def test_refused_connection_is_retried_until_stopped(self):
+        stream = QuoteStream(SocketTickSource('127.0.0.1', closed_port()), QuoteBook(), backoff=0.01)
+        with self.assertLogs('PythonCourseForBanking.yahoofinance.quote_stream', 'INFO'):
+            stream.start()
+            for _ in range(500):
+                if stream.nb_failures >= 2:
+                    break
+                stream.stopped.wait(0.01)
+            stream.stop(10)
+        self.assertFalse(stream.thread.is_alive())
+        self.assertGreaterEqual(stream.nb_failures, 2)
+        self.assertEqual(stream.status()['state'], 'stopped')
+
+
+if __name__ == '__main__':
+    unittest.main()